@@ -0,0 +1,503 @@
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from telemetry import REGISTRY, set_span_attributes
+from runtime.deadline import stage_timeout
+
+
+# A URL somewhere in the model's reply, which may wrap it in prose, quotes or a code block
+_url_in_text = re.compile(r"https?://[^\s`'\"<>]+", re.IGNORECASE)
+_template_param = re.compile(r"\{([^{}/]+)\}")
+# Characters allowed unencoded in a path segment (RFC 3986 pchar)
+_segment_safe = "-._~:@!$'()*+,;="
+# Lines that end the parameter block of an operationID file's minified context
+_context_sections = ("responses", "reqBody")
+_context_fields = ("desc", "sum")
+# Single-word lines inside a parameter's schema that aren't enum values
+_schema_words = {"schema", "items", "oneof", "anyof", "allof", "enum", "required", "nullable"}
+
+
+def normalize_name(name: str) -> str:
+    # Parameter names in the minified specs are lower case with everything but letters and digits stripped
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+class InvalidAPICall(ValueError):
+    pass
+
+
+class APICallFailed(Exception):
+    pass
+
+
+class APIParameter(NamedTuple):
+    name: str
+    location: str
+    required: bool = False
+    type: Optional[str] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    enum: FrozenSet[str] = frozenset()
+
+    def describe(self) -> str:
+        """Short description for an error message, e.g. 'pagesize (num, 1 to 50)'."""
+        details = [self.type] if self.type else []
+        if self.minimum is not None or self.maximum is not None:
+            low = f"{self.minimum:g}" if self.minimum is not None else "any"
+            high = f"{self.maximum:g}" if self.maximum is not None else "any"
+            details.append(f"{low} to {high}")
+        if self.enum:
+            details.append("one of " + ", ".join(sorted(self.enum)[:8]))
+        return f"{self.name} ({', '.join(details)})" if details else self.name
+
+    def check(self, value: str) -> Tuple[str, Optional[str]]:
+        """(value with safe fixes applied, error or None)"""
+        values = value.split(",") if self.type == "arr" else [value]
+        fixed = []
+        for item in values:
+            if self.type in ("num", "integer"):
+                try:
+                    number = int(item) if self.type == "integer" else float(item)
+                except ValueError:
+                    return value, f"{self.location} parameter {self.name} must be {'an integer' if self.type == 'integer' else 'a number'}, got {item!r}"
+                if (self.minimum is not None and number < self.minimum) or (self.maximum is not None and number > self.maximum):
+                    return value, f"{self.location} parameter {self.describe()} is out of range: {item}"
+            elif self.type == "bool":
+                if item.lower() not in ("true", "false"):
+                    return value, f"{self.location} parameter {self.name} must be true or false, got {item!r}"
+                item = item.lower()
+            else:
+                if (self.min_length is not None and len(item) < self.min_length) or (self.max_length is not None and len(item) > self.max_length):
+                    return value, f"{self.location} parameter {self.name} must be {self.min_length or 0} to {self.max_length or 'any'} characters long"
+            if self.enum and normalize_name(item) not in self.enum:
+                return value, f"{self.location} parameter {self.describe()} got {item!r}"
+            fixed.append(item)
+        return ",".join(fixed), None
+
+
+def parse_parameters(context: str) -> List[APIParameter]:
+    """
+    Path and query parameters listed in an operationID file's minified context
+
+    Each parameter is a run of lines such as "name pagesize", "in query", "required True",
+    "type num", "maximum 50", with "enum" followed by one allowed value per line. A parameter
+    starts when a name or location is seen a second time.
+    """
+    lines = context.split("\n")
+    if "params" not in lines:
+        return []
+    found: List[Dict[str, object]] = []
+    current: Optional[Dict[str, object]] = None
+    in_enum = False
+    for line in lines[lines.index("params") + 1:]:
+        key, _, value = line.partition(" ")
+        if line in _context_sections or (key in _context_fields and value):
+            break
+        if key in ("name", "in") and value:
+            if current is None or key in current:
+                current = {}
+                found.append(current)
+            current[key] = value
+            in_enum = False
+            continue
+        if current is None:
+            continue
+        if not value:
+            if line == "enum":
+                in_enum = True
+            elif in_enum and line not in _schema_words:
+                current.setdefault("enum", set()).add(normalize_name(line))
+            continue
+        in_enum = False
+        if key == "required":
+            current.setdefault("required", value == "True")
+        elif key == "type":
+            current.setdefault("type", value)
+        elif key in ("minimum", "maximum", "minlength", "maxlength"):
+            try:
+                current.setdefault(key, float(value))
+            except ValueError:
+                pass
+    parameters = []
+    for entry in found:
+        if entry.get("in") not in ("path", "query") or "name" not in entry:
+            continue
+        parameters.append(APIParameter(
+            name=entry["name"],
+            location=entry["in"],
+            required=entry.get("required", entry["in"] == "path"),
+            type=entry.get("type"),
+            minimum=entry.get("minimum"),
+            maximum=entry.get("maximum"),
+            min_length=int(entry["minlength"]) if "minlength" in entry else None,
+            max_length=int(entry["maxlength"]) if "maxlength" in entry else None,
+            enum=frozenset(entry.get("enum", ())),
+        ))
+    return parameters
+
+
+class OperationValidator:
+
+    """Checks and repairs the URL the API agent generated for one operationID, without asking the model again"""
+
+    def __init__(self, server_url: str, context: str = ""):
+        """
+        Built from an operationID file's server_url, whose path may hold {param} placeholders, and
+        the parameters listed in its minified context. validate() rejects a URL on the wrong host,
+        with a path that doesn't fit the template, an unfilled placeholder, a missing required query
+        parameter, or a value of the wrong type, range, length or enum. Safe fixes are made on the
+        way: the URL is cut out of surrounding prose, the scheme, host and literal path segments
+        take the spec's casing, values are percent-encoded, booleans are lower-cased and stray
+        slashes dropped. Query parameters the spec doesn't list are kept, since the minified specs
+        may leave some out.
+
+        Args:
+            server_url: metadata.server_url of an operationID file, e.g. https://api.weather.gov/zones/{type}
+            context: the file's minified spec text
+        """
+        self.server_url = server_url
+        parts = urlsplit(server_url)
+        self.scheme = parts.scheme.lower()
+        self.netloc = parts.netloc.lower()
+        self.path = parts.path.rstrip("/") or "/"
+        # Alternating literal path text and placeholder names
+        self._pieces = _template_param.split(self.path)
+        self.path_params: List[str] = self._pieces[1::2]
+        pattern = "".join(re.escape(piece) if i % 2 == 0 else f"(?P<p{i // 2}>[^/]+)" for i, piece in enumerate(self._pieces))
+        self._path_pattern = re.compile(pattern + "/?", re.IGNORECASE)
+        parameters = parse_parameters(context)
+        self._path_types = {normalize_name(p.name): p for p in parameters if p.location == "path"}
+        self.query_params = {normalize_name(p.name): p for p in parameters if p.location == "query"}
+
+    @staticmethod
+    def extract_url(text: str) -> str:
+        """The first URL in a model reply, without trailing punctuation."""
+        return OperationValidator._find_url(text)[0]
+
+    @staticmethod
+    def _find_url(text: str) -> Tuple[str, List[str]]:
+        # A URL stops at the first space, so one followed by more text on its line may have been cut short
+        # ("/stations/K NYC"). A reply that is only that line gets its spaces encoded; anything else is refused.
+        text = (text or "").strip()
+        match = _url_in_text.search(text)
+        if match is None:
+            raise InvalidAPICall("the reply contains no URL")
+        line_end = text.find("\n", match.end())
+        rest = text[match.end():] if line_end < 0 else text[match.end():line_end]
+        if not rest.strip("`'\"> \t"):
+            url = match.group(0).rstrip(".,;:)]}")
+            return url, ["extracted"] if url != text else []
+        line = text.strip("`'\"<>")
+        if line_end < 0 and _url_in_text.match(line):
+            return re.sub(r"\s+", "%20", line).rstrip(".,;:)]}"), ["encoding"]
+        raise InvalidAPICall("reply with only the URL, with any spaces in it percent-encoded")
+
+    def validate(self, reply: str) -> Tuple[str, List[str]]:
+        """
+        Check the URL in a model reply against the operation, fixing what can be fixed safely
+
+        Returns: the URL to call and the names of the fixes made
+        Raises: InvalidAPICall whose message lists everything still wrong, worded for re-prompting
+        """
+        url, fixes = self._find_url(reply)
+        parts = urlsplit(url)
+        if parts.scheme.lower() != self.scheme or parts.netloc.lower() != self.netloc:
+            raise InvalidAPICall(f"the URL must start with {self.scheme}://{self.netloc}")
+        if parts.scheme != self.scheme or parts.netloc != self.netloc:
+            fixes.append("host_case")
+        path = re.sub(r"//+", "/", parts.path)
+        match = self._path_pattern.fullmatch(path)
+        if match is None:
+            raise InvalidAPICall(f"the path must be {self.path}")
+        if path != parts.path or path.endswith("/") and len(path) > 1:
+            fixes.append("slashes")
+
+        errors = []
+        rebuilt = []
+        for i, piece in enumerate(self._pieces):
+            if i % 2 == 0:
+                rebuilt.append(piece)
+                continue
+            name = piece
+            value = unquote(match.group(f"p{i // 2}"))
+            if "{" in value or "}" in value:
+                errors.append(f"path parameter {name} was not filled in")
+            else:
+                parameter = self._path_types.get(normalize_name(name))
+                if parameter is not None:
+                    value, error = parameter.check(value)
+                    if error:
+                        errors.append(error)
+            rebuilt.append(quote(value, safe=_segment_safe))
+        fixed_path = "".join(rebuilt)
+        if fixed_path.lower() != path.rstrip("/").lower():
+            fixes.append("encoding")
+        elif fixed_path != path.rstrip("/"):
+            fixes.append("path_case")
+
+        query = []
+        given = set()
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            parameter = self.query_params.get(normalize_name(key))
+            if parameter is not None:
+                given.add(normalize_name(key))
+                checked, error = parameter.check(value)
+                if error:
+                    errors.append(error)
+                elif checked != value:
+                    fixes.append("value_case")
+                    value = checked
+            query.append((key, value))
+        for name, parameter in self.query_params.items():
+            if parameter.required and name not in given:
+                errors.append(f"missing required query parameter {parameter.describe()}")
+        if errors:
+            raise InvalidAPICall("; ".join(errors))
+        fixed_query = urlencode(query, quote_via=quote)
+        if fixed_query != parts.query and "value_case" not in fixes:
+            fixes.append("encoding")
+        return urlunsplit((self.scheme, self.netloc, fixed_path, fixed_query, "")), sorted(set(fixes))
+
+
+class ValidationStats:
+
+    """How often generated API calls pass, get fixed locally or need the model again, and the completion time saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._reprompted = 0
+        # Mean create-function completion time, what a re-prompt would have cost
+        self._completion_seconds = 0.0
+        self._completions = 0
+
+        self._outcomes = REGISTRY.counter("shelby_api_validation_total", "Generated API calls by validation outcome", ["outcome"])
+        self._fixes = REGISTRY.counter("shelby_api_validation_fixes_total", "Safe fixes applied locally to generated API calls", ["fix"])
+        self._reprompts = REGISTRY.counter("shelby_api_reprompts_total", "Completions re-requested because the generated call was invalid")
+        self._saved = REGISTRY.counter("shelby_api_reprompt_seconds_saved_total", "Estimated completion time saved by fixing generated calls locally instead of re-prompting")
+        REGISTRY.gauge("shelby_api_reprompt_rate", "Share of generated API calls that needed at least one re-prompt").set_function(self.reprompt_rate)
+
+    def completion(self, seconds: float) -> None:
+        with self._lock:
+            self._completions += 1
+            self._completion_seconds += (seconds - self._completion_seconds) / self._completions
+
+    def reprompt(self) -> None:
+        self._reprompts.inc()
+
+    def record(self, outcome: str, fixes: List[str], reprompts: int) -> None:
+        """outcome is valid, fixed or rejected."""
+        with self._lock:
+            self._calls += 1
+            self._reprompted += 1 if reprompts else 0
+            saved = self._completion_seconds if outcome == "fixed" else 0.0
+        self._outcomes.labels(outcome=outcome).inc()
+        for fix in fixes:
+            self._fixes.labels(fix=fix).inc()
+        if saved:
+            self._saved.inc(saved)
+
+    def reprompt_rate(self) -> float:
+        with self._lock:
+            return self._reprompted / self._calls if self._calls else 0.0
+
+
+class APIResponse(NamedTuple):
+    url: str
+    status: int
+    content_type: str
+    text: str
+    seconds: float
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+
+class APIExecutor:
+
+    """Runs the API agent's generated HTTP calls through one pooled aiohttp session and briefly caches GET responses"""
+
+    # Safe to replay from cache: no side effects
+    CACHEABLE_METHODS = ("GET", "HEAD")
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_connections_per_host: int = 5,
+        timeout_seconds: float = 10.0,
+        connect_timeout_seconds: float = 3.0,
+        cache_ttl_seconds: float = 30.0,
+        cache_size: int = 256,
+        max_response_bytes: int = 1_000_000,
+        server_override: str = "",
+    ):
+        """
+        The session lives on an event loop in a daemon thread of its own, started on first use, so
+        blocking agent threads (fetch_blocking) and any event loop (fetch) share its connection pool.
+        Each request's timeout is the smaller of timeout_seconds and what is left of the query
+        deadline. Successful GET and HEAD responses are reused for cache_ttl_seconds; other methods
+        are never cached.
+
+        Args:
+            max_connections: open connections across all hosts
+            max_connections_per_host: open connections to any one host
+            timeout_seconds: longest a request may take, body included
+            connect_timeout_seconds: longest to wait for a connection
+            cache_ttl_seconds: age after which a cached response is fetched again, 0 disables caching
+            cache_size: responses kept
+            max_response_bytes: response bodies are cut to this many bytes
+            server_override: scheme and host (e.g. http://127.0.0.1:8080) to send every request to
+                instead of its own, for running against a local mock server
+        """
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout_seconds = timeout_seconds
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_size = cache_size
+        self.max_response_bytes = max_response_bytes
+        self.server_override = server_override.rstrip("/")
+        # (method, url) -> (stored_at, response)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, APIResponse]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._start_lock = threading.Lock()
+
+        self._calls = REGISTRY.counter("shelby_api_calls_total", "Generated API calls by outcome", ["outcome"])
+        self._latency = REGISTRY.histogram("shelby_api_call_seconds", "Generated API call latency, cache hits excluded")
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                started = threading.Event()
+                loop = asyncio.new_event_loop()
+
+                async def open_session():
+                    self._session = aiohttp.ClientSession(
+                        connector=aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host, ttl_dns_cache=300),
+                        timeout=aiohttp.ClientTimeout(total=self.timeout_seconds, connect=self.connect_timeout_seconds),
+                    )
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.run_until_complete(open_session())
+                    started.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="api-executor", daemon=True).start()
+                started.wait()
+                self._loop = loop
+        return self._loop
+
+    def _target(self, url: str) -> str:
+        if not self.server_override:
+            return url
+        override = urlsplit(self.server_override)
+        parts = urlsplit(url)
+        return urlunsplit((override.scheme, override.netloc, parts.path, parts.query, parts.fragment))
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[APIResponse]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            stored_at, response = entry
+            if time.monotonic() - stored_at > self.cache_ttl_seconds:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+        return response._replace(cached=True, seconds=0.0)
+
+    def _store(self, key: Tuple[str, str], response: APIResponse) -> None:
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (time.monotonic(), response)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def _request(self, method: str, url: str, headers: Optional[Dict[str, str]], timeout: Optional[float]) -> APIResponse:
+        start = time.perf_counter()
+        request_timeout = aiohttp.ClientTimeout(total=timeout, connect=self.connect_timeout_seconds)
+        async with self._session.request(method, self._target(url), headers=headers, timeout=request_timeout, allow_redirects=True) as response:
+            body = await response.content.read(self.max_response_bytes)
+            return APIResponse(
+                url=url,
+                status=response.status,
+                content_type=response.content_type,
+                text=body.decode(response.charset or "utf-8", errors="replace"),
+                seconds=time.perf_counter() - start,
+            )
+
+    def _submit(self, method: str, url: str, headers: Optional[Dict[str, str]]):
+        method = method.upper()
+        key = (method, url)
+        cacheable = method in self.CACHEABLE_METHODS and self.cache_ttl_seconds > 0 and not headers
+        if cacheable:
+            cached = self._cached(key)
+            if cached is not None:
+                self._calls.labels(outcome="cached").inc()
+                return cached, None, key
+        # The deadline lives in the caller's context, so the timeout is worked out before crossing threads
+        timeout = stage_timeout(self.timeout_seconds)
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, headers, timeout), self._start())
+        return None, future, key if cacheable else None
+
+    def _finish(self, response: Optional[APIResponse], error: Optional[BaseException], key) -> APIResponse:
+        if error is not None:
+            outcome = "timeout" if isinstance(error, asyncio.TimeoutError) else "error"
+            self._calls.labels(outcome=outcome).inc()
+            raise APICallFailed(f"{type(error).__name__}: {error or 'timed out'}") from error
+        self._latency.observe(response.seconds)
+        self._calls.labels(outcome="ok" if response.ok else "http_error").inc()
+        if key is not None and response.ok:
+            self._store(key, response)
+        set_span_attributes(status=response.status, cached=False)
+        return response
+
+    def fetch_blocking(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> APIResponse:
+        """
+        Send a request from a thread that isn't running the executor's loop
+
+        Raises: APICallFailed when no response came back (connection error or timeout)
+        """
+        cached, future, key = self._submit(method, url, headers)
+        if cached is not None:
+            set_span_attributes(status=cached.status, cached=True)
+            return cached
+        try:
+            response = future.result()
+        except Exception as e:
+            return self._finish(None, e, key)
+        return self._finish(response, None, key)
+
+    async def fetch(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> APIResponse:
+        """fetch_blocking for coroutines on any event loop."""
+        cached, future, key = self._submit(method, url, headers)
+        if cached is not None:
+            set_span_attributes(status=cached.status, cached=True)
+            return cached
+        try:
+            response = await asyncio.wrap_future(future)
+        except Exception as e:
+            return self._finish(None, e, key)
+        return self._finish(response, None, key)
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._session = None
@@ -1,32 +1,162 @@
 import os
+import copy
 import json
 import openai
 import logging
 import traceback
+import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from logger import setup_logger
+import contextvars
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+from logger import setup_logger, use_worker_log_files
 import pinecone
 from dotenv import load_dotenv
 import tiktoken
 import re
 from configuration.shelby_agent_config import AppConfig
-from langchain.embeddings import OpenAIEmbeddings
 import yaml
 from pinecone_text.sparse import BM25Encoder
+from agents.context_compression import compress_documents
+from agents.model_cascade import ModelCascade
+from agents.citations import CitationResolver
+from agents.api_calls import OperationValidator, ValidationStats, APIExecutor, InvalidAPICall, APICallFailed
+from vectorstore import LocalIndex, IVFIndex, RetrievalCache, VersionStamps, ContentStore, TokenCountCache, counts_from_metadata, dedupe_documents, NearDuplicateIndex
+from telemetry import tracer, traced, set_span_attributes, TrafficRecorder
+from runtime import OpenAIScheduler, split_rate_limits, SingleFlight, normalize_query, DeadlineExceeded, deadline_scope, current_deadline, stage_timeout, Hedger, CircuitBreaker
+from runtime import AgentProcessPool, resolve_worker_count, AnswerCache, WarmupBudget, frequent_questions, Priority, request_priority
+from runtime.openai_scheduler import RETRYABLE_ERRORS
+
+# Read-only assets are loaded once per process and shared by every agent in it.
+# preload_shared_assets loads them before worker processes are forked so the workers share the pages too.
+
+@lru_cache(maxsize=None)
+def load_local_index(path, backend='local', n_probe=8, rerank_factor=4):
+    index = LocalIndex.load(path, mmap=True)
+    if backend == 'local_ivf':
+        index = IVFIndex(index, n_probe=n_probe, rerank_factor=rerank_factor).load(path)
+    return index
+
+# Keypoint guide and operationID files of every API under API_spec_path, operationIDs keyed by their number
+@lru_cache(maxsize=None)
+def load_API_specs(API_spec_path):
+    specs = []
+    for entry in os.scandir(API_spec_path):
+        if entry.is_dir():
+            with open(os.path.join(entry.path, 'LLM_OAS_keypoint_guide_file.txt'), 'r') as stream:
+                keypoint = yaml.safe_load(stream)
+            operationIDs = {}
+            directory_path = os.path.join(entry.path, 'operationIDs')
+            for filename in os.listdir(directory_path):
+                number = filename.rsplit('-', 1)[-1][:-len('.json')]
+                if filename.endswith('.json') and number.isdigit():
+                    operationIDs[int(number)] = os.path.join(directory_path, filename)
+            specs.append((entry.name, keypoint, operationIDs))
+    return specs
+
+@lru_cache(maxsize=None)
+def parse_prompt_template(path):
+    with open(path, 'r') as stream:
+        return yaml.safe_load(stream)
+
+# Prompt templates are parsed once per process; every caller fills in its own copy
+def load_prompt_template(prompt_template_path, name):
+    return copy.deepcopy(parse_prompt_template(os.path.join(prompt_template_path, name)))
+
+@lru_cache(maxsize=None)
+def load_content_store(path):
+    return ContentStore(path, readonly=True)
+
+@lru_cache(maxsize=None)
+def load_operationID_file(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+@lru_cache(maxsize=None)
+def load_operation_validator(server_url, context):
+    return OperationValidator(server_url, context)
+
+def preload_shared_assets(agent_config):
+    tiktoken.encoding_for_model(agent_config.tiktoken_encoding_model)
+    # Loads the NLTK stopwords and tokenizer the BM25 encoder uses
+    BM25Encoder()
+    if agent_config.vectorstore_backend in ('local', 'local_ivf'):
+        load_local_index(agent_config.local_vectorstore_path, agent_config.vectorstore_backend, agent_config.ivf_n_probe, agent_config.ivf_rerank_factor)
+    if agent_config.vectorstore_fallback_path:
+        load_local_index(agent_config.vectorstore_fallback_path)
+    if os.path.isdir(agent_config.prompt_template_path):
+        for name in os.listdir(agent_config.prompt_template_path):
+            if name.endswith('.yaml'):
+                parse_prompt_template(os.path.join(agent_config.prompt_template_path, name))
+    if os.path.isdir(agent_config.API_spec_path):
+        for _, _, operationIDs in load_API_specs(agent_config.API_spec_path):
+            for path in operationIDs.values():
+                operationID_file = load_operationID_file(path)
+                load_operation_validator(operationID_file['metadata']['server_url'], operationID_file['context'])
+
+# Fan-out merges matches from several namespaces. Each namespace's BM25 parameters are fitted on its own documents,
+# so hybrid scores don't share a scale: they are min-max normalized per namespace and scaled by its rank weight,
+# keeping the original as raw_score. Matches are copied first since retrieval cache entries share their token counts.
+def weigh_namespace_matches(documents, namespace, weight):
+    documents = [copy.deepcopy(doc) for doc in documents]
+    low = min((doc['score'] for doc in documents), default=0.0)
+    high = max((doc['score'] for doc in documents), default=0.0)
+    for doc in documents:
+        doc['raw_score'] = doc['score']
+        doc['score'] = ((doc['score'] - low) / (high - low) if high > low else 1.0) * weight
+        doc['topic'] = namespace
+    return documents
+
+# What the bots send queries to: an agent in this process, or a pool of forked agent workers when AGENT_PROCESSES is set.
+# Call before starting any threads.
+def create_query_runner(agent_config=None, worker_init=None):
+    agent_config = agent_config or AppConfig()
+    workers = resolve_worker_count(agent_config.agent_processes)
+    if not workers:
+        return ShelbyAgent()
+
+    def init_worker(index):
+        use_worker_log_files(index)
+        if worker_init is not None:
+            worker_init(index)
+
+    return AgentProcessPool(
+        partial(ShelbyAgent, processes=workers),
+        workers,
+        preload=lambda: preload_shared_assets(agent_config),
+        worker_init=init_worker,
+        coalesce=agent_config.coalesce_queries
+    ).start()
 
 class ShelbyAgent:
-    def __init__(self):
+    # processes: agents sharing the OpenAI quota, one per worker process of an AgentProcessPool
+    def __init__(self, processes=1):
         load_dotenv()
         openai.api_key = os.getenv("OPENAI_API_KEY")
         self.logger = setup_logger('ShelbyAgent', 'ShelbyAgent.log', level=logging.DEBUG)
         self.agent_config = AppConfig() 
-        self.action_agent = self.ActionAgent(self.logger, self.agent_config)
-        self.docs_agent = self.DocsAgent(self.logger, self.agent_config)
-        self.API_agent = self.APIAgent(self.logger, self.agent_config)
+        # Every agent in the process shares this scheduler; worker processes each get an equal share of the quota,
+        # so together they stay within it (a 429 still only slows the worker that got it)
+        rate_limits = split_rate_limits(self.agent_config.openai_rate_limits, processes)
+        self.openai_scheduler = OpenAIScheduler(rate_limits, self.agent_config.openai_max_retries)
+        self.action_agent = self.ActionAgent(self.logger, self.agent_config, self.openai_scheduler)
+        self.docs_agent = self.DocsAgent(self.logger, self.agent_config, self.openai_scheduler)
+        self.API_agent = self.APIAgent(self.logger, self.agent_config, self.openai_scheduler)
+        self.query_flight = SingleFlight('run_query')
+        # Opt-in record of every query for replay_traffic.py
+        self.traffic_recorder = None
+        if self.agent_config.traffic_record_path:
+            self.traffic_recorder = TrafficRecorder(self.agent_config.traffic_record_path)
+            tracer.add_listener(self.traffic_recorder.on_span)
+        self.answer_cache = None
+        if self.agent_config.answer_cache_ttl_seconds > 0:
+            self.answer_cache = AnswerCache(self.agent_config.answer_cache_size, self.agent_config.answer_cache_ttl_seconds)
 
    
-    def query_thread(self, query):
+    @traced('query_thread')
+    def query_thread(self, query, topic=None):
+        requested_topic = topic
         try:
             # workflow = self.action_agent.action_decision(query)
             
@@ -34,44 +164,117 @@ class ShelbyAgent:
             match workflow:
                 # If workflow is 1 run docs agent
                 case 1:
-                    if len(self.agent_config.vectorstore_namespaces) == 1:
+                    if topic is not None:
+                        # Caller already chose the namespace
+                        self.logger.debug("topic given: %s", topic)
+                    elif len(self.agent_config.vectorstore_namespaces) == 1:
                         topic = next(iter(self.agent_config.vectorstore_namespaces))
-                    else: 
+                    else:
                         topic = self.action_agent.topic_decision(query)
+                    set_span_attributes(topic=topic)
                     response= self.docs_agent.run_docs_agent(query, topic)
+                    if self.answer_cache is not None and not response.get('degraded'):
+                        # A fanned-out answer drew on several namespaces, so re-ingesting any of them makes it stale
+                        searched = self.agent_config.vectorstore_namespaces if self.docs_agent.fans_out(topic) else [topic]
+                        sources = [(name, self.docs_agent.namespace_version(self.docs_agent.local_index, name)) for name in searched]
+                        self.answer_cache.put((normalize_query(query), requested_topic), sources, response)
                 # If workflow is 2 run function agent
                 case 2:
                     response= self.API_agent.run_API_agent(query)
+                    if response is None:
+                        # No API call could answer it; the docs may
+                        response= self.docs_agent.run_docs_agent(query, topic)
                 # Else just run the docs agent for now
                 case _:
-                    print("Workflow is something else")
+                    self.logger.warning("unknown workflow %s", workflow)
 
             return response
         except Exception as e:
             raise e
      
-    async def run_query(self, query):
+    # topic skips routing when the caller already knows the namespace
+    async def run_query(self, query, topic=None):
         try:
-            with ThreadPoolExecutor() as executor:
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(executor, self.query_thread, query)
-                return response
+            with tracer.span('run_query', query=query, topic_given=topic is not None):
+                if self.answer_cache is not None:
+                    cached = self.answer_cache.get((normalize_query(query), topic), lambda namespace: self.docs_agent.namespace_version(self.docs_agent.local_index, namespace))
+                    if cached is not None:
+                        set_span_attributes(answer_cached=True)
+                        return cached
+                if not self.agent_config.coalesce_queries:
+                    return await self.run_query_thread(query, topic)
+                # Identical questions asked while one is in flight wait for its answer instead of rerunning it
+                key = (normalize_query(query), topic)
+                return await self.query_flight.do(key, lambda: self.run_query_thread(query, topic))
         except Exception as e:
             tb = traceback.format_exc()
             self.logger.error(f"An error occurred: {str(e)}. Traceback: {tb}")
             raise e
 
+    async def run_query_thread(self, query, topic=None):
+        with deadline_scope(self.agent_config.query_deadline_seconds), ThreadPoolExecutor() as executor:
+            loop = asyncio.get_event_loop()
+            # Carry the caller's context (request priority, tracing, deadline) into the worker thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(executor, context.run, self.query_thread, query, topic)
+
+    # Loads shared assets and opens the vectorstore and OpenAI connections ahead of the first query
+    def warm_up_clients(self):
+        try:
+            preload_shared_assets(self.agent_config)
+            index = self.docs_agent.get_vectorstore_index()
+            index.describe_index_stats()
+            if self.agent_config.fanout_namespaces > 0 and len(self.agent_config.vectorstore_namespaces) > 1:
+                self.docs_agent.get_namespace_embeddings()
+        except Exception as e:
+            self.logger.warning("could not warm up clients: %s", e)
+
+    # Fills the caches before the bot takes queries: answers the most frequent past questions
+    # until the time or token budget runs out. token_share splits the token budget between agent workers.
+    async def warm_up(self, questions=None, max_seconds=None, max_tokens=None, token_share=1.0):
+        agent_config = self.agent_config
+        max_seconds = agent_config.warmup_max_seconds if max_seconds is None else max_seconds
+        max_tokens = int((agent_config.warmup_max_tokens if max_tokens is None else max_tokens) * token_share)
+        budget = WarmupBudget(max_seconds, max_tokens, self.openai_scheduler.tokens_used)
+        if questions is None:
+            questions = frequent_questions(agent_config.warmup_questions_path or agent_config.traffic_record_path, agent_config.warmup_max_questions)
+        summary = {"questions": len(questions), "answered": 0, "failed": 0, "skipped": 0, "stopped": None}
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(agent_config.query_workers)
+
+        async def one(question):
+            async with semaphore:
+                reason = budget.exhausted()
+                if reason is not None:
+                    summary["skipped"] += 1
+                    summary["stopped"] = reason
+                    return
+                try:
+                    # Queries still running when the budget ends answer with what they have
+                    with deadline_scope(budget.remaining_seconds()):
+                        await self.run_query(question)
+                    summary["answered"] += 1
+                except Exception as e:
+                    self.logger.warning("warm-up query failed: %s", e)
+                    summary["failed"] += 1
+
+        with tracer.span('warm_up'), request_priority(Priority.BACKGROUND):
+            await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, self.warm_up_clients)
+            await asyncio.gather(*(one(question) for question in questions))
+        summary.update(seconds=time.perf_counter() - start, tokens=budget.tokens_spent())
+        self.logger.info("warm-up: %s", summary)
+        return summary
+
     class ActionAgent:
-        def __init__(self, logger, agent_config):
+        def __init__(self, logger, agent_config, openai_scheduler):
             self.logger = logger
             self.agent_config = agent_config
+            self.openai_scheduler = openai_scheduler
     
         # Generates multi-line text string with complete prompt
         def action_prompt_template(self, query):
             try:
-                with open(os.path.join(self.agent_config.prompt_template_path, 'action_agent_action_prompt_template.yaml'), 'r') as stream:
-                    # Load the YAML data and print the result
-                    prompt_template = yaml.safe_load(stream)
+                prompt_template = load_prompt_template(self.agent_config.prompt_template_path, 'action_agent_action_prompt_template.yaml')
 
                 # Loop over the list of dictionaries in data['prompt_template']
                 for role in prompt_template:
@@ -91,7 +294,7 @@ class ShelbyAgent:
                 logit_bias_weight = 100
                 logit_bias = {str(k): logit_bias_weight for k in range(15, 15 + len(actions) + 1)}
 
-                response = openai.ChatCompletion.create(
+                response = self.openai_scheduler.chat_completion(
                     model=self.agent_config.action_llm_model,
                     messages=prompt,
                     max_tokens=1,
@@ -110,9 +313,7 @@ class ShelbyAgent:
         
         def topic_prompt_template(self, query):
             try:
-                with open(os.path.join(self.agent_config.prompt_template_path, 'action_agent_topic_prompt_template.yaml'), 'r') as stream:
-                    # Load the YAML data and print the result
-                    prompt_template = yaml.safe_load(stream)
+                prompt_template = load_prompt_template(self.agent_config.prompt_template_path, 'action_agent_topic_prompt_template.yaml')
 
                # Create a list of formatted strings, each with the format "index. key: value"
                 content_strs = [f"{index + 1}. {key}: {value}" for index, (key, value) in enumerate(self.agent_config.vectorstore_namespaces.items())]
@@ -141,12 +342,14 @@ class ShelbyAgent:
                 logit_bias_weight = 100
                 logit_bias = {str(k): logit_bias_weight for k in range(15, 15 + len(self.agent_config.vectorstore_namespaces) + 1)}
 
-                response = openai.ChatCompletion.create(
+                response = self.openai_scheduler.chat_completion(
                     model=self.agent_config.action_llm_model,
                     messages=prompt,
                     max_tokens=1,
                     logit_bias=logit_bias
                 )
+                usage = response.get('usage', {})
+                set_span_attributes(prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'))
                 topic_key = int(response['choices'][0]['message']['content'])
                 if topic_key == 0:
                     return 0
@@ -157,25 +360,110 @@ class ShelbyAgent:
                 self.logger.error(f"An error occurred in action_prompt_llm: {str(e)}")
                 raise e
             
+        @traced('topic_decision')
         def topic_decision(self, query):
             prompt_template = self.topic_prompt_template(query)
             topic = self.topic_prompt_llm(prompt_template)
             return topic 
 
     class DocsAgent:
-        def __init__(self, logger, agent_config):
+        def __init__(self, logger, agent_config, openai_scheduler):
             self.logger = logger
             self.agent_config = agent_config
+            self.openai_scheduler = openai_scheduler
+            self.local_index = None
+            self.fallback_index = None
+            self.namespace_embeddings = None
+            self.retrieval_cache = None
+            if agent_config.retrieval_cache:
+                self.retrieval_cache = RetrievalCache(
+                    lsh_bits=agent_config.retrieval_cache_lsh_bits,
+                    min_similarity=agent_config.retrieval_cache_min_similarity,
+                    max_bytes=int(agent_config.retrieval_cache_max_mb * 1024 * 1024),
+                    ttl_seconds=agent_config.retrieval_cache_ttl_seconds
+                )
+            self.version_stamps = VersionStamps(agent_config.vectorstore_versions_path)
+            self.token_counts = TokenCountCache()
+            self.fanout_executor = ThreadPoolExecutor(thread_name_prefix='fanout')
+            # Embedding only trips on upstream trouble; a rejected input says nothing about OpenAI's health
+            failure_types = {'embedding': RETRYABLE_ERRORS, 'vectorstore': (Exception,)}
+            self.breakers = {
+                dependency: CircuitBreaker(
+                    dependency,
+                    failure_threshold=agent_config.breaker_failure_threshold,
+                    window=agent_config.breaker_window,
+                    min_calls=agent_config.breaker_min_calls,
+                    reset_seconds=agent_config.breaker_reset_seconds,
+                    failure_types=failure_types[dependency]
+                )
+                for dependency in failure_types
+            }
+            self.hedgers = {}
+            if agent_config.hedge_requests:
+                self.hedgers = {
+                    dependency: Hedger(dependency, percentile=agent_config.hedge_percentile, max_hedge_ratio=agent_config.hedge_max_ratio)
+                    for dependency in failure_types
+                }
+            if agent_config.dedupe_threshold > 0:
+                # Works out the LSH band split now rather than on the first query
+                NearDuplicateIndex(agent_config.dedupe_threshold, agent_config.dedupe_shingle_size)
+            self.cascade = None
+            if agent_config.docs_cascade:
+                self.cascade = ModelCascade(
+                    agent_config.docs_cascade_model,
+                    agent_config.docs_llm_model,
+                    min_top_score=agent_config.cascade_min_top_score,
+                    max_strong_documents=agent_config.cascade_max_strong_documents,
+                    max_query_words=agent_config.cascade_max_query_words
+                )
+
+        # Runs a call to an external dependency behind its circuit breaker, hedged when enabled
+        def guarded_call(self, dependency, fn, fallback=None):
+            hedger = self.hedgers.get(dependency)
+            call = (lambda: hedger.call(fn)) if hedger is not None else fn
+            return self.breakers[dependency].call(call, fallback)
+
+        def get_fallback_index(self):
+            if self.fallback_index is None:
+                self.fallback_index = load_local_index(self.agent_config.vectorstore_fallback_path)
+                self.logger.info("loaded fallback vectorstore from %s", self.agent_config.vectorstore_fallback_path)
+            return self.fallback_index
+
+        # Local indexes count their own writes; for Pinecone, ingestion bumps a stamp file
+        def namespace_version(self, index, namespace):
+            version = getattr(index, 'version', None)
+            if callable(version):
+                return version(namespace)
+            return self.version_stamps.version(namespace)
+
+        # Returns pinecone.Index or a local stand-in with the same query interface
+        def get_vectorstore_index(self):
+            match self.agent_config.vectorstore_backend:
+                case 'local' | 'local_ivf':
+                    if self.local_index is None:
+                        path = self.agent_config.local_vectorstore_path
+                        self.local_index = load_local_index(
+                            path,
+                            self.agent_config.vectorstore_backend,
+                            self.agent_config.ivf_n_probe,
+                            self.agent_config.ivf_rerank_factor
+                        )
+                        self.logger.info(f"loaded {self.agent_config.vectorstore_backend} vectorstore from {path}")
+                    return self.local_index
+                case _:
+                    pinecone.init(api_key=os.getenv("PINECONE_API_KEY"), environment=self.agent_config.vectorstore_environment)
+                    return pinecone.Index(self.agent_config.vectorstore_index)
 
         # Gets embeddings from query string
+        @traced('get_query_embeddings')
         def get_query_embeddings(self, query):
             try:
-                embedding_retriever = OpenAIEmbeddings(
-                    model=self.agent_config.docs_llm_model,
-                    openai_api_key=os.getenv("OPENAI_API_KEY"),
+                embedding_response = self.guarded_call('embedding', lambda: self.openai_scheduler.embedding(
+                    model=self.agent_config.embedding_model,
+                    input=[query],
                     request_timeout=self.agent_config.openai_timeout_seconds
-                )
-                dense_embedding = embedding_retriever.embed_query(query)
+                ))
+                dense_embedding = embedding_response['data'][0]['embedding']
 
 
                 bm25_encoder = BM25Encoder()
@@ -187,74 +475,178 @@ class ShelbyAgent:
                 self.logger.error(f"An error occurred in get_query_embeddings: {str(e)}")
                 raise e
 
+        @traced('query_vectorstore')
         def query_vectorstore(self, dense_embedding, sparse_embedding, topic):
             try:
-                pinecone.init(api_key=os.getenv("PINECONE_API_KEY"), environment=self.agent_config.vectorstore_environment)
-                index = pinecone.Index(self.agent_config.vectorstore_index)
-                
-                soft_query_response = index.query(
-                    top_k=self.agent_config.vectorstore_top_k,
-                    include_values=False,
-                    namespace=topic,
-                    include_metadata=True,
-                    filter={"doc_type": {"$eq": "soft"}},
-                    vector=dense_embedding,
-                    sparse_vector=sparse_embedding
-                )
-                hard_query_response = index.query(
-                    top_k=self.agent_config.vectorstore_top_k,
-                    include_values=False,
-                    namespace=topic,
-                    include_metadata=True,
-                    filter={"doc_type": {"$eq": "hard"}},
-                    vector=dense_embedding,
-                    sparse_vector=sparse_embedding
-                )
+                index = self.get_vectorstore_index()
+                top_k = self.agent_config.vectorstore_top_k
+                cache = self.retrieval_cache
+                version = self.namespace_version(index, topic) if cache is not None else None
+
+                content_store = load_content_store(self.agent_config.content_store_path) if self.agent_config.content_store_path else None
 
                 # Destructures the QueryResponse object the pinecone library generates.
-                documents_list = []
-                for m in soft_query_response.matches:
-                    self.logger.debug(m.metadata['title'])
-                    response = {
-                        'content': m.metadata['content'],
-                        'title': m.metadata['title'],
-                        'url': m.metadata['url'],
-                        'doc_type': m.metadata['doc_type'],
-                        'score': m.score,
-                        'id': m.id
-                    }
-                    documents_list.append(response)
-                for m in hard_query_response.matches:
-                    self.logger.debug(m.metadata['title'])
-                    response = {
-                        'content': m.metadata['content'],
-                        'title': m.metadata['title'],
-                        'url': m.metadata['url'],
-                        'doc_type': m.metadata['doc_type'],
-                        'score': m.score,
-                        'id': m.id
-                    }
-                    documents_list.append(response)
+                def destructure(query_response):
+                    matches = []
+                    for m in query_response.matches:
+                        self.logger.debug(m.metadata['title'])
+                        matches.append({
+                            'content': m.metadata['content'],
+                            'title': m.metadata['title'],
+                            'url': m.metadata['url'],
+                            'doc_type': m.metadata['doc_type'],
+                            'score': m.score,
+                            'id': m.id,
+                            'token_counts': counts_from_metadata(m.metadata)
+                        })
+                    return matches
+
+                # Same documents from IDs and scores, with the text read from the local content store.
+                # None if the store is missing any of them (not yet synced), so the caller can ask for metadata instead.
+                def resolve_locally(query_response):
+                    stored = content_store.get_many(topic, [m.id for m in query_response.matches])
+                    if len(stored) < len(query_response.matches):
+                        self.logger.warning("content store is missing %d of %d matches in %s", len(query_response.matches) - len(stored), len(query_response.matches), topic)
+                        return None
+                    matches = []
+                    for m in query_response.matches:
+                        doc = stored[m.id]
+                        matches.append({
+                            'content': doc['content'],
+                            'title': doc['title'],
+                            'url': doc['url'],
+                            'doc_type': doc['doc_type'],
+                            'score': m.score,
+                            'id': m.id,
+                            'token_counts': doc['token_counts']
+                        })
+                    return matches
+
+                def run_query(doc_type):
+                    if cache is not None:
+                        cached = cache.get(topic, doc_type, top_k, dense_embedding, sparse_embedding, version)
+                        if cached is not None:
+                            return cached
+                    query_args = dict(
+                        top_k=top_k,
+                        include_values=False,
+                        namespace=topic,
+                        include_metadata=content_store is None,
+                        filter={"doc_type": {"$eq": doc_type}},
+                        vector=dense_embedding,
+                        sparse_vector=sparse_embedding
+                    )
+                    fallback = None
+                    served_by_fallback = []
+                    if self.agent_config.vectorstore_fallback_path and self.agent_config.vectorstore_backend == 'pinecone':
+                        def fallback():
+                            served_by_fallback.append(True)
+                            return self.get_fallback_index().query(**{**query_args, 'include_metadata': True})
+
+                    def call():
+                        return self.guarded_call(
+                            'vectorstore',
+                            lambda: index.query(**query_args, _request_timeout=stage_timeout()),
+                            fallback
+                        )
+
+                    query_response = call()
+                    matches = None
+                    if content_store is not None and not served_by_fallback:
+                        matches = resolve_locally(query_response)
+                        if matches is None:
+                            query_args['include_metadata'] = True
+                            query_response = call()
+                    if matches is None:
+                        matches = destructure(query_response)
+                    # Fallback answers may be out of date, so they are not cached
+                    if cache is not None and not served_by_fallback:
+                        cache.put(topic, doc_type, top_k, dense_embedding, sparse_embedding, version, matches)
+                    return matches
+
+                documents_list = run_query("soft") + run_query("hard")
 
+                # IDs, scores and sizes are what a replay of this query needs back from the index
+                set_span_attributes(
+                    documents=len(documents_list),
+                    namespace=topic,
+                    matches=[[doc['id'], round(doc['score'], 4), doc['doc_type'], len(doc['content'])] for doc in documents_list]
+                )
                 return documents_list
             except Exception as e:
                 self.logger.error(f"An error occurred in query_vectorstore: {str(e)}")
                 raise e
         
+        # Embeddings of the namespace descriptions, fetched once per process
+        def get_namespace_embeddings(self):
+            if self.namespace_embeddings is None:
+                namespaces = self.agent_config.vectorstore_namespaces
+                response = self.guarded_call('embedding', lambda: self.openai_scheduler.embedding(
+                    model=self.agent_config.embedding_model,
+                    input=[f"{name}: {description}" for name, description in namespaces.items()],
+                    request_timeout=self.agent_config.openai_timeout_seconds
+                ))
+                self.namespace_embeddings = np.array([item['embedding'] for item in response['data']], dtype=np.float32)
+            return self.namespace_embeddings
+
+        # Namespaces with a weight in (0, 1], closest description to the query first
+        def rank_namespaces(self, dense_embedding):
+            namespaces = self.agent_config.vectorstore_namespaces
+            try:
+                namespace_embeddings = self.get_namespace_embeddings()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                self.logger.warning("could not rank namespaces, using configured order: %s", e)
+                return [(name, 1.0) for name in namespaces]
+            similarity = np.clip(namespace_embeddings @ np.asarray(dense_embedding, dtype=np.float32), 0.0, None)
+            best = float(similarity.max()) if len(similarity) else 0.0
+            ranked = sorted(zip(namespaces, similarity), key=lambda item: item[1], reverse=True)
+            return [(name, float(score) / best if best > 0 else 1.0) for name, score in ranked]
+
+        # Retrieves from several namespaces concurrently within the query's deadline and merges the results.
+        @traced('fan_out_retrieval')
+        def query_namespaces(self, dense_embedding, sparse_embedding, ranked_namespaces):
+            futures = {
+                self.fanout_executor.submit(contextvars.copy_context().run, self.query_vectorstore, dense_embedding, sparse_embedding, name): (name, weight)
+                for name, weight in ranked_namespaces
+            }
+            done, not_done = wait(futures, timeout=stage_timeout())
+            if not_done:
+                self.logger.warning("namespaces %s did not answer in time", [futures[f][0] for f in not_done])
+            documents_list = []
+            errors = []
+            for future in done:
+                name, weight = futures[future]
+                if future.exception() is not None:
+                    self.logger.warning("retrieval from %s failed: %s", name, future.exception())
+                    errors.append(future.exception())
+                    continue
+                documents_list.extend(weigh_namespace_matches(future.result(), name, weight))
+            if errors and len(errors) == len(futures):
+                raise errors[0]
+            set_span_attributes(namespaces=len(futures), documents=len(documents_list))
+            return documents_list
+
+        # Versioned pages and boilerplate come back several times; keep the best-scoring copy of each
+        @traced('dedupe_documents')
+        def dedupe_documents(self, returned_documents):
+            kept = dedupe_documents(returned_documents, self.agent_config.dedupe_threshold, self.agent_config.dedupe_shingle_size)
+            if len(kept) < len(returned_documents):
+                self.logger.debug("dropped %d near-duplicate docs", len(returned_documents) - len(kept))
+            set_span_attributes(documents=len(kept), duplicates=len(returned_documents) - len(kept))
+            return kept
+
         # Parses documents into x and prunes the count to meet token threshold
+        @traced('parse_documents')
         def parse_documents(self, returned_documents):
             try:
+                # Counts come from ingestion, or are counted once per content hash, so packing is just sums
+                for doc in returned_documents:
+                    doc['tokens'] = self.token_counts.document_tokens(doc, self.agent_config.tiktoken_encoding_model)
+
                 def docs_tiktoken_len(documents):
-                    tokenizer = tiktoken.encoding_for_model(self.agent_config.tiktoken_encoding_model)
-                    token_count = 0
-                    for doc in documents:
-                        tokens = 0
-                        tokens += len(tokenizer.encode(
-                            doc['content'],
-                            disallowed_special=()
-                        ))
-                        token_count += tokens
-                    return token_count
+                    return sum(doc['tokens'] for doc in documents)
                 
                 # Count the number of 'hard' and 'soft' documents
                 hard_count = sum(1 for doc in returned_documents if doc['doc_type'] == 'hard')
@@ -269,11 +661,11 @@ class ShelbyAgent:
                     document['doc_num'] = i
 
                 embeddings_tokens = docs_tiktoken_len(sorted_documents)
-                self.logger.info(f"embedding docs token count: {embeddings_tokens}")
+                self.logger.info("embedding docs token count: %d", embeddings_tokens)
                 iterations = 0
                 while embeddings_tokens > self.agent_config.max_docs_tokens:
                     if iterations > len(sorted_documents):
-                        self.logger.debug(f"Could not reduce tokens under {self.agent_config.max_docs_tokens}.")
+                        self.logger.debug("Could not reduce tokens under %d.", self.agent_config.max_docs_tokens)
                         break
                     # Remove the lowest scoring 'soft' document if there is more than one,
                     # otherwise remove the lowest scoring 'hard' document
@@ -291,9 +683,9 @@ class ShelbyAgent:
                                 break
                     embeddings_tokens = docs_tiktoken_len(sorted_documents)
                     self.logger.debug("removed lowest scoring embedding doc .")
-                    self.logger.info(f"embedding docs token count: {embeddings_tokens}")
+                    self.logger.info("embedding docs token count: %d", embeddings_tokens)
                     iterations += 1
-                self.logger.debug(f"number of embedding docs now: {len(sorted_documents)}")
+                self.logger.debug("number of embedding docs now: %d", len(sorted_documents))
                 # Same as above but removes based on total count of docs instead of token count.
                 while len(sorted_documents) > self.agent_config.max_docs_used:
                     if soft_count > 1:
@@ -310,27 +702,36 @@ class ShelbyAgent:
                                 break
                     self.logger.debug("removed lowest scoring embedding doc.")
 
-                self.logger.debug(f"number of embedding docs now: {len(sorted_documents)}")
+                self.logger.debug("number of embedding docs now: %d", len(sorted_documents))
                 
                 for i, document in enumerate(sorted_documents, start=1):
                     document['doc_num'] = i
+                set_span_attributes(documents=len(sorted_documents), tokens=embeddings_tokens)
                 return sorted_documents
             except Exception as e:
                 self.logger.error(f"An error occurred in parse_documents: {str(e)}")
                 raise e
     
+        @traced('compress_context')
+        def compress_context(self, query, parsed_documents):
+            compressed, stats = compress_documents(query, parsed_documents, self.agent_config.compressed_docs_tokens)
+            self.logger.info("compressed docs from %d to %d tokens", stats['original_tokens'], stats['compressed_tokens'])
+            set_span_attributes(tokens=stats['compressed_tokens'], original_tokens=stats['original_tokens'])
+            return compressed
+
         # Generates multi-line text string with complete prompt
         def docs_prompt_template(self, query, documents):
             try:
-                with open(os.path.join(self.agent_config.prompt_template_path, 'docs_agent_prompt_template.yaml'), 'r') as stream:
-                    # Load the YAML data and print the result
-                    prompt_template = yaml.safe_load(stream)
+                prompt_template = load_prompt_template(self.agent_config.prompt_template_path, 'docs_agent_prompt_template.yaml')
 
                 # Loop over documents and append them to each other and then adds the query
                 content_strs = []
                 for doc in documents:
                     doc_num = doc['doc_num']
-                    content_strs.append(f"{doc['content']} doc_num: [{doc_num}]")
+                    if 'topic' in doc:
+                        content_strs.append(f"{doc['content']} topic: {doc['topic']} doc_num: [{doc_num}]")
+                    else:
+                        content_strs.append(f"{doc['content']} doc_num: [{doc_num}]")
                     documents_str = " ".join(content_strs)
                 prompt_message  = "Query: " + query + " Documents: " + documents_str
 
@@ -344,144 +745,199 @@ class ShelbyAgent:
                 self.logger.error(f"An error occurred in docs_prompt_template: {str(e)}")
                 raise e
         
-        def docs_prompt_llm(self, prompt):
+        @traced('docs_prompt_llm')
+        def docs_prompt_llm(self, prompt, model=None):
             try:
-                response = openai.ChatCompletion.create(
-                    model=self.agent_config.docs_llm_model,
+                model = model or self.agent_config.docs_llm_model
+                response = self.openai_scheduler.chat_completion(
+                    model=model,
                     messages=prompt,
-                    max_tokens=self.agent_config.max_response_tokens
+                    max_tokens=self.agent_config.max_response_tokens,
+                    request_timeout=self.agent_config.openai_timeout_seconds
                 )
+                usage = response.get('usage', {})
+                set_span_attributes(model=model, prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'))
                 return response['choices'][0]['message']['content']
             except Exception as e:
                 self.logger.error(f"An error occurred in docs_prompt_llm: {str(e)}")
                 raise e
 
-        def append_meta(self, input_text, parsed_documents):
+        @traced('append_meta')
+        def append_meta(self, input_text, parsed_documents, model=None):
             try:
-                # Covering LLM doc notations cases
-                # The modified pattern now includes optional opening parentheses or brackets before "Document"
-                # and optional closing parentheses or brackets after the number
-                pattern = r"[\[\(]?Document\s*\[?(\d+)\]?\)?[\]\)]?"
-                formatted_text = re.sub(pattern, r"[\1]", input_text, flags=re.IGNORECASE)
-
-                # This finds all instances of [n] in the LLM response
-                pattern_num = r"\[\d\]"
-                matches = re.findall(pattern_num, formatted_text)
-                print(matches)
-
-                if not matches:
+                model = model or self.agent_config.docs_llm_model
+                # Rewrites every way of naming a document to [n] and looks up [n], [n-m] and [n, m] citations by doc_num
+                resolver = CitationResolver(parsed_documents)
+                documents = resolver.resolve(input_text)
+                if resolver.unknown:
+                    self.logger.debug("cited documents not in the list: %s", sorted(resolver.unknown))
+                if not documents:
                     self.logger.debug("No supporting docs.")
-                    answer_obj = {
-                        "answer_text": input_text,
-                        "llm": self.agent_config.docs_llm_model,
-                        "documents": []
-                    }
-                    return answer_obj
-                print(matches)
-
-                # Formatted text has all mutations of documents n replaced with [n]
-                answer_obj = {
-                        "answer_text": formatted_text,
-                        "llm": self.agent_config.docs_llm_model,
-                        "documents": []
+                set_span_attributes(documents=len(documents))
+                return {
+                    "answer_text": resolver.text,
+                    "llm": model,
+                    "documents": documents
                 }
-
-                if matches:
-                    # Creates a lit of each unique mention of [n] in LLM response
-                    unique_doc_nums = set([int(match[1:-1]) for match in matches])
-                    for doc_num in unique_doc_nums:
-                        # doc_num given to llm has an index starting a 1
-                        # Subtract 1 to get the correct index in the list
-                        doc_index = doc_num - 1
-                        # Access the document from the list using the index
-                        if 0 <= doc_index < len(parsed_documents):
-                            document = {
-                                "doc_num": parsed_documents[doc_index]['doc_num'],
-                                "url": parsed_documents[doc_index]['url'],
-                                "title": parsed_documents[doc_index]['title']
-                            }
-                            answer_obj["documents"].append(document)
-                        else:
-                            self.logger.debug(f"Document{doc_num} not found in the list.")
-                return answer_obj
             except Exception as e:
                 self.logger.error(f"An error occurred in append_meta: {str(e)}")
                 raise e
     
+        # Degraded answer listing the top retrieved documents, used when generation can't finish in time
+        def retrieval_only_answer(self, parsed_documents):
+            documents = [
+                {
+                    "doc_num": doc['doc_num'],
+                    "url": doc['url'],
+                    "title": doc['title']
+                }
+                for doc in parsed_documents
+            ]
+            if documents:
+                answer_text = "Generating an answer took too long, so here are the most relevant documents I found instead."
+            else:
+                answer_text = "Generating an answer took too long and no related documents were found. Please try again."
+            set_span_attributes(degraded=True)
+            return {
+                "answer_text": answer_text,
+                "llm": "retrieval only",
+                "documents": documents,
+                "degraded": True
+            }
+
+        # Completion plus citations; with the cascade on, easy questions try the small model first
+        def generate_answer(self, query, prompt, parsed_documents):
+            if self.cascade is None:
+                return self.append_meta(self.docs_prompt_llm(prompt), parsed_documents)
+            if self.cascade.is_easy(query, parsed_documents):
+                small_model = self.cascade.small_model
+                start = time.perf_counter()
+                try:
+                    response = self.append_meta(self.docs_prompt_llm(prompt, small_model), parsed_documents, small_model)
+                    reason = self.cascade.escalation_reason(response)
+                except openai.error.OpenAIError as e:
+                    self.logger.warning("%s failed: %s", small_model, e)
+                    response, reason, error = None, "error", e
+                self.cascade.record("small", time.perf_counter() - start, reason)
+                if reason is None:
+                    return response
+                deadline = current_deadline()
+                if deadline is not None and deadline.remaining() < self.agent_config.min_generation_seconds:
+                    # No time for a second completion; an unsure answer beats none
+                    if response is None:
+                        raise error
+                    return response
+                self.logger.info("escalating to %s: %s", self.cascade.large_model, reason)
+                set_span_attributes(escalated=reason)
+            start = time.perf_counter()
+            response = self.append_meta(self.docs_prompt_llm(prompt, self.cascade.large_model), parsed_documents, self.cascade.large_model)
+            self.cascade.record("large", time.perf_counter() - start)
+            return response
+
+        # Without a clear topic the closest few namespaces are searched rather than namespace 0
+        def fans_out(self, topic):
+            return not topic and self.agent_config.fanout_namespaces > 0 and len(self.agent_config.vectorstore_namespaces) > 1
+
         def run_docs_agent(self, query, topic):
-            self.logger.debug(f"new query:", query)
+            self.logger.debug("new query: %s", query)
             dense_embedding, sparse_embedding = self.get_query_embeddings(query)
             self.logger.debug("embedding retrieved")
-            returned_documents = self.query_vectorstore(dense_embedding, sparse_embedding, topic)
+            if self.fans_out(topic):
+                # Routing found no clear topic; search the closest few namespaces instead of namespace 0
+                ranked_namespaces = self.rank_namespaces(dense_embedding)[:self.agent_config.fanout_namespaces]
+                self.logger.debug("fanning out to %s", ranked_namespaces)
+                returned_documents = self.query_namespaces(dense_embedding, sparse_embedding, ranked_namespaces)
+            else:
+                returned_documents = self.query_vectorstore(dense_embedding, sparse_embedding, topic)
 
             if not returned_documents:
                 self.logger.debug("No supporting documents found!")
             else:
-                self.logger.debug(f"{len(returned_documents)} documents retrieved")
+                self.logger.debug("%d documents retrieved", len(returned_documents))
+            if self.agent_config.dedupe_threshold > 0:
+                returned_documents = self.dedupe_documents(returned_documents)
             parsed_documents = self.parse_documents(returned_documents)
+            if self.agent_config.compress_context:
+                parsed_documents = self.compress_context(query, parsed_documents)
             prompt = self.docs_prompt_template(query, parsed_documents)
-            self.logger.debug("prepared prompt: %s", json.dumps(prompt, indent=4))
+            # json.dumps runs eagerly, so only pay for it when the line is kept
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("prepared prompt: %s", json.dumps(prompt, indent=4))
+            # Answer with the retrieved docs rather than start a completion that can't finish in time
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() < self.agent_config.min_generation_seconds:
+                self.logger.warning("%.1fs left of query budget, skipping generation", deadline.remaining())
+                return self.retrieval_only_answer(parsed_documents)
             self.logger.debug("sending prompt to llm")
-            llm_response = self.docs_prompt_llm(prompt)
-            self.logger.debug(llm_response)
-            response = self.append_meta(llm_response, parsed_documents)
+            try:
+                response = self.generate_answer(query, prompt, parsed_documents)
+            except (DeadlineExceeded, openai.error.Timeout) as e:
+                self.logger.warning("generation ran out of time: %s", e)
+                return self.retrieval_only_answer(parsed_documents)
             self.logger.debug("full response: %s", response)
             
             return response
     
     # Currently under development
     class APIAgent:
-        def __init__(self, logger, agent_config):
+        def __init__(self, logger, agent_config, openai_scheduler):
             self.logger = logger
             self.agent_config = agent_config
+            self.openai_scheduler = openai_scheduler
+            self.executor = APIExecutor(
+                max_connections=agent_config.API_max_connections,
+                max_connections_per_host=agent_config.API_max_connections_per_host,
+                timeout_seconds=agent_config.API_timeout_seconds,
+                connect_timeout_seconds=agent_config.API_connect_timeout_seconds,
+                cache_ttl_seconds=agent_config.API_cache_ttl_seconds,
+                cache_size=agent_config.API_cache_size,
+                max_response_bytes=agent_config.API_max_response_bytes,
+                server_override=agent_config.API_server_override,
+            )
+            self.validation_stats = ValidationStats()
         
         # Selects the correct API and endpoint to run action on.
         # Eventually, we should create a merged file that describes all available API.
         def select_API_operationID(self, query):
             API_spec_path = self.agent_config.API_spec_path
             # Load prompt template to be used with all APIs
-            with open(os.path.join(self.agent_config.prompt_template_path, 'API_agent_select_operationID_prompt_template.yaml'), 'r') as stream:
-                # Load the YAML data and print the result
-                prompt_template = yaml.safe_load(stream)
+            prompt_template = load_prompt_template(self.agent_config.prompt_template_path, 'API_agent_select_operationID_prompt_template.yaml')
             operationID_file = None
             # Iterates all OpenAPI specs in API_spec_path directory,
             # and asks LLM if the API can satsify the request and if so which document to return
-            for entry in os.scandir(API_spec_path):
-                if entry.is_dir():
-                    # Create prompt
-                    with open(os.path.join(entry.path, 'LLM_OAS_keypoint_guide_file.txt'), 'r') as stream:
-                        keypoint = yaml.safe_load(stream)
-                        prompt_message  = "query: " + query + " spec: " + keypoint
-                        for role in prompt_template:
-                            if role['role'] == 'user': 
-                                role['content'] = prompt_message  
-                        # Creates a dic of tokens that are the only acceptable answers
-                        # This forces GPT to choose one.
-                        logit_bias = {
-                            # 0-9
-                            "15": 100,
-                            "16": 100,
-                            "17": 100,
-                            "18": 100,
-                            "19": 100,
-                            "20": 100,
-                            "21": 100,
-                            "22": 100,
-                            "23": 100,
-                            "24": 100,
-                            # \n
-                            "198": 100,
-                            # x
-                            "87": 100,
-                        }
-                        response = openai.ChatCompletion.create(
-                            model=self.agent_config.select_operationID_llm_model,
-                            messages=prompt_template,
-                            # 5 tokens when doc_number == 999
-                            max_tokens=5,
-                            logit_bias=logit_bias,
-                            stop='x'
-                        )
+            for API_name, keypoint, operationIDs in load_API_specs(API_spec_path):
+                # Create prompt
+                prompt_message  = "query: " + query + " spec: " + keypoint
+                for role in prompt_template:
+                    if role['role'] == 'user': 
+                        role['content'] = prompt_message  
+                # Creates a dic of tokens that are the only acceptable answers
+                # This forces GPT to choose one.
+                logit_bias = {
+                    # 0-9
+                    "15": 100,
+                    "16": 100,
+                    "17": 100,
+                    "18": 100,
+                    "19": 100,
+                    "20": 100,
+                    "21": 100,
+                    "22": 100,
+                    "23": 100,
+                    "24": 100,
+                    # \n
+                    "198": 100,
+                    # x
+                    "87": 100,
+                }
+                response = self.openai_scheduler.chat_completion(
+                    model=self.agent_config.select_operationID_llm_model,
+                    messages=prompt_template,
+                    # 5 tokens when doc_number == 999
+                    max_tokens=5,
+                    logit_bias=logit_bias,
+                    stop='x'
+                )
                 answer = response['choices'][0]['message']['content']
                 # need to check if there are no numbers in answer
                 if 'x' in answer or answer == '':
@@ -491,22 +947,17 @@ class ShelbyAgent:
                     digits = answer.split('\n')  
                     number_str = ''.join(digits)  
                     number = int(number_str)  
-                    directory_path = f"data/minified_openAPI_specs/{entry.name}/operationIDs/"
-                    for filename in os.listdir(directory_path):
-                        if filename.endswith(f"-{number}.json"):
-                            with open(os.path.join(directory_path, filename), 'r') as f:
-                                operationID_file = json.load(f)
-                            self.logger.debug(f"operationID_file found: {os.path.join(directory_path, filename)}.")
-                            break
+                    if number in operationIDs:
+                        operationID_file = load_operationID_file(operationIDs[number])
+                        self.logger.debug("operationID_file found: %s.", operationIDs[number])
                     break
             if operationID_file is None:
                 self.logger.debug("No matching operationID found.")
             return operationID_file
                 
-        def create_bodyless_function(self, query, operationID_file):
-            with open(os.path.join(self.agent_config.prompt_template_path, 'API_agent_create_bodyless_function_prompt_template.yaml'), 'r') as stream:
-                # Load the YAML data and print the result
-                prompt_template = yaml.safe_load(stream)
+        # correction is the rejected reply and what is wrong with it, when asking again
+        def create_bodyless_function(self, query, operationID_file, correction=None):
+            prompt_template = load_prompt_template(self.agent_config.prompt_template_path, 'API_agent_create_bodyless_function_prompt_template.yaml')
                 
             prompt_message  = "user_request: " + query 
             prompt_message  += f"\nurl: " + operationID_file['metadata']['server_url'] + " operationid: " + operationID_file['metadata']['operation_id']
@@ -514,8 +965,13 @@ class ShelbyAgent:
             for role in prompt_template:
                 if role['role'] == 'user': 
                     role['content'] = prompt_message 
+            if correction is not None:
+                # Only the error goes back; the spec is already in the conversation
+                rejected, error = correction
+                prompt_template.append({'role': 'assistant', 'content': rejected})
+                prompt_template.append({'role': 'user', 'content': f"that url is invalid: {error}. respond with only the corrected url."})
                     
-            response = openai.ChatCompletion.create(
+            response = self.openai_scheduler.chat_completion(
                             model=self.agent_config.create_function_llm_model,
                             messages=prompt_template,
                             max_tokens=500,
@@ -524,18 +980,70 @@ class ShelbyAgent:
             return url_maybe
   
                     
+        # Generates the call and checks it locally, fixing what is safe to fix;
+        # the model is asked again, with just the validator's error, at most API_reprompt_attempts times
+        @traced('generate_API_call')
+        def generate_API_call(self, query, operationID_file):
+            validator = load_operation_validator(operationID_file['metadata']['server_url'], operationID_file['context'])
+            correction = None
+            for attempt in range(self.agent_config.API_reprompt_attempts + 1):
+                if correction is not None:
+                    self.validation_stats.reprompt()
+                start = time.perf_counter()
+                url_maybe = self.create_bodyless_function(query, operationID_file, correction)
+                self.validation_stats.completion(time.perf_counter() - start)
+                try:
+                    url, fixes = validator.validate(url_maybe)
+                except InvalidAPICall as e:
+                    self.logger.debug("generated call rejected: %s: %s", e, url_maybe)
+                    correction = (url_maybe, str(e))
+                    continue
+                self.validation_stats.record("fixed" if fixes else "valid", fixes, attempt)
+                set_span_attributes(reprompts=attempt, fixes=fixes)
+                return url
+            self.validation_stats.record("rejected", [], attempt)
+            set_span_attributes(reprompts=attempt, error=correction[1])
+            raise InvalidAPICall(correction[1])
+
+        @traced('execute_API_call')
+        def execute_API_call(self, url):
+            set_span_attributes(url=url)
+            return self.executor.fetch_blocking('GET', url)
+
+        # Answer with the API's reply, citing the operation's documentation
+        def API_answer(self, url, operationID_file, API_response):
+            metadata = operationID_file['metadata']
+            # Keeps the reply within a chat message
+            text = API_response.text[:1500]
+            return {
+                "answer_text": f"`GET {url}` returned {API_response.status}:\n```\n{text}\n```",
+                "llm": self.agent_config.create_function_llm_model,
+                "documents": [
+                    {
+                        "doc_num": 1,
+                        "url": metadata['doc_url'],
+                        "title": metadata['operation_id']
+                    }
+                ]
+            }
+
+        # Returns None when no API call answered the query, so the caller can fall back to the docs agent
         def run_API_agent(self, query):
-            self.logger.debug(f"new action:", query)
+            self.logger.debug("new action: %s", query)
             operationID_file = self.select_API_operationID(query)
-            # Here we need to run a doc_agent query if operationID_file is None
-            function = self.create_bodyless_function(query, operationID_file)
-            # Here we need to run a doc_agent query if url_maybe does not parse as a url
-            
-            # Here we need to run a doc_agent query if the function doesn't run correctly
-            
+            if operationID_file is None:
+                return None
+            try:
+                url = self.generate_API_call(query, operationID_file)
+            except InvalidAPICall:
+                return None
+            try:
+                API_response = self.execute_API_call(url)
+            except APICallFailed as e:
+                self.logger.warning("API call %s failed: %s", url, e)
+                return None
+            if not API_response.ok:
+                self.logger.debug("API call %s returned %d", url, API_response.status)
+                return None
             # Here we send the request to GPT to evaluate the answer
-            
-
-            return response
-    
-
+            return self.API_answer(url, operationID_file, API_response)
@@ -0,0 +1,117 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+# The ways models write "Document 3": "Document 3", "(Document 3)", "[Document [3]]"; all become [3]
+_document_mention = re.compile(r"[\[\(]?Document\s*\[?(\d+)\]?\)?[\]\)]?", re.IGNORECASE)
+# Citations after normalizing: [3], [10], [1-3], [1, 2], [1,3-5]
+_citation = re.compile(r"\[(\d+(?:\s*[-–]\s*\d+)?(?:\s*,\s*\d+(?:\s*[-–]\s*\d+)?)*)\]")
+_citation_part = re.compile(r"(\d+)(?:\s*[-–]\s*(\d+))?")
+# A stream chunk may end partway through "Document 1" or "Document 12"
+_partial_mention = re.compile(r"(?<![a-z])d(?:o(?:c(?:u(?:m(?:e(?:n(?:t\s*\[?\d*)?)?)?)?)?)?)?$", re.IGNORECASE)
+# How far back an unclosed bracket may still become a citation
+_max_citation_chars = 40
+
+
+def cited_numbers(citation: str, limit: Optional[int] = None) -> Iterable[int]:
+    """
+    Document numbers in the body of a citation, e.g. '1-3, 5' -> 1, 2, 3, 5
+
+    Args:
+        citation: text between the brackets
+        limit: highest number a range is expanded to, so [1-100000] costs no more than the documents given
+    """
+    for match in _citation_part.finditer(citation):
+        low = int(match.group(1))
+        high = int(match.group(2)) if match.group(2) else low
+        if low > high:
+            low, high = high, low
+        if limit is not None and high > limit and high != low:
+            high = max(low, limit)
+        yield from range(low, high + 1)
+
+
+class CitationResolver:
+
+    """Finds the documents an answer cites, from the finished text or incrementally as it streams in"""
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        """
+        Mentions such as "Document 3" are rewritten to [3], and every [n], [n-m] and [n, m]
+        citation is looked up by doc_num. feed() takes the answer a chunk at a time and returns
+        the documents first cited in it, so sources can be shown while the answer is still
+        generating; text that could be the start of a citation is held back until the next chunk
+        or finish(). resolve() does the same for a finished answer.
+
+        Args:
+            documents: the documents offered to the model, each with doc_num, url and title
+        """
+        self._by_num = {doc['doc_num']: doc for doc in documents}
+        self._max_num = max(self._by_num, default=0)
+        # doc_num -> document, in the order first cited
+        self._cited: Dict[int, Dict[str, Any]] = {}
+        # Cited numbers no document was given for
+        self.unknown: Set[int] = set()
+        self._text: List[str] = []
+        self._pending = ""
+
+    def _holdback(self, text: str) -> int:
+        """Where the part of text that may still grow into a citation or mention starts."""
+        cut = len(text)
+        depth = 0
+        for i in range(len(text) - 1, max(-1, len(text) - 1 - _max_citation_chars), -1):
+            char = text[i]
+            if char in "])":
+                depth += 1
+            elif char in "[(":
+                if depth == 0:
+                    cut = i
+                else:
+                    depth -= 1
+        match = _partial_mention.search(text)
+        if match is not None:
+            cut = min(cut, match.start())
+        return cut
+
+    def _resolve(self, text: str) -> List[Dict[str, Any]]:
+        formatted = _document_mention.sub(r"[\1]", text)
+        self._text.append(formatted)
+        new = []
+        for citation in _citation.finditer(formatted):
+            for doc_num in cited_numbers(citation.group(1), self._max_num):
+                if doc_num in self._cited:
+                    continue
+                document = self._by_num.get(doc_num)
+                if document is None:
+                    self.unknown.add(doc_num)
+                    continue
+                self._cited[doc_num] = document
+                new.append(document)
+        return new
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Documents first cited in this chunk of a streamed answer."""
+        text = self._pending + chunk
+        cut = self._holdback(text)
+        self._pending = text[cut:]
+        return self._resolve(text[:cut])
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Documents first cited in what feed() held back at the end of the stream."""
+        text, self._pending = self._pending, ""
+        return self._resolve(text)
+
+    def resolve(self, answer: str) -> List[Dict[str, Any]]:
+        self.feed(answer)
+        self.finish()
+        return self.documents()
+
+    @property
+    def text(self) -> str:
+        """The answer so far with document mentions rewritten as citations."""
+        return "".join(self._text)
+
+    def documents(self, citation_order: bool = False) -> List[Dict[str, Any]]:
+        """Cited documents as the answer lists them (doc_num, url and title), by doc_num or in the order first cited."""
+        cited = self._cited.values() if citation_order else sorted(self._cited.values(), key=lambda doc: doc['doc_num'])
+        return [{"doc_num": doc['doc_num'], "url": doc['url'], "title": doc['title']} for doc in cited]
@@ -0,0 +1,88 @@
+import re
+import math
+from typing import Any, Dict, List, Tuple
+
+from pinecone_text.sparse import BM25Encoder
+
+
+# Sentence ends, blank lines and list/heading starts; code and tables stay in the sentence they belong to
+_sentence_boundary = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9`\"'(\[])|\n\s*\n|\n(?=\s*(?:[-*#]|\d+\.)\s)")
+
+# Marks text dropped from the middle of a document
+_gap = " ... "
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _sentence_boundary.split(text) if s and s.strip()]
+
+
+def _sparse_dot(query: Dict[str, List], sentence: Dict[str, List]) -> float:
+    weights = dict(zip(query["indices"], query["values"]))
+    return sum(weights.get(index, 0.0) * value for index, value in zip(sentence["indices"], sentence["values"]))
+
+
+def compress_documents(query: str, documents: List[Dict[str, Any]], token_budget: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Keep the sentences of each document that best match the query, within token_budget tokens overall
+
+    Sentences are scored with BM25 fitted on the retrieved sentences themselves, so terms that are
+    common across all of them count for little. Every document keeps at least its best sentence, so
+    every doc_num the prompt offers is still there to cite; the rest of the budget goes to the
+    highest-scoring sentences across all documents. Kept sentences stay in their original order.
+    Sentence token counts are the document's count (doc['tokens']) shared out by length, so no
+    tokenizer runs here.
+
+    Returns: compressed copies of the documents, and {"original_tokens", "compressed_tokens"}
+    """
+    original_tokens = sum(doc['tokens'] for doc in documents)
+    if original_tokens <= token_budget or not documents:
+        return documents, {"original_tokens": original_tokens, "compressed_tokens": original_tokens}
+
+    sentences = []  # (doc index, position, text, tokens)
+    for d, doc in enumerate(documents):
+        parts = split_sentences(doc['content'])
+        total_chars = sum(len(part) for part in parts) or 1
+        for position, part in enumerate(parts):
+            sentences.append((d, position, part, max(1, math.ceil(doc['tokens'] * len(part) / total_chars))))
+    if not sentences:
+        return documents, {"original_tokens": original_tokens, "compressed_tokens": original_tokens}
+
+    encoder = BM25Encoder()
+    encoder.fit([text for _, _, text, _ in sentences])
+    query_vector = encoder.encode_queries(query)
+    scores = [_sparse_dot(query_vector, vector) for vector in encoder.encode_documents([text for _, _, text, _ in sentences])]
+
+    # Best sentence of each document first, then everything else by score; ties go to higher-ranked documents and earlier sentences
+    order = sorted(range(len(sentences)), key=lambda i: (-scores[i], sentences[i][0], sentences[i][1]))
+    best_of_doc = {}
+    for i in order:
+        best_of_doc.setdefault(sentences[i][0], i)
+    firsts = set(best_of_doc.values())
+    chosen = set()
+    used = 0
+    for i in sorted(firsts, key=lambda i: sentences[i][0]) + [i for i in order if i not in firsts]:
+        tokens = sentences[i][3]
+        # A document's best sentence goes in even over budget, the rest only while it lasts
+        if i not in firsts and used + tokens > token_budget:
+            continue
+        chosen.add(i)
+        used += tokens
+
+    compressed = []
+    for d, doc in enumerate(documents):
+        kept = sorted((sentences[i][1], sentences[i][2]) for i in chosen if sentences[i][0] == d)
+        pieces = []
+        previous = -1
+        for position, text in kept:
+            if pieces and position != previous + 1:
+                pieces.append(_gap)
+            elif pieces:
+                pieces.append(" ")
+            pieces.append(text)
+            previous = position
+        new_doc = dict(doc)
+        new_doc['content'] = "".join(pieces)
+        new_doc['tokens'] = sum(sentences[i][3] for i in chosen if sentences[i][0] == d)
+        new_doc['original_tokens'] = doc['tokens']
+        compressed.append(new_doc)
+    return compressed, {"original_tokens": original_tokens, "compressed_tokens": used}
@@ -0,0 +1,86 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from telemetry import REGISTRY
+
+
+# Answers that admit the documents didn't settle the question
+_low_confidence = re.compile(
+    r"\b(?:i don'?t know|i do not know|i'?m not sure|i am not sure|not certain|unable to (?:find|answer|determine)"
+    r"|(?:can ?not|can'?t|could ?not|couldn'?t) (?:find|answer|determine)|no (?:relevant )?information"
+    r"|(?:is|are) not (?:mentioned|covered|provided)|do(?:es)? not (?:mention|cover|contain|say))\b",
+    re.IGNORECASE,
+)
+
+
+class ModelCascade:
+
+    """Sends easy docs questions to a small model first and escalates to the large model when its answer isn't grounded"""
+
+    def __init__(
+        self,
+        small_model: str,
+        large_model: str,
+        min_top_score: float = 0.8,
+        max_strong_documents: int = 2,
+        max_query_words: int = 30,
+    ):
+        """
+        A question counts as easy when retrieval found a clear answer: the best document scores at
+        least min_top_score, at most max_strong_documents documents score that high (several strong
+        matches usually means the answer has to be pieced together), and the query is short. The
+        small model's answer is escalated when it cites no document or says it couldn't answer.
+
+        Args:
+            small_model: model tried first for easy questions
+            large_model: model for everything else and for escalations
+            min_top_score: retrieval score the best document needs (raw_score where fan-out has reweighted it)
+            max_strong_documents: documents scoring min_top_score or more that a question may have
+            max_query_words: longest query, in words, that counts as easy
+        """
+        self.small_model = small_model
+        self.large_model = large_model
+        self.min_top_score = min_top_score
+        self.max_strong_documents = max_strong_documents
+        self.max_query_words = max_query_words
+        self._lock = threading.Lock()
+        self._small_answers = 0
+        self._escalations = 0
+
+        self._answers = REGISTRY.counter("shelby_cascade_answers_total", "Docs completions by cascade tier and whether the answer was kept", ["tier", "outcome"])
+        self._escalation_reasons = REGISTRY.counter("shelby_cascade_escalations_total", "Small-model answers escalated, by reason", ["reason"])
+        self._latency = REGISTRY.histogram("shelby_cascade_completion_seconds", "Docs completion latency by cascade tier", ["tier"])
+        REGISTRY.gauge("shelby_cascade_escalation_rate", "Share of small-model answers escalated to the large model").set_function(self.escalation_rate)
+
+    def is_easy(self, query: str, documents: List[Dict[str, Any]]) -> bool:
+        if not documents or len(query.split()) > self.max_query_words:
+            return False
+        # Fanned-out documents carry a normalized, namespace-weighted score; the threshold is about the retrieval score itself
+        scores = [doc.get('raw_score', doc['score']) for doc in documents]
+        strong = sum(1 for score in scores if score >= self.min_top_score)
+        return max(scores) >= self.min_top_score and strong <= self.max_strong_documents
+
+    def escalation_reason(self, answer: Dict[str, Any]) -> Optional[str]:
+        """Why an answer (as built by append_meta) should be redone by the large model, or None to keep it."""
+        if not answer["documents"]:
+            return "no_citations"
+        if _low_confidence.search(answer["answer_text"]):
+            return "low_confidence"
+        return None
+
+    def record(self, tier: str, seconds: float, escalation: Optional[str] = None) -> None:
+        """Record a completion; escalation is the reason a small-model answer was dropped, if it was."""
+        self._latency.labels(tier=tier).observe(seconds)
+        self._answers.labels(tier=tier, outcome="escalated" if escalation else "kept").inc()
+        if tier != "small":
+            return
+        if escalation:
+            self._escalation_reasons.labels(reason=escalation).inc()
+        with self._lock:
+            self._small_answers += 1
+            self._escalations += 1 if escalation else 0
+
+    def escalation_rate(self) -> float:
+        with self._lock:
+            return self._escalations / self._small_answers if self._small_answers else 0.0
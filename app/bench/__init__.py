@@ -0,0 +1,8 @@
+"""
+# Benchmarks
+
+Deterministic local stand-ins for OpenAI and Pinecone plus a harness that drives ShelbyAgent.run_query
+at a fixed concurrency and reports end-to-end and per-stage latency percentiles.
+The replay stand-ins answer recorded traffic (see telemetry.TrafficRecorder) the way the services did.
+FakeAPIServer stands in for the APIs the API agent calls (see API_SERVER_OVERRIDE).
+"""
@@ -0,0 +1,347 @@
+import re
+import json
+import time
+import asyncio
+import threading
+import mmh3
+import numpy as np
+from aiohttp import web
+from typing import Dict, List, Optional
+
+from bench.latency import LatencyDistribution
+from vectorstore import LocalIndex
+
+
+EMBEDDING_DIMENSION = 1536
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _token_pattern.findall(text.lower())
+
+
+class FakeEmbedder:
+
+    """Deterministic bag-of-words embeddings: texts sharing words land close together"""
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION):
+        self.dimension = dimension
+        self._token_vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(mmh3.hash(token, signed=False))
+            vector = rng.standard_normal(self.dimension).astype(np.float32)
+            with self._lock:
+                self._token_vectors[token] = vector
+        return vector
+
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            vector += self._token_vector(token)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+
+def sparse_signature(text: str) -> Dict[str, list]:
+    """Term-frequency sparse vector hashed the same way as BM25Encoder."""
+    counts: Dict[int, int] = {}
+    for token in tokenize(text):
+        idx = mmh3.hash(token, signed=False)
+        counts[idx] = counts.get(idx, 0) + 1
+    total = sum(counts.values()) or 1
+    return {"indices": list(counts.keys()), "values": [c / total for c in counts.values()]}
+
+
+class LocalServer:
+
+    """aiohttp application served from its own event loop in a daemon thread"""
+
+    name = "local-server"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Blocking clients in executor threads can call it while the caller's event loop is busy.
+
+        Args:
+            host: interface to bind
+            port: port to bind, 0 picks a free one
+        """
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _routes(self, app: web.Application) -> None:
+        raise NotImplementedError
+
+    def start(self):
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def serve():
+            app = web.Application(client_max_size=64 * 1024 * 1024)
+            self._routes(app)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            self.port = self._runner.addresses[0][1]
+            started.set()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeOpenAIServer(LocalServer):
+
+    """Local HTTP server answering the chat completion and embedding endpoints the agents call"""
+
+    name = "fake-openai"
+
+    def __init__(
+        self,
+        chat_latency: str = "lognormal:1.5,0.4",
+        routing_latency: str = "lognormal:0.4,0.3",
+        embedding_latency: str = "lognormal:0.08,0.3",
+        prefill_seconds_per_1k_tokens: float = 0.0,
+        model_chat_latency: Optional[Dict[str, str]] = None,
+        uncited_rate: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Point the clients at it with `openai.api_base = server.api_base`.
+
+        Args:
+            chat_latency: latency spec for completions (see LatencyDistribution)
+            routing_latency: latency spec for single-token routing completions (max_tokens=1)
+            embedding_latency: latency spec for embedding requests
+            prefill_seconds_per_1k_tokens: extra completion latency per 1000 prompt tokens, so prompt size shows up in timings
+            model_chat_latency: completion latency specs for particular models, overriding chat_latency
+            uncited_rate: share of answers that cite no document, picked deterministically per prompt and model
+            seed: seed for the latency samplers
+            host: interface to bind
+            port: port to bind, 0 picks a free one
+        """
+        super().__init__(host, port)
+        self.chat_latency = LatencyDistribution(chat_latency, seed)
+        self.routing_latency = LatencyDistribution(routing_latency, seed + 1)
+        self.embedding_latency = LatencyDistribution(embedding_latency, seed + 2)
+        self.model_chat_latency = {
+            model: LatencyDistribution(spec, seed + 3 + i) for i, (model, spec) in enumerate(sorted((model_chat_latency or {}).items()))
+        }
+        self.prefill_seconds_per_1k_tokens = prefill_seconds_per_1k_tokens
+        self.uncited_rate = uncited_rate
+        # Answer completions per model
+        self.chat_models: Dict[str, int] = {}
+        # Prompt tokens of every answer completion, for reporting prompt size
+        self.chat_prompt_tokens: List[int] = []
+        self.embedder = FakeEmbedder()
+        self.requests = {"chat": 0, "routing": 0, "embedding": 0}
+
+    @property
+    def api_base(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _routes(self, app: web.Application) -> None:
+        app.router.add_post("/v1/chat/completions", self._chat)
+        app.router.add_post("/v1/embeddings", self._embeddings)
+        app.router.add_post("/v1/engines/{engine}/embeddings", self._embeddings)
+
+    async def _chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt_text = " ".join(str(m.get("content", "")) for m in messages)
+        max_tokens = body.get("max_tokens") or 256
+        prompt_tokens = len(prompt_text) // 4
+        if max_tokens <= 5:
+            # Routing and operationID selection calls: always pick the first option
+            self.requests["routing"] += 1
+            await asyncio.sleep(self.routing_latency.sample())
+            content = "1"
+        else:
+            self.requests["chat"] += 1
+            self.chat_prompt_tokens.append(prompt_tokens)
+            model = body.get("model", "fake")
+            self.chat_models[model] = self.chat_models.get(model, 0) + 1
+            latency = self.model_chat_latency.get(model, self.chat_latency)
+            await asyncio.sleep(latency.sample() + prompt_tokens / 1000 * self.prefill_seconds_per_1k_tokens)
+            cite = mmh3.hash(f"{model} {prompt_text}", signed=False) % 10_000 >= self.uncited_rate * 10_000
+            # Answer from the user message; echoing the system prompt would repeat its instructions
+            content = self._answer(str(messages[-1].get("content", "")) if messages else "", max_tokens, cite)
+        return self._completion(body, prompt_text, content, prompt_tokens)
+
+    @staticmethod
+    def _completion(body: dict, prompt_text: str, content: str, prompt_tokens: int) -> web.Response:
+        completion_tokens = len(content) // 4
+        return web.json_response({
+            "id": f"chatcmpl-fake-{mmh3.hash(prompt_text, signed=False)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    @staticmethod
+    def _answer(prompt_text: str, max_tokens: int, cite: bool = True) -> str:
+        # Cite the first two documents offered in the prompt, the way GPT-4 usually does
+        doc_nums = re.findall(r"doc_num: \[(\d+)\]", prompt_text)[:2] if cite else []
+        citations = " ".join(f"[{n}]" for n in doc_nums)
+        words = tokenize(prompt_text)[:max(10, max_tokens // 2)]
+        return f"According to the documentation {citations}, " + " ".join(words) + "."
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self.requests["embedding"] += 1
+        await asyncio.sleep(self.embedding_latency.sample())
+        data = [
+            {"object": "embedding", "index": i, "embedding": self.embedder.embed(text if isinstance(text, str) else json.dumps(text))}
+            for i, text in enumerate(inputs)
+        ]
+        return self._embedding_list(body, inputs, data)
+
+    @staticmethod
+    def _embedding_list(body: dict, inputs: list, data: list) -> web.Response:
+        tokens = sum(len(str(text)) // 4 for text in inputs)
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+class FakeAPIServer(LocalServer):
+
+    """Local HTTP server standing in for the APIs the API agent calls: every path answers with a JSON echo of the request"""
+
+    name = "fake-api"
+
+    def __init__(self, latency: str = "lognormal:0.2,0.3", status: int = 200, seed: int = 0, host: str = "127.0.0.1", port: int = 0):
+        """
+        Point the API agent at it with API_SERVER_OVERRIDE=server.base_url.
+
+        Args:
+            latency: latency spec for every response (see LatencyDistribution)
+            status: HTTP status every request is answered with
+            seed: seed for the latency sampler
+            host: interface to bind
+            port: port to bind, 0 picks a free one
+        """
+        super().__init__(host, port)
+        self.latency = LatencyDistribution(latency, seed)
+        self.status = status
+        # (method, path with query string) of every request, in arrival order
+        self.calls: List[tuple] = []
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _routes(self, app: web.Application) -> None:
+        app.router.add_route("*", "/{path:.*}", self._echo)
+
+    async def _echo(self, request: web.Request) -> web.Response:
+        self.calls.append((request.method, request.path_qs))
+        await asyncio.sleep(self.latency.sample())
+        return web.json_response({"method": request.method, "path": request.path, "query": dict(request.query)}, status=self.status)
+
+
+class FakeVectorIndex:
+
+    """LocalIndex wrapper that adds sampled network latency to every query, standing in for pinecone.Index"""
+
+    def __init__(self, index: LocalIndex, latency: str = "lognormal:0.06,0.3", seed: int = 0):
+        self.index = index
+        self.latency = LatencyDistribution(latency, seed)
+        self.queries = 0
+
+    def query(self, *args, **kwargs):
+        self.queries += 1
+        time.sleep(self.latency.sample())
+        return self.index.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+def build_synthetic_index(
+    embedder: FakeEmbedder,
+    namespaces: List[str],
+    vocabulary: List[str],
+    docs_per_namespace: int = 500,
+    words_per_doc: int = 250,
+    words_per_sentence: int = 15,
+    seed: int = 0,
+) -> LocalIndex:
+    """
+    Fill a LocalIndex with deterministic pseudo-documents drawn from vocabulary
+
+    Half the documents are 'soft' and half 'hard' so both doc_type queries return matches.
+    Words are grouped into sentences so sentence-level processing has something to work on.
+    """
+    rng = np.random.default_rng(seed)
+    index = LocalIndex(embedder.dimension)
+    for namespace in namespaces:
+        vectors = []
+        for i in range(docs_per_namespace):
+            words = list(rng.choice(vocabulary, words_per_doc))
+            content = " ".join(
+                " ".join(words[start:start + words_per_sentence]).capitalize() + "."
+                for start in range(0, len(words), words_per_sentence)
+            )
+            vectors.append({
+                "id": f"{namespace}-{i}",
+                "values": embedder.embed(content),
+                "sparse_values": sparse_signature(content),
+                "metadata": {
+                    "content": content,
+                    "title": f"{namespace} doc {i}",
+                    "url": f"https://docs.example.com/{namespace}/{i}",
+                    "doc_type": "soft" if i % 2 else "hard",
+                },
+            })
+        index.upsert(vectors, namespace=namespace)
+    return index
@@ -0,0 +1,135 @@
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from typing import Any, Dict, List, Optional
+
+from bench.latency import summarize
+
+
+# stage name -> (ShelbyAgent attribute, method)
+STAGES = {
+    "routing": ("action_agent", "topic_decision"),
+    "embedding": ("docs_agent", "get_query_embeddings"),
+    "retrieval": ("docs_agent", "query_vectorstore"),
+    "fan_out_retrieval": ("docs_agent", "query_namespaces"),
+    "dedupe": ("docs_agent", "dedupe_documents"),
+    "packing": ("docs_agent", "parse_documents"),
+    "compression": ("docs_agent", "compress_context"),
+    "prompt_rendering": ("docs_agent", "docs_prompt_template"),
+    "generation": ("docs_agent", "docs_prompt_llm"),
+    "citation_parsing": ("docs_agent", "append_meta"),
+}
+
+# The record of the query being timed; fan-out runs retrieval on its own threads with a copy of the query's context
+_current_record: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("bench_stage_record", default=None)
+
+
+class StageTimer:
+
+    """Wraps the agent's stage methods on one instance and attributes their wall time to the running query"""
+
+    def __init__(self):
+        self.records: List[Dict[str, float]] = []
+        self._lock = threading.Lock()
+
+    def instrument(self, agent) -> None:
+        for stage, (attr, method) in STAGES.items():
+            target = getattr(agent, attr)
+            setattr(target, method, self._wrap_stage(stage, getattr(target, method)))
+        # run_query calls self.query_thread inside one executor thread, and every thread it starts
+        # inherits its context, so a context variable ties every nested stage to its query.
+        # Fanned-out namespaces are searched in parallel: "retrieval" sums them, "fan_out_retrieval" is the wall time.
+        agent.query_thread = self._wrap_query(agent.query_thread)
+
+    def _wrap_query(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record: Dict[str, float] = {}
+            token = _current_record.set(record)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_record.reset(token)
+                with self._lock:
+                    self.records.append(record)
+        return wrapper
+
+    def _wrap_stage(self, stage: str, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record = _current_record.get()
+                if record is not None:
+                    with self._lock:
+                        record[stage] = record.get(stage, 0.0) + time.perf_counter() - start
+        return wrapper
+
+
+async def drive(agent, queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """
+    Run every query through agent.run_query with at most concurrency in flight
+
+    Returns: per-query latencies in seconds, error messages and total wall time
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(query: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await agent.run_query(query)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return {"latencies": latencies, "errors": errors, "wall_seconds": time.perf_counter() - start}
+
+
+def report(run: Dict[str, Any], timer: StageTimer, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    stages = {
+        stage: summarize([r[stage] for r in timer.records if stage in r])
+        for stage in STAGES
+    }
+    completed = len(run["latencies"])
+    return {
+        **(extra or {}),
+        "completed": completed,
+        "errors": len(run["errors"]),
+        "error_samples": run["errors"][:5],
+        "wall_seconds": run["wall_seconds"],
+        "throughput_qps": completed / run["wall_seconds"] if run["wall_seconds"] else 0.0,
+        "latency": summarize(run["latencies"]),
+        "stages": stages,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change of p50/p95/p99 per stage and end to end versus a previous result file."""
+    def delta(cur, base):
+        return {
+            key: (cur[key] - base[key]) / base[key]
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+            if key in cur and base.get(key)
+        }
+
+    return {
+        "baseline_commit": baseline.get("git_commit"),
+        "latency": delta(current["latency"], baseline.get("latency", {})),
+        "throughput_qps": (
+            (current["throughput_qps"] - baseline["throughput_qps"]) / baseline["throughput_qps"]
+            if baseline.get("throughput_qps") else None
+        ),
+        "stages": {
+            stage: delta(summary, baseline.get("stages", {}).get(stage, {}))
+            for stage, summary in current["stages"].items()
+        },
+    }
@@ -0,0 +1,60 @@
+import random
+import threading
+import numpy as np
+from typing import Dict, List
+
+
+class LatencyDistribution:
+
+    """Seeded latency sampler parsed from a short spec string"""
+
+    def __init__(self, spec: str = "constant:0", seed: int = 0):
+        """
+        Supported specs, all values in seconds:
+            constant:<s>
+            uniform:<low>,<high>
+            normal:<mean>,<stddev>
+            lognormal:<median>,<sigma>    (long right tail, closest to real API latency)
+
+        Args:
+            spec: distribution spec
+            seed: random seed so runs are reproducible
+        """
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        if kind not in ("constant", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            match self.kind:
+                case "constant":
+                    value = self.params[0] if self.params else 0.0
+                case "uniform":
+                    value = self._rng.uniform(*self.params)
+                case "normal":
+                    value = self._rng.gauss(*self.params)
+                case "lognormal":
+                    median, sigma = self.params
+                    value = median * self._rng.lognormvariate(0.0, sigma)
+        return max(0.0, value)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of a list of seconds, reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(samples),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(values.mean()),
+        "max_ms": float(values.max()),
+    }
@@ -0,0 +1,242 @@
+import re
+import time
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import mmh3
+import numpy as np
+from aiohttp import web
+
+from bench.fake_services import FakeOpenAIServer, tokenize
+from runtime import QueryQueue
+from vectorstore import QueryResponse, ScoredVector
+from vectorstore.local_index import normalize_namespace
+
+
+# The query inside the routing and docs prompts (see topic_prompt_template and docs_prompt_template)
+_prompt_query = re.compile(r"^(?:user query|Query): (.*?) (?:topics|Documents): ", re.DOTALL)
+
+
+class Recording:
+
+    """Traffic written by TrafficRecorder: arrivals in order, and what each recorded query got back"""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        """
+        Arrivals come from the bots' request lines when there are any, since those keep the time a
+        message came in before it queued; otherwise from the query lines. Stand-ins find a query's
+        record by its text, and retrieval finds it by the embedding handed out for that text.
+
+        Args:
+            records: lines of a traffic file (see read_traffic)
+        """
+        queries = [r for r in records if r.get("kind") == "query" and r.get("query")]
+        requests = [r for r in records if r.get("kind") == "request" and r.get("query")]
+        # Repeated questions keep their latest run; coalesced ones ran nothing of their own
+        self.queries: Dict[str, Dict[str, Any]] = {r["query"]: r for r in queries if not r.get("coalesced")}
+        if requests:
+            arrivals = [(r["ts"], r["query"], r.get("user"), None) for r in requests]
+        else:
+            arrivals = [(r["ts"], r["query"], None, r.get("topic") if r.get("topic_given") else None) for r in queries]
+        # (timestamp, query, hashed user, topic the caller chose)
+        self.arrivals: List[Tuple[float, str, Optional[str], Optional[str]]] = sorted(arrivals, key=lambda a: a[0])
+        namespaces = {r["topic"] for r in self.queries.values() if r.get("topic")}
+        namespaces.update(ns for r in self.queries.values() for ns in r.get("retrieved", {}) if ns)
+        # Routing replies index into this list; the replaying agent must be configured with the same order
+        self.namespaces = sorted(namespaces)
+        self._by_embedding: Dict[bytes, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(vector) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    def for_prompt(self, prompt: str) -> Optional[Dict[str, Any]]:
+        match = _prompt_query.match(prompt)
+        return self.queries.get(match.group(1)) if match else None
+
+    def handed_out(self, vector, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._by_embedding[self._key(vector)] = record
+
+    def for_embedding(self, vector) -> Optional[Dict[str, Any]]:
+        return self._by_embedding.get(self._key(vector))
+
+
+class ReplayOpenAIServer(FakeOpenAIServer):
+
+    """FakeOpenAIServer answering recorded queries with their recorded routing, latencies and token counts"""
+
+    def __init__(self, recording: Recording, **kwargs):
+        """
+        A recorded query's embedding comes back after its recorded embedding stage time, its routing
+        call picks the topic it was routed to, and its answer takes the recorded completion latency for
+        the model asked, runs to about the recorded completion length and cites documents only if the
+        original did. Anything not in the recording gets the synthetic behaviour of FakeOpenAIServer.
+
+        Args:
+            recording: recorded traffic
+            kwargs: FakeOpenAIServer arguments, used for unrecorded requests
+        """
+        super().__init__(**kwargs)
+        self.recording = recording
+        self.requests["replayed"] = 0
+
+    async def _chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        record = self.recording.for_prompt(prompt)
+        completions = record.get("completions", []) if record else []
+        max_tokens = body.get("max_tokens") or 256
+        model = body.get("model", "fake")
+        if max_tokens <= 5:
+            completion = next((c for c in completions if c[0] == "topic_decision"), None)
+        else:
+            answers = [c for c in completions if c[0] != "topic_decision"]
+            completion = next((c for c in answers if c[1] == model), answers[0] if answers else None)
+        if completion is None:
+            return await super()._chat(request)
+
+        self.requests["replayed"] += 1
+        _, _, seconds, prompt_tokens, completion_tokens = completion
+        await asyncio.sleep(seconds)
+        if max_tokens <= 5:
+            self.requests["routing"] += 1
+            topic = record.get("topic")
+            content = str(self.recording.namespaces.index(topic) + 1) if topic in self.recording.namespaces else "0"
+        else:
+            self.requests["chat"] += 1
+            self.chat_prompt_tokens.append(prompt_tokens)
+            self.chat_models[model] = self.chat_models.get(model, 0) + 1
+            content = self._answer(prompt, 2 * (completion_tokens or max_tokens), record.get("cited", 1) > 0)
+        return self._completion(body, prompt, content, prompt_tokens)
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        record = self.recording.queries.get(inputs[0]) if len(inputs) == 1 and isinstance(inputs[0], str) else None
+        if record is None:
+            return await super()._embeddings(request)
+
+        self.requests["embedding"] += 1
+        self.requests["replayed"] += 1
+        await asyncio.sleep(record.get("stages", {}).get("get_query_embeddings", 0.0))
+        embedding = self.embedder.embed(inputs[0])
+        self.recording.handed_out(embedding, record)
+        return self._embedding_list(body, inputs, [{"object": "embedding", "index": 0, "embedding": embedding}])
+
+
+@lru_cache(maxsize=4096)
+def _replay_content(vector_id: str, query: str, chars: int) -> str:
+    # Text of the recorded length, drawn from the query's words so retrieval-side processing has something realistic to chew on
+    words = tokenize(query) or ["replay"]
+    rng = np.random.default_rng(mmh3.hash(vector_id, signed=False))
+    sentences = []
+    length = 0
+    while length < chars:
+        sentence = " ".join(rng.choice(words, 15)).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)[:max(chars, 1)]
+
+
+class ReplayVectorIndex:
+
+    """Stand-in for pinecone.Index returning the IDs, scores and document sizes recorded for each query"""
+
+    def __init__(self, recording: Recording):
+        """
+        Queries are matched to their record through the embedding ReplayOpenAIServer handed out for
+        them; unknown vectors get no matches. Each call sleeps for the recorded retrieval stage time
+        split evenly over the calls it made (a soft and a hard query per namespace), so it is only as
+        exact as that split.
+
+        Args:
+            recording: recorded traffic
+        """
+        self.recording = recording
+        self.queries = 0
+        self.unknown = 0
+
+    def version(self, namespace) -> int:
+        # Recorded matches never change, so cached retrievals stay valid
+        return 0
+
+    def query(self, top_k: int = 10, vector=None, namespace="", filter=None, include_metadata: bool = False, **kwargs) -> QueryResponse:
+        self.queries += 1
+        namespace = normalize_namespace(namespace)
+        record = self.recording.for_embedding(vector) if vector is not None else None
+        if record is None:
+            self.unknown += 1
+            return QueryResponse([], namespace)
+        retrieved = record.get("retrieved", {})
+        time.sleep(record.get("stages", {}).get("query_vectorstore", 0.0) / (2 * max(1, len(retrieved))))
+        doc_type = ((filter or {}).get("doc_type") or {}).get("$eq")
+        matches = []
+        for vector_id, score, match_type, chars in retrieved.get(namespace, []):
+            if doc_type is not None and match_type != doc_type:
+                continue
+            metadata = None
+            if include_metadata:
+                metadata = {
+                    "content": _replay_content(vector_id, record["query"], chars),
+                    "title": vector_id,
+                    "url": f"https://replay.invalid/{namespace}/{vector_id}",
+                    "doc_type": match_type,
+                }
+            matches.append(ScoredVector(id=vector_id, score=score, metadata=metadata))
+        return QueryResponse(matches[:top_k], namespace)
+
+
+async def replay(agent, arrivals: List[Tuple[float, str, Optional[str], Optional[str]]], speed: float = 1.0, concurrency: int = 4, queue: Optional[QueryQueue] = None) -> Dict[str, Any]:
+    """
+    Re-issue recorded arrivals against agent.run_query
+
+    With speed above 0 queries are sent open-loop at their recorded offsets divided by speed (2.0
+    replays twice as fast), however many are still in flight; latency counts from the scheduled
+    send time, so falling behind shows up in it. With speed 0 they are sent back to back with at
+    most concurrency in flight. Given a queue, queries go through it under their recorded users, as
+    they did through the bots.
+
+    Returns: per-query latencies in seconds, error messages and total wall time, as bench.harness.drive
+    """
+    latencies: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(concurrency) if speed <= 0 else None
+
+    async def one(query: str, user: str, topic: Optional[str], scheduled: float):
+        try:
+            if queue is not None:
+                await queue.submit(user, lambda: agent.run_query(query, topic))
+            else:
+                await agent.run_query(query, topic)
+            latencies.append(time.perf_counter() - scheduled)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    async def bounded(query: str, user: str, topic: Optional[str]):
+        async with semaphore:
+            await one(query, user, topic, time.perf_counter())
+
+    start = time.perf_counter()
+    tasks = []
+    if arrivals:
+        first = arrivals[0][0]
+        for i, (ts, query, user, topic) in enumerate(arrivals):
+            # Queries recorded without a user (not through a bot) each count as their own
+            user = user or f"replay-{i}"
+            if semaphore is not None:
+                tasks.append(asyncio.create_task(bounded(query, user, topic)))
+                continue
+            scheduled = start + (ts - first) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(query, user, topic, scheduled)))
+    await asyncio.gather(*tasks)
+    return {"latencies": latencies, "errors": errors, "wall_seconds": time.perf_counter() - start}
@@ -0,0 +1,36 @@
+#region
+# system imports
+import os, time, argparse
+
+# imports from bot app
+from configuration.shelby_agent_config import AppConfig
+from vectorstore import LocalIndex, ContentStore
+from vectorstore import count_document_tokens
+#endregion
+
+
+def parse_args():
+    agent_config = AppConfig()
+    parser = argparse.ArgumentParser(description="Copy document content out of a local vectorstore mirror into the SQLite content store.")
+    parser.add_argument('--index', default=agent_config.local_vectorstore_path, help="directory written by LocalIndex.save")
+    parser.add_argument('--output', default=agent_config.content_store_path or 'data/content_store.sqlite')
+    parser.add_argument('--namespaces', help="comma separated namespaces to copy (defaults to all)")
+    parser.add_argument('--encoding-model', action='append', help="model whose token counts are stored with each document, repeatable (defaults to the configured tiktoken_encoding_model)")
+    return parser.parse_args()
+
+
+def main(args):
+    start = time.perf_counter()
+    index = LocalIndex.load(args.index, mmap=True)
+    namespaces = [ns.strip() for ns in args.namespaces.split(',')] if args.namespaces else None
+    models = args.encoding_model or [AppConfig().tiktoken_encoding_model]
+    store = ContentStore(args.output)
+    copied = store.import_index(index, namespaces, count_tokens=lambda text: count_document_tokens(text, models))
+    for name, count in copied.items():
+        print(f"{name or '(default)'}: {count} documents")
+    print(f"wrote {sum(copied.values())} documents to {args.output} in {time.perf_counter() - start:.1f}s ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+    print(f"set CONTENT_STORE_PATH={args.output} to serve retrieval from it")
+
+
+if __name__ == "__main__":
+    main(parse_args())
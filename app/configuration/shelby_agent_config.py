@@ -10,20 +10,89 @@ load_dotenv()
 class AppConfig(BaseModel):
     tiktoken_encoding_model: Optional[str] = 'text-embedding-ada-002'
     openai_timeout_seconds: float = 180.0
+    # Per-model quotas enforced by the OpenAI scheduler, as JSON: {"model": {"rpm": n, "tpm": n}}
+    openai_rate_limits = json.loads(os.getenv('OPENAI_RATE_LIMITS', json.dumps({
+        'gpt-4': {'rpm': 200, 'tpm': 40000},
+        'gpt-3.5-turbo': {'rpm': 3500, 'tpm': 90000},
+        'text-embedding-ada-002': {'rpm': 3000, 'tpm': 1000000},
+    })))
+    openai_max_retries = int(os.getenv('OPENAI_MAX_RETRIES', '5'))
+    # Concurrent identical queries share one pipeline run
+    coalesce_queries: bool = os.getenv('COALESCE_QUERIES', 'true').lower() in ('1', 'true', 'yes')
+    # End-to-end budget per query; every stage's timeout is what is left of it
+    query_deadline_seconds = float(os.getenv('QUERY_DEADLINE_SECONDS', '60'))
+    # Below this much remaining budget the docs agent skips the LLM and answers with retrieved docs only
+    min_generation_seconds = float(os.getenv('MIN_GENERATION_SECONDS', '5'))
+    # Append every request and query (topic, retrieved IDs and scores, tokens, stage timings) to this file for replay_traffic.py; empty disables recording
+    traffic_record_path: str = os.getenv('TRAFFIC_RECORD_PATH', '')
+    # Repeated questions are answered from memory until a namespace searched for them is re-ingested or the answer
+    # is this old. Off (0) by default; set e.g. ANSWER_CACHE_TTL_SECONDS=3600 to enable it, and to serve the answers
+    # warm-up fills in. On Pinecone only app/ingest.py bumps the version stamps, so enable it only if nothing else writes.
+    answer_cache_ttl_seconds = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '0'))
+    answer_cache_size = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+    # Before taking queries the bots answer the most frequent questions in this history (a traffic recording,
+    # JSONL or one question per line; defaults to traffic_record_path) to fill the caches, within the time and token budget
+    warmup_questions_path: str = os.getenv('WARMUP_QUESTIONS_PATH', '')
+    warmup_max_questions = int(os.getenv('WARMUP_MAX_QUESTIONS', '50'))
+    warmup_max_seconds = float(os.getenv('WARMUP_MAX_SECONDS', '120'))
+    warmup_max_tokens = int(os.getenv('WARMUP_MAX_TOKENS', '50000'))
     # llm_model: str = 'gpt-4'
     # tiktoken_encoding_model: str = 'gpt-4'
     prompt_template_path: Optional[str] = 'app/prompt_templates/'
     # DocsAgent
     embedding_model: Optional[str] = 'text-embedding-ada-002'
     docs_llm_model: str = 'gpt-4'
+    # Answer easy questions with docs_cascade_model first, escalating to docs_llm_model when its answer cites nothing or hedges
+    docs_cascade: bool = os.getenv('DOCS_CASCADE', 'false').lower() in ('1', 'true', 'yes')
+    docs_cascade_model: str = os.getenv('DOCS_CASCADE_MODEL', 'gpt-3.5-turbo')
+    # Easy means the best doc scores at least this, no more than cascade_max_strong_documents score as high, and the query is short
+    cascade_min_top_score = float(os.getenv('CASCADE_MIN_TOP_SCORE', '0.8'))
+    cascade_max_strong_documents = int(os.getenv('CASCADE_MAX_STRONG_DOCUMENTS', '2'))
+    cascade_max_query_words = int(os.getenv('CASCADE_MAX_QUERY_WORDS', '30'))
     vectorstore_environment: Optional[str] = 'us-central1-gcp'
     vectorstore_top_k: int = 3
     vectorstore_index: Optional[str] = os.getenv('PINECONE_INDEX')
     namespaces_str = os.getenv('NAMESPACES', '{}')
     vectorstore_namespaces = json.loads(namespaces_str)
     max_docs_tokens: int = 5000
+    # Trim retrieved docs to their sentences most relevant to the query before prompting
+    compress_context: bool = os.getenv('COMPRESS_CONTEXT', 'false').lower() in ('1', 'true', 'yes')
+    compressed_docs_tokens = int(os.getenv('COMPRESSED_DOCS_TOKENS', '2000'))
     max_docs_used = int(os.getenv('MAX_DOCS_USED', '3'))
+    # Retrieved docs (and ingested chunks) whose estimated Jaccard similarity over word shingles reaches this are near-duplicates; 0 keeps them all
+    dedupe_threshold = float(os.getenv('DEDUPE_THRESHOLD', '0.9'))
+    dedupe_shingle_size = int(os.getenv('DEDUPE_SHINGLE_SIZE', '5'))
     max_response_tokens = int(os.getenv('MAX_RESPONSE_TOKENS', '300'))
+    # When routing finds no clear topic, search this many of the closest namespaces at once. Off (0, namespace 0 is
+    # searched as before) by default; set e.g. FANOUT_NAMESPACES=3 to enable it
+    fanout_namespaces = int(os.getenv('FANOUT_NAMESPACES', '0'))
+    # 'pinecone', 'local' (exact search over a mirrored index) or 'local_ivf' (approximate search)
+    vectorstore_backend: str = os.getenv('VECTORSTORE_BACKEND', 'pinecone')
+    local_vectorstore_path: str = os.getenv('LOCAL_VECTORSTORE_PATH', 'data/local_vectorstore/')
+    ivf_n_probe = int(os.getenv('IVF_N_PROBE', '8'))
+    ivf_rerank_factor = int(os.getenv('IVF_RERANK_FACTOR', '4'))
+    # Reuse vectorstore matches for repeated or reworded queries until the namespace is re-ingested
+    retrieval_cache: bool = os.getenv('RETRIEVAL_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    retrieval_cache_max_mb = float(os.getenv('RETRIEVAL_CACHE_MAX_MB', '64'))
+    retrieval_cache_ttl_seconds = float(os.getenv('RETRIEVAL_CACHE_TTL_SECONDS', '600'))
+    retrieval_cache_lsh_bits = int(os.getenv('RETRIEVAL_CACHE_LSH_BITS', '16'))
+    retrieval_cache_min_similarity = float(os.getenv('RETRIEVAL_CACHE_MIN_SIMILARITY', '0.95'))
+    # Namespace version stamps bumped by ingestion; Pinecone has no write counter of its own
+    vectorstore_versions_path: str = os.getenv('VECTORSTORE_VERSIONS_PATH', 'data/vectorstore_versions.json')
+    # SQLite file with document content by vector ID; when set, queries fetch IDs and scores only
+    content_store_path: str = os.getenv('CONTENT_STORE_PATH', '')
+    # Local index answering while Pinecone's circuit breaker is open; empty disables the fallback
+    vectorstore_fallback_path: str = os.getenv('VECTORSTORE_FALLBACK_PATH', '')
+    # Embedding and vectorstore calls slower than this percentile of recent ones get a duplicate request, at most
+    # hedge_max_ratio extra requests per call. Off by default; set HEDGE_REQUESTS=true to enable it
+    hedge_requests: bool = os.getenv('HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+    hedge_percentile = float(os.getenv('HEDGE_PERCENTILE', '95'))
+    hedge_max_ratio = float(os.getenv('HEDGE_MAX_RATIO', '0.1'))
+    # Breakers open when this share of the last breaker_window calls failed
+    breaker_failure_threshold = float(os.getenv('BREAKER_FAILURE_THRESHOLD', '0.5'))
+    breaker_window = int(os.getenv('BREAKER_WINDOW', '20'))
+    breaker_min_calls = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+    breaker_reset_seconds = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
     # APIAgent
     select_operationID_llm_model: str = 'gpt-4'
     create_function_llm_model: str = 'gpt-4'
@@ -31,5 +100,26 @@ class AppConfig(BaseModel):
     # select_endpoint_llm_model: str = 'gpt-3.5-turbo-16k-0613'
     action_llm_model: str = 'gpt-4'
     API_spec_path: str = 'data/minified_openAPI_specs/'
+    # Generated calls are checked and repaired locally; the model is asked again only with what is still wrong, at most this many times
+    API_reprompt_attempts = int(os.getenv('API_REPROMPT_ATTEMPTS', '1'))
+    # Generated API calls share one pooled HTTP session per process
+    API_max_connections = int(os.getenv('API_MAX_CONNECTIONS', '20'))
+    API_max_connections_per_host = int(os.getenv('API_MAX_CONNECTIONS_PER_HOST', '5'))
+    API_timeout_seconds = float(os.getenv('API_TIMEOUT_SECONDS', '10'))
+    API_connect_timeout_seconds = float(os.getenv('API_CONNECT_TIMEOUT_SECONDS', '3'))
+    # Successful GET responses are reused for this long; 0 disables
+    API_cache_ttl_seconds = float(os.getenv('API_CACHE_TTL_SECONDS', '30'))
+    API_cache_size = int(os.getenv('API_CACHE_SIZE', '256'))
+    API_max_response_bytes = int(os.getenv('API_MAX_RESPONSE_BYTES', '1000000'))
+    # Scheme and host every generated call is sent to instead of the spec's server, e.g. a local mock server; empty sends them to the real API
+    API_server_override: str = os.getenv('API_SERVER_OVERRIDE', '')
+    # Bots
+    # Agent worker processes behind the bot: 0 runs the agent in the bot process, 'auto' one per available core.
+    # Each worker gets an equal share of OPENAI_RATE_LIMITS
+    agent_processes: str = os.getenv('AGENT_PROCESSES', '0')
+    query_workers = int(os.getenv('QUERY_WORKERS', '4'))
+    query_queue_size = int(os.getenv('QUERY_QUEUE_SIZE', '50'))
+    query_max_wait_seconds = float(os.getenv('QUERY_MAX_WAIT_SECONDS', '120'))
+    query_max_per_user = int(os.getenv('QUERY_MAX_PER_USER', '3'))
 
 
@@ -61,6 +61,10 @@ config['payload']['workload']['spec']['containers']['webserver']['env'] = {
     },
     'DISCORD_CHANNEL_ID': {
         'value': os.getenv('DISCORD_CHANNEL_ID')
+    },
+    # The readiness probe reaches /ready from outside the container
+    'METRICS_HOST': {
+        'value': '0.0.0.0'
     }
 }
 
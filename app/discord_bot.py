@@ -8,7 +8,10 @@ import discord
 from discord.ext import commands
 
 from logger import setup_logger
-from agents.async_shelby_agent import ShelbyAgent
+from agents.async_shelby_agent import create_query_runner
+from configuration.shelby_agent_config import AppConfig
+from telemetry import start_metrics_server, TrafficRecorder
+from runtime import QueryQueue, QueueRejected, set_ready, is_ready
 
 logger = setup_logger('discord_bot', 'discord_bot.log', level=logging.DEBUG)
 
@@ -22,6 +25,14 @@ load_dotenv()
 bot_token = os.getenv('DISCORD_TOKEN')
 channel_id = int(os.environ['DISCORD_CHANNEL_ID'])
 
+# Prometheus metrics endpoint, set METRICS_PORT=0 to disable
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(os.getenv('METRICS_PORT', '9464'))
+
+def serve_worker_metrics(index):
+    # Agent worker processes serve their own metrics on the ports after the bot's
+    if metrics_port:
+        start_metrics_server(metrics_port + 1 + index, metrics_host)
 
 def create_bot():
     intents = discord.Intents.default()
@@ -31,6 +42,14 @@ def create_bot():
 
 bot = create_bot()
 
+async def warm_up():
+    # Runs after login and before the gateway connects, so messages only arrive once the caches are warm
+    summary = await agent.warm_up()
+    logger.info(f"warmed up: {summary}")
+    set_ready()
+
+bot.setup_hook = warm_up
+
 @bot.event
 async def on_guild_join(guild):
     if not any(channel.id == channel_id for channel in guild.channels):
@@ -57,8 +76,7 @@ async def on_ready():
 
 @bot.event
 async def on_message(message):
-    print(message)
-    print(message.content)
+    logger.debug("message: %s content: %s", message, message.content)
     if bot.user.mentioned_in(message):
         # don't respond to ourselves
         if message.author == bot.user.id:
@@ -77,15 +95,29 @@ async def on_message(message):
             logger.info('Message too short.')
             await message.channel.send(f"{message.author.name}, brevity is the soul of wit, but not of good queries. Please provide more details in your request.")
             return
-        logger.info(f'Message received: {message.content} (From: {message.author.name})')
+        logger.info('Message received: %s (From: %s)', message.content, message.author.name)
+        if traffic_recorder is not None:
+            traffic_recorder.request('discord', message.author.id, query)
+        # Queue before creating a thread so a full queue is reported instead of a promise to answer
+        try:
+            job = query_queue.submit(message.author.id, lambda: agent.run_query(query))
+        except QueueRejected as e:
+            await message.channel.send(f"{message.author.name}, {e}")
+            return
         # Create thread
         random_animal = await get_random_animal()
         thread = await message.create_thread(name=f"{random_animal} by {message.author.name}", auto_archive_duration=60)
         message_start = "Running query. Relax, chill, and vibe a minute."
+        position = job.position()
+        if position:
+            message_start += f" You're number {position} in the queue."
         await thread.send(message_start)
         
         try:
-            query_response = await agent.run_query(query)
+            query_response = await job
+        except QueueRejected as e:
+            await thread.send(str(e))
+            return
         except Exception as e:
             tb = traceback.format_exc()
             logger.error(f"An error occurred: {str(e)}. Traceback: {tb}")
@@ -94,7 +126,7 @@ async def on_message(message):
 
         # Parse for discord and then respond
         parsed_reponse = parse_discord_markdown(query_response)
-        logger.info(f'Parsed output: {parsed_reponse})')
+        logger.info('Parsed output: %s', parsed_reponse)
         await thread.send(parsed_reponse)
 
         message_end = f"Generated by: {query_response['llm']}\nMemory not enabled. Has no knowledge of past or current queries.\nFor code see https://github.com/ShelbyJenkins/shelby-as-a-service."
@@ -124,7 +156,21 @@ async def get_random_animal():
     return random.choice(animals).strip().lower()
 
 if __name__ == "__main__":
-    agent = ShelbyAgent()
+    agent_config = AppConfig()
+    # Forks agent workers when AGENT_PROCESSES is set, so it runs before any other thread is started
+    agent = create_query_runner(agent_config, worker_init=serve_worker_metrics)
+    # Sits between on_message and the agent so a flood of mentions can't start unbounded pipelines
+    query_queue = QueryQueue(
+        workers=agent_config.query_workers,
+        capacity=agent_config.query_queue_size,
+        max_wait_seconds=agent_config.query_max_wait_seconds,
+        max_per_user=agent_config.query_max_per_user
+    )
+    # Arrivals for replay_traffic.py, when TRAFFIC_RECORD_PATH is set
+    traffic_recorder = TrafficRecorder(agent_config.traffic_record_path) if agent_config.traffic_record_path else None
+    if metrics_port:
+        start_metrics_server(metrics_port, metrics_host, ready=is_ready)
+        logger.info(f"metrics served on http://{metrics_host}:{metrics_port}/metrics")
     # Runs the bot through the asyncio.run() function built into the library
     bot.run(bot_token)
 
@@ -0,0 +1,140 @@
+#region
+# system imports
+import os, json, argparse, itertools
+
+# imports from pip
+import pinecone
+
+# imports from bot app
+from configuration.shelby_agent_config import AppConfig
+from pinecone_text.sparse import BM25Encoder
+from runtime import OpenAIScheduler, Priority, request_priority
+from vectorstore import LocalIndex, ContentStore, VersionStamps, NearDuplicateIndex
+from ingestion import IngestionPipeline, Checkpoint, Manifest, iter_documents, source_files, fingerprint, chunk_document
+#endregion
+
+
+def parse_args():
+    agent_config = AppConfig()
+    parser = argparse.ArgumentParser(description="Chunk, encode and upsert source documents into a vectorstore namespace, resumably.")
+    parser.add_argument('sources', nargs='+', help="JSONL files (one document per line) or directories of .md/.txt/.html/.jsonl files")
+    parser.add_argument('--namespace', required=True)
+    parser.add_argument('--doc-type', default='soft', help="doc_type for documents that don't set one")
+    parser.add_argument('--local', nargs='?', const=agent_config.local_vectorstore_path, help="write to a LocalIndex saved at this directory instead of Pinecone")
+    parser.add_argument('--content-store', default=agent_config.content_store_path, help="SQLite content store to write chunk text to as well")
+    parser.add_argument('--versions-path', default=agent_config.vectorstore_versions_path, help="version stamp file bumped when the run finishes")
+    parser.add_argument('--state-dir', help="checkpoint, BM25 parameters and chunk manifest (defaults to data/ingestion/<namespace>)")
+    parser.add_argument('--restart', action='store_true', help="ignore the saved checkpoint and BM25 parameters (every chunk is then written again)")
+    parser.add_argument('--full', action='store_true', help="re-embed and upsert every chunk instead of only new and changed ones, and delete nothing")
+    parser.add_argument('--chunk-tokens', type=int, default=400)
+    parser.add_argument('--overlap-tokens', type=int, default=50)
+    parser.add_argument('--encoding-model', action='append', help="model whose token counts are stored with each chunk, repeatable (defaults to the configured tiktoken_encoding_model)")
+    parser.add_argument('--dedupe-threshold', type=float, default=agent_config.dedupe_threshold, help="estimated Jaccard similarity at which chunks are collapsed into one, 0 keeps them all")
+    parser.add_argument('--shingle-size', type=int, default=agent_config.dedupe_shingle_size, help="words per shingle for near-duplicate detection")
+    parser.add_argument('--dense-encoder', default='openai', help="'openai' for the configured embedding_model, or a sentence-transformers model name")
+    parser.add_argument('--bm25-fit-chunks', type=int, default=2000, help="chunks the BM25 parameters are fitted on at the start of a run")
+    parser.add_argument('--embed-batch-size', type=int, default=64)
+    parser.add_argument('--upsert-batch-size', type=int, default=100)
+    parser.add_argument('--encode-workers', type=int, default=2)
+    parser.add_argument('--upsert-workers', type=int, default=4)
+    parser.add_argument('--queue-batches', type=int, default=8, help="batches buffered between stages")
+    parser.add_argument('--checkpoint-seconds', type=float, default=30.0)
+    return parser.parse_args()
+
+
+def dense_encoder(name, agent_config):
+    if name != 'openai':
+        from pinecone_text.dense.sentence_transformer_encoder import SentenceTransformerEncoder
+        return SentenceTransformerEncoder(name).encode_documents
+    scheduler = OpenAIScheduler(agent_config.openai_rate_limits, agent_config.openai_max_retries)
+
+    def embed(texts):
+        response = scheduler.embedding(model=agent_config.embedding_model, input=texts, request_timeout=agent_config.openai_timeout_seconds)
+        return [item['embedding'] for item in sorted(response['data'], key=lambda item: item['index'])]
+    return embed
+
+
+def sparse_encoder(params_path, sample_chunks, on_fit=None):
+    # Fitted once per namespace and kept, so a resumed run encodes with the same parameters.
+    # on_fit runs before new parameters are saved, so a run interrupted in between fits again.
+    encoder = BM25Encoder()
+    if os.path.exists(params_path):
+        return encoder.load(params_path)
+    encoder.fit([chunk['content'] for chunk in sample_chunks])
+    if on_fit is not None:
+        on_fit()
+    os.makedirs(os.path.dirname(os.path.abspath(params_path)), exist_ok=True)
+    encoder.dump(params_path)
+    return encoder
+
+
+def print_progress(summary):
+    rates = ", ".join(f"{stage} {stats['docs_per_second']:.1f} docs/s" for stage, stats in summary['stages'].items())
+    print(f"[{summary['elapsed_seconds']:.0f}s] {summary['documents_done']} documents done; {rates}", flush=True)
+
+
+def main(args):
+    agent_config = AppConfig()
+    state_dir = args.state_dir or os.path.join('data', 'ingestion', args.namespace)
+    checkpoint_path = os.path.join(state_dir, 'checkpoint.json')
+    params_path = os.path.join(state_dir, 'bm25_params.json')
+    if args.restart:
+        for path in (checkpoint_path, params_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    manifest = None if args.full else Manifest(os.path.join(state_dir, 'manifest.sqlite'))
+    embedding_model = agent_config.embedding_model if args.dense_encoder == 'openai' else args.dense_encoder
+
+    files = source_files(args.sources)
+    checkpoint = Checkpoint(checkpoint_path, fingerprint(files), args.namespace)
+    if checkpoint.start:
+        print(f"resuming after {checkpoint.start} documents")
+    models = args.encoding_model or [agent_config.tiktoken_encoding_model]
+
+    def chunker(document):
+        return chunk_document(document, args.chunk_tokens, args.overlap_tokens, models)
+
+    sample = itertools.islice((chunk for document in iter_documents(files, args.doc_type) for chunk in chunker(document)), args.bm25_fit_chunks)
+    # Chunks written with earlier parameters would no longer score consistently with new ones
+    sparse = sparse_encoder(params_path, sample, on_fit=lambda: manifest.expire(args.namespace) if manifest is not None else None)
+
+    save_index = None
+    if args.local is not None:
+        index = LocalIndex.load(args.local) if os.path.exists(os.path.join(args.local, 'index.json')) else LocalIndex()
+        save_index = lambda: index.save(args.local)
+    else:
+        pinecone.init(api_key=os.getenv("PINECONE_API_KEY"), environment=agent_config.vectorstore_environment)
+        index = pinecone.Index(agent_config.vectorstore_index)
+
+    pipeline = IngestionPipeline(
+        index,
+        chunker,
+        dense_encoder(args.dense_encoder, agent_config),
+        sparse,
+        namespace=args.namespace,
+        checkpoint=checkpoint,
+        content_store=ContentStore(args.content_store) if args.content_store else None,
+        manifest=manifest,
+        near_duplicates=NearDuplicateIndex(args.dedupe_threshold, args.shingle_size) if args.dedupe_threshold > 0 else None,
+        embedding_model=embedding_model,
+        save_index=save_index,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        encode_workers=args.encode_workers,
+        upsert_workers=args.upsert_workers,
+        queue_batches=args.queue_batches,
+        checkpoint_seconds=args.checkpoint_seconds,
+    )
+    # Leave interactive queries in this process (and the shared quota) ahead of bulk embedding
+    with request_priority(Priority.BACKGROUND):
+        summary = pipeline.run(iter_documents(files, args.doc_type), on_progress=print_progress)
+    # Cached retrievals for the namespace are stale now
+    VersionStamps.bump(args.versions_path, args.namespace)
+    print_progress(summary)
+    print(f"{summary['unchanged_chunks']} chunks unchanged, {summary['near_duplicate_chunks']} near-duplicates dropped, {summary['reused_embeddings']} embeddings reused, {summary['deleted_chunks']} stale chunks deleted")
+    print(json.dumps(summary['stages'], indent=2))
+
+
+if __name__ == "__main__":
+    main(parse_args())
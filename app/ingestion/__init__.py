@@ -0,0 +1,15 @@
+"""
+# Ingestion
+
+Streams source documents into the vectorstore. `iter_documents` reads JSONL and text sources,
+`chunk_document` splits them into sentence-aligned chunks with stored token counts, and
+`IngestionPipeline` encodes and upserts the chunks through bounded stage queues, saving a
+`Checkpoint` so an interrupted run resumes where it stopped. A `Manifest` of content-addressed
+chunk IDs and cached embeddings makes re-ingestion incremental.
+"""
+
+from ingestion.sources import iter_documents, source_files, fingerprint
+from ingestion.chunking import chunk_document
+from ingestion.checkpoint import Checkpoint
+from ingestion.manifest import Manifest
+from ingestion.pipeline import IngestionPipeline, StageStats
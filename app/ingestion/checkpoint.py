@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Optional
+
+
+class Checkpoint:
+
+    """Progress of an ingestion run, saved so an interrupted run resumes where it stopped"""
+
+    def __init__(self, path: str, fingerprint: str, namespace: str):
+        """
+        Progress is the number of leading source documents whose chunks have all been written.
+        Upserts finish out of order, so documents past that point may be partly written when the
+        run stops; they are written again on resume, which only overwrites vectors with the same
+        IDs. A saved checkpoint is used only if the sources and namespace are unchanged. run_id
+        identifies the run across resumes; the manifest stamps the chunks a run has seen with it.
+
+        Args:
+            path: JSON file holding the progress
+            fingerprint: identifies the source files (see sources.fingerprint)
+            namespace: namespace being written
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.namespace = namespace
+        self.start = 0
+        self.run_id = f"{time.time():.6f}"
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+            if state.get("fingerprint") == fingerprint and state.get("namespace") == namespace:
+                self.start = state["documents_done"]
+                self.run_id = state.get("run_id", self.run_id)
+        except (OSError, ValueError, KeyError):
+            pass
+        self._next = self.start
+        # Source document position -> chunks not written yet
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _advance(self) -> None:
+        while self._pending.get(self._next) == 0:
+            del self._pending[self._next]
+            self._next += 1
+
+    def add(self, position: int, chunks: int) -> None:
+        with self._lock:
+            self._pending[position] = chunks
+            self._advance()
+
+    def written(self, position: int) -> None:
+        """One chunk of the document at position has been upserted."""
+        with self._lock:
+            self._pending[position] -= 1
+            self._advance()
+
+    @property
+    def documents_done(self) -> int:
+        with self._lock:
+            return self._next
+
+    def save(self, documents_done: Optional[int] = None) -> None:
+        state = {
+            "fingerprint": self.fingerprint,
+            "namespace": self.namespace,
+            "run_id": self.run_id,
+            "documents_done": self.documents_done if documents_done is None else documents_done,
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,81 @@
+from typing import Any, Dict, List
+
+from agents.context_compression import split_sentences
+from runtime.openai_scheduler import count_tokens
+from vectorstore.token_counts import count_document_tokens, content_hash
+
+
+def _split_long(sentence: str, tokens: int, chunk_tokens: int) -> List[str]:
+    # A sentence longer than a chunk (a code block, a table) is cut on word boundaries
+    words = sentence.split()
+    pieces = max(2, -(-tokens // chunk_tokens))
+    size = -(-len(words) // pieces)
+    return [" ".join(words[start:start + size]) for start in range(0, len(words), size)]
+
+
+def chunk_document(document: Dict[str, Any], chunk_tokens: int = 400, overlap_tokens: int = 50, models: List[str] = ("gpt-4",)) -> List[Dict[str, Any]]:
+    """
+    Split a document into chunks of whole sentences, about chunk_tokens tokens each
+
+    Consecutive chunks share up to overlap_tokens tokens of sentences so an answer spanning a
+    boundary is still found in one chunk. Chunks keep the document's title, url and doc_type and
+    carry their token counts for each model's tokenizer (see count_document_tokens).
+
+    Chunk IDs are content-addressed: the document ID plus a hash of the chunk's text and metadata,
+    so an edited chunk gets a new ID and an unchanged one keeps its old one. "hash" is the hash of
+    the text alone, which embeddings are cached by.
+
+    Args:
+        document: source document with id, content, title, url and doc_type
+        chunk_tokens: target chunk size, measured with the first model's tokenizer
+        overlap_tokens: tokens repeated at the start of the next chunk
+        models: models whose token counts are stored with each chunk
+    """
+    sentences = []
+    for sentence in split_sentences(document["content"]):
+        tokens = count_tokens(sentence, models[0])
+        if tokens > chunk_tokens:
+            sentences.extend((piece, count_tokens(piece, models[0])) for piece in _split_long(sentence, tokens, chunk_tokens))
+        else:
+            sentences.append((sentence, tokens))
+
+    groups = []
+    current: List[tuple] = []
+    size = 0
+    for sentence, tokens in sentences:
+        if current and size + tokens > chunk_tokens:
+            groups.append(current)
+            # Carry the tail of the finished chunk over
+            carried = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + previous[1] > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_size += previous[1]
+            current, size = carried, carried_size
+        current.append((sentence, tokens))
+        size += tokens
+    if current:
+        groups.append(current)
+
+    chunks = []
+    ids = set()
+    for group in groups:
+        content = " ".join(sentence for sentence, _ in group)
+        record_hash = content_hash("\0".join(str(document.get(field) or "") for field in ("title", "url", "doc_type")) + "\0" + content)
+        chunk_id = f"{document['id']}-{record_hash[:16]}"
+        # Repeated text within a document is stored once
+        if chunk_id in ids:
+            continue
+        ids.add(chunk_id)
+        chunks.append({
+            "id": chunk_id,
+            "hash": content_hash(content),
+            "content": content,
+            "title": document.get("title"),
+            "url": document.get("url"),
+            "doc_type": document.get("doc_type"),
+            "token_counts": count_document_tokens(content, models),
+        })
+    return chunks
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+from vectorstore.local_index import normalize_namespace
+
+
+_schema = (
+    """
+    CREATE TABLE IF NOT EXISTS chunks (
+        namespace TEXT NOT NULL,
+        id TEXT NOT NULL,
+        run TEXT NOT NULL,
+        PRIMARY KEY (namespace, id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        model TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        PRIMARY KEY (model, hash)
+    ) WITHOUT ROWID
+    """,
+)
+
+# Run stamp of chunks that are in the namespace but must be written again (see Manifest.expire)
+_expired = ""
+# SQLite caps bound parameters per statement
+_max_ids_per_query = 500
+
+
+def _batches(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), _max_ids_per_query):
+        yield items[start:start + _max_ids_per_query]
+
+
+class Manifest:
+
+    """Chunk vector IDs written to each namespace, and dense embeddings by the hash of the text they embed"""
+
+    def __init__(self, path: str):
+        """
+        Chunk IDs are content-addressed (see chunk_document), so an ID already in a namespace means
+        the chunk is unchanged and needn't be encoded or upserted again. Every chunk a run sees is
+        stamped with the run's ID; once a run has been through all its sources, chunks with an older
+        stamp belong to removed or changed text and are deleted. Embeddings are kept per model and
+        text hash, so text that moves or repeats is never embedded twice.
+
+        Args:
+            path: SQLite file, created if missing
+        """
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in _schema:
+                connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path)
+        return connection
+
+    def mark_known(self, namespace, ids: List[str], run: str) -> Set[str]:
+        """Stamp the IDs already in the namespace with run, and return them."""
+        namespace = normalize_namespace(namespace)
+        known: Set[str] = set()
+        with self._connection() as connection:
+            for batch in _batches(ids):
+                placeholders = ",".join("?" * len(batch))
+                cursor = connection.execute(
+                    f"SELECT id FROM chunks WHERE namespace = ? AND run != ? AND id IN ({placeholders})", [namespace, _expired, *batch]
+                )
+                found = [row[0] for row in cursor]
+                connection.executemany("UPDATE chunks SET run = ? WHERE namespace = ? AND id = ?", [(run, namespace, i) for i in found])
+                known.update(found)
+        return known
+
+    def record(self, namespace, ids: List[str], run: str) -> None:
+        """IDs that have been upserted to the namespace."""
+        namespace = normalize_namespace(namespace)
+        with self._connection() as connection:
+            connection.executemany("INSERT OR REPLACE INTO chunks (namespace, id, run) VALUES (?, ?, ?)", [(namespace, i, run) for i in ids])
+
+    def expire(self, namespace) -> None:
+        """
+        Make every chunk in the namespace count as not yet written, e.g. because its sparse vectors were
+        encoded with BM25 parameters that have since been refitted. The next run writes them again;
+        those it no longer produces are still deleted as stale. Cached embeddings are kept.
+        """
+        with self._connection() as connection:
+            connection.execute("UPDATE chunks SET run = ? WHERE namespace = ?", (_expired, normalize_namespace(namespace)))
+
+    def stale(self, namespace, run: str) -> List[str]:
+        """IDs in the namespace that run hasn't seen."""
+        cursor = self._connection().execute("SELECT id FROM chunks WHERE namespace = ? AND run != ?", (normalize_namespace(namespace), run))
+        return [row[0] for row in cursor]
+
+    def remove(self, namespace, ids: List[str]) -> None:
+        namespace = normalize_namespace(namespace)
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM chunks WHERE namespace = ? AND id = ?", [(namespace, i) for i in ids])
+
+    def embeddings(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Stored embeddings by text hash; hashes without one are left out."""
+        found = {}
+        connection = self._connection()
+        for batch in _batches(list(set(hashes))):
+            placeholders = ",".join("?" * len(batch))
+            cursor = connection.execute(f"SELECT hash, embedding FROM embeddings WHERE model = ? AND hash IN ({placeholders})", [model, *batch])
+            for text_hash, blob in cursor:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_embeddings(self, model: str, embeddings: Dict[str, List[float]]) -> None:
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, embedding) VALUES (?, ?, ?)",
+                [(model, text_hash, np.asarray(values, dtype=np.float32).tobytes()) for text_hash, values in embeddings.items()],
+            )
+
+    def count(self, namespace) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks WHERE namespace = ?", (normalize_namespace(namespace),)).fetchone()[0]
@@ -0,0 +1,362 @@
+import time
+import queue
+import threading
+import contextvars
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from telemetry import REGISTRY
+from vectorstore.token_counts import token_metadata
+from vectorstore.near_duplicates import NearDuplicateIndex
+from ingestion.checkpoint import Checkpoint
+from ingestion.manifest import Manifest
+
+
+STAGES = ("chunk", "encode", "upsert")
+
+# Ends a stage's input
+_done = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+class StageStats:
+
+    """Documents and chunks a stage has finished, and the time its workers spent working"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.documents = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._documents = REGISTRY.counter("shelby_ingest_documents_total", "Source documents finished by each ingestion stage", ["stage"]).labels(stage=name)
+        self._chunks = REGISTRY.counter("shelby_ingest_chunks_total", "Chunks finished by each ingestion stage", ["stage"]).labels(stage=name)
+
+    def record(self, documents: int, chunks: int, seconds: float) -> None:
+        with self._lock:
+            self.documents += documents
+            self.chunks += chunks
+            self.busy_seconds += seconds
+        self._documents.inc(documents)
+        self._chunks.inc(chunks)
+
+    def summary(self, elapsed: float) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "chunks": self.chunks,
+                "docs_per_second": self.documents / elapsed if elapsed else 0.0,
+                "chunks_per_second": self.chunks / elapsed if elapsed else 0.0,
+                "busy_seconds": self.busy_seconds,
+            }
+
+
+class IngestionPipeline:
+
+    """Streams source documents through chunking, batched dense+sparse encoding and concurrent upserts"""
+
+    def __init__(
+        self,
+        index,
+        chunker: Callable[[Dict[str, Any]], List[Dict[str, Any]]],
+        embed: Callable[[List[str]], List[List[float]]],
+        sparse_encoder,
+        namespace: str = "",
+        checkpoint: Optional[Checkpoint] = None,
+        content_store=None,
+        manifest: Optional[Manifest] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        embedding_model: str = "",
+        save_index: Optional[Callable[[], None]] = None,
+        embed_batch_size: int = 64,
+        upsert_batch_size: int = 100,
+        encode_workers: int = 2,
+        upsert_workers: int = 4,
+        queue_batches: int = 8,
+        checkpoint_seconds: float = 30.0,
+    ):
+        """
+        Each stage runs on its own threads and hands batches to the next through a queue holding at
+        most queue_batches batches, so a slow stage holds back the ones before it instead of letting
+        chunks pile up in memory. Chunk IDs are content-addressed, so writing a chunk twice
+        replaces it.
+
+        With a manifest the run is incremental: chunks already in the namespace are skipped,
+        embeddings are reused for text embedded before, and once every source has been read,
+        chunks no longer produced by any source are deleted.
+
+        With near_duplicates, a chunk that near-duplicates one earlier in the sources is dropped, so
+        each group of near-identical chunks is stored once, as the first of them. Documents before
+        the checkpoint are still chunked on resume to fill it.
+
+        With save_index set (a local index), the index is saved before every checkpoint and upserts
+        are serialized, since LocalIndex isn't safe for concurrent writers.
+
+        Args:
+            index: pinecone.Index or LocalIndex to upsert to
+            chunker: source document -> chunks with id, content, title, url, doc_type and token_counts
+            embed: texts -> dense embeddings, called once per batch
+            sparse_encoder: fitted encoder whose encode_documents gives the sparse vectors
+            namespace: namespace to write to
+            checkpoint: progress to resume from and save to
+            content_store: ContentStore to write chunk text to alongside the index
+            manifest: chunks and embeddings already written, for incremental runs
+            near_duplicates: detector that collapses near-identical chunks
+            embedding_model: name embeddings are cached under in the manifest
+            save_index: persists a local index; called before each checkpoint is saved
+            embed_batch_size: chunks per encoding batch (one embedding request)
+            upsert_batch_size: vectors per upsert request
+            encode_workers: concurrent encoding batches
+            upsert_workers: concurrent upsert requests
+            queue_batches: batches buffered between stages
+            checkpoint_seconds: seconds between checkpoints
+        """
+        self.index = index
+        self.chunker = chunker
+        self.embed = embed
+        self.sparse_encoder = sparse_encoder
+        self.namespace = namespace
+        self.checkpoint = checkpoint
+        self.content_store = content_store
+        self.manifest = manifest
+        self.near_duplicates = near_duplicates
+        self.embedding_model = embedding_model
+        self.run_id = checkpoint.run_id if checkpoint is not None else f"{time.time():.6f}"
+        # Chunks skipped as unchanged or near-duplicate, embeddings reused from the manifest, and stale chunks deleted
+        self.unchanged = 0
+        self.duplicates = 0
+        self.reused_embeddings = 0
+        self.deleted = 0
+        self._counts_lock = threading.Lock()
+        self.save_index = save_index
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.encode_workers = encode_workers
+        self.upsert_workers = upsert_workers
+        self.queue_batches = queue_batches
+        self.checkpoint_seconds = checkpoint_seconds
+        self.stats = {stage: StageStats(stage) for stage in STAGES}
+        self._index_lock = threading.Lock() if save_index is not None else None
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._encoders_left = 0
+        self._encoders_lock = threading.Lock()
+
+    def _put(self, q: queue.Queue, item) -> None:
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped()
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise _Stopped()
+
+    def _thread(self, name: str, target, *args) -> threading.Thread:
+        # Each stage thread runs in a copy of the caller's context, e.g. its OpenAI request priority
+        return threading.Thread(target=contextvars.copy_context().run, args=(self._run_stage, target, *args), name=name)
+
+    def _run_stage(self, target, *args) -> None:
+        try:
+            target(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    # Batch items are (source position, chunk, last chunk of its document)
+    def _chunk_stage(self, documents: Iterable[Dict[str, Any]], encode_queue: queue.Queue) -> None:
+        start = self.checkpoint.start if self.checkpoint is not None else 0
+        batch = []
+        for position, document in enumerate(documents):
+            if position < start:
+                if self.near_duplicates is not None:
+                    for chunk in self.chunker(document):
+                        self.near_duplicates.add(chunk["id"], chunk["content"])
+                continue
+            if self._stop.is_set():
+                raise _Stopped()
+            began = time.perf_counter()
+            chunks = self.chunker(document)
+            if self.near_duplicates is not None:
+                unique = [chunk for chunk in chunks if self.near_duplicates.add(chunk["id"], chunk["content"]) is None]
+                self.duplicates += len(chunks) - len(unique)
+                chunks = unique
+            if self.manifest is not None and chunks:
+                known = self.manifest.mark_known(self.namespace, [chunk["id"] for chunk in chunks], self.run_id)
+                chunks = [chunk for chunk in chunks if chunk["id"] not in known]
+                with self._counts_lock:
+                    self.unchanged += len(known)
+            if self.checkpoint is not None:
+                self.checkpoint.add(position, len(chunks))
+            self.stats["chunk"].record(1, len(chunks), time.perf_counter() - began)
+            for number, chunk in enumerate(chunks):
+                batch.append((position, chunk, number == len(chunks) - 1))
+                if len(batch) >= self.embed_batch_size:
+                    self._put(encode_queue, batch)
+                    batch = []
+        if batch:
+            self._put(encode_queue, batch)
+        for _ in range(self.encode_workers):
+            self._put(encode_queue, _done)
+
+    def _encode_stage(self, encode_queue: queue.Queue, upsert_queue: queue.Queue) -> None:
+        try:
+            while True:
+                batch = self._get(encode_queue)
+                if batch is _done:
+                    break
+                began = time.perf_counter()
+                texts = [chunk["content"] for _, chunk, _ in batch]
+                dense = self.embed_batch(batch, texts)
+                sparse = self.sparse_encoder.encode_documents(texts)
+                vectors = []
+                for (_, chunk, _), values, sparse_values in zip(batch, dense, sparse):
+                    metadata = {
+                        "content": chunk["content"],
+                        "title": chunk["title"],
+                        "url": chunk["url"],
+                        "doc_type": chunk["doc_type"],
+                        **token_metadata(chunk.get("token_counts") or {}),
+                    }
+                    vector = {"id": chunk["id"], "values": values, "metadata": metadata}
+                    # Pinecone rejects empty sparse vectors
+                    if sparse_values["indices"]:
+                        vector["sparse_values"] = sparse_values
+                    vectors.append(vector)
+                self.stats["encode"].record(sum(1 for _, _, last in batch if last), len(batch), time.perf_counter() - began)
+                self._put(upsert_queue, (batch, vectors))
+        finally:
+            # The last encoder to stop ends the upsert stage
+            with self._encoders_lock:
+                self._encoders_left -= 1
+                last = self._encoders_left == 0
+            if last and not self._stop.is_set():
+                for _ in range(self.upsert_workers):
+                    self._put(upsert_queue, _done)
+
+    def embed_batch(self, batch, texts: List[str]) -> List[List[float]]:
+        if self.manifest is None:
+            return self.embed(texts)
+        hashes = [chunk["hash"] for _, chunk, _ in batch]
+        cached = self.manifest.embeddings(self.embedding_model, hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in cached))
+        missing_set = set(missing)
+        if missing:
+            text_of = {chunk["hash"]: chunk["content"] for _, chunk, _ in batch}
+            embedded = dict(zip(missing, self.embed([text_of[h] for h in missing])))
+            self.manifest.put_embeddings(self.embedding_model, embedded)
+            cached.update(embedded)
+        with self._counts_lock:
+            self.reused_embeddings += sum(1 for h in hashes if h not in missing_set)
+        return [cached[h] for h in hashes]
+
+    def delete_stale(self) -> None:
+        """Delete chunks the manifest has for the namespace that this run's sources no longer produce."""
+        stale = self.manifest.stale(self.namespace, self.run_id)
+        for start in range(0, len(stale), self.upsert_batch_size):
+            ids = stale[start:start + self.upsert_batch_size]
+            with self._index_lock or nullcontext():
+                self.index.delete(ids=ids, namespace=self.namespace)
+            if self.content_store is not None:
+                self.content_store.delete(self.namespace, ids)
+            self.manifest.remove(self.namespace, ids)
+        self.deleted += len(stale)
+
+    def _upsert_stage(self, upsert_queue: queue.Queue) -> None:
+        while True:
+            item = self._get(upsert_queue)
+            if item is _done:
+                return
+            batch, vectors = item
+            began = time.perf_counter()
+            for start in range(0, len(vectors), self.upsert_batch_size):
+                with self._index_lock or nullcontext():
+                    self.index.upsert(vectors=vectors[start:start + self.upsert_batch_size], namespace=self.namespace)
+            if self.content_store is not None:
+                self.content_store.put_many(self.namespace, [chunk for _, chunk, _ in batch])
+            if self.manifest is not None:
+                self.manifest.record(self.namespace, [chunk["id"] for _, chunk, _ in batch], self.run_id)
+            if self.checkpoint is not None:
+                for position, _, _ in batch:
+                    self.checkpoint.written(position)
+            self.stats["upsert"].record(sum(1 for _, _, last in batch if last), len(batch), time.perf_counter() - began)
+
+    def save_checkpoint(self) -> None:
+        if self.checkpoint is None:
+            return
+        if self._index_lock is None:
+            self.checkpoint.save()
+            return
+        # Everything counted as done is in the index once writers are held off, so save the index first
+        with self._index_lock:
+            documents_done = self.checkpoint.documents_done
+            self.save_index()
+        self.checkpoint.save(documents_done)
+
+    def run(self, documents: Iterable[Dict[str, Any]], on_progress: Optional[Callable[[Dict[str, Any]], None]] = None, progress_seconds: float = 10.0) -> Dict[str, Any]:
+        """
+        Ingest documents, resuming after the checkpoint's progress
+
+        Args:
+            documents: source documents, in the same order on every run
+            on_progress: called with the running summary every progress_seconds
+
+        Returns: per-stage documents, chunks and rates, the elapsed time and documents done
+
+        Raises: the first error any stage hit, after the others have stopped and progress is saved
+        """
+        encode_queue: queue.Queue = queue.Queue(self.queue_batches)
+        upsert_queue: queue.Queue = queue.Queue(self.queue_batches)
+        self._encoders_left = self.encode_workers
+        threads = [self._thread("ingest-chunk", self._chunk_stage, documents, encode_queue)]
+        threads += [self._thread(f"ingest-encode-{i}", self._encode_stage, encode_queue, upsert_queue) for i in range(self.encode_workers)]
+        threads += [self._thread(f"ingest-upsert-{i}", self._upsert_stage, upsert_queue) for i in range(self.upsert_workers)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        last_checkpoint = last_progress = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                threads[-1].join(timeout=0.5)
+                now = time.monotonic()
+                if now - last_checkpoint >= self.checkpoint_seconds:
+                    self.save_checkpoint()
+                    last_checkpoint = now
+                if on_progress is not None and now - last_progress >= progress_seconds:
+                    on_progress(self.summary(time.perf_counter() - began))
+                    last_progress = now
+        except KeyboardInterrupt:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.save_checkpoint()
+            raise
+        if self.manifest is not None and not self._errors:
+            self.delete_stale()
+        self.save_checkpoint()
+        if self._errors:
+            raise self._errors[0]
+        return self.summary(time.perf_counter() - began)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "elapsed_seconds": elapsed,
+            "documents_done": self.checkpoint.documents_done if self.checkpoint is not None else self.stats["upsert"].documents,
+            "stages": {stage: stats.summary(elapsed) for stage, stats in self.stats.items()},
+            "unchanged_chunks": self.unchanged,
+            "near_duplicate_chunks": self.duplicates,
+            "reused_embeddings": self.reused_embeddings,
+            "deleted_chunks": self.deleted,
+        }
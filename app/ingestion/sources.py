@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, Iterator, List
+
+from vectorstore.token_counts import content_hash
+
+
+# File types read as one document each; .jsonl files hold one document per line
+TEXT_EXTENSIONS = (".md", ".mdx", ".txt", ".rst", ".html")
+
+
+def source_files(paths: List[str]) -> List[str]:
+    """Every readable source file under paths, in a stable order so resumed runs see documents in the same sequence."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(TEXT_EXTENSIONS + (".jsonl",)))
+        else:
+            files.append(path)
+    return files
+
+
+def fingerprint(files: List[str]) -> str:
+    """Changes when any source file is added, removed or modified."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in files:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _title(path: str, text: str) -> str:
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            return line.lstrip("#").strip()
+        if line:
+            break
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def iter_documents(files: List[str], doc_type: str = "soft") -> Iterator[Dict[str, Any]]:
+    """
+    Source documents with id, content, title, url and doc_type
+
+    JSONL lines need "content" and may carry any of the other fields. Other files are one document
+    each, titled by their first heading and addressed by their path.
+    """
+    for path in files:
+        if path.endswith(".jsonl"):
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    url = record.get("url") or ""
+                    yield {
+                        "id": str(record.get("id") or content_hash(url or record["content"])),
+                        "content": record["content"],
+                        "title": record.get("title") or url,
+                        "url": url,
+                        "doc_type": record.get("doc_type") or doc_type,
+                    }
+        else:
+            with open(path, "r", errors="replace") as f:
+                text = f.read()
+            yield {
+                "id": content_hash(path),
+                "content": text,
+                "title": _title(path, text),
+                "url": path,
+                "doc_type": doc_type,
+            }
@@ -0,0 +1,144 @@
+#region
+# system imports
+import os, json, time, asyncio, argparse, subprocess
+
+# imports from pip
+import openai
+
+# imports from bot app
+from agents.async_shelby_agent import ShelbyAgent
+from configuration.shelby_agent_config import AppConfig
+from bench.fake_services import FakeOpenAIServer, FakeVectorIndex, build_synthetic_index, tokenize
+from bench.harness import StageTimer, drive, report, compare
+#endregion
+
+# Used when no --queries file is given
+default_queries = [
+    "Can you tell me how to get the latest block on solana with the tatum api?",
+    "How do I create a new ethereum wallet and generate an address from the xpub?",
+    "What is the difference between a virtual account and a blockchain address?",
+    "How can I subscribe to webhook notifications for incoming bitcoin transactions?",
+    "Can you show me a curl request to estimate gas fees on polygon?",
+    "How do I mint an NFT on the BNB smart chain using the tatum api?",
+    "What rate limits apply to the free plan and how do I check my credit usage?",
+    "How do I broadcast a signed transaction to the algorand network?",
+    "Can you explain how to use the rpc gateway to call eth_getBalance?",
+    "How do I list all the transactions for a ledger account between two dates?",
+    "What is the recommended way to store private keys when using key management system?",
+    "How can I get the token balances of an address on tron?",
+]
+
+
+def load_queries(path):
+    # Accepts JSONL with a "query" (or "body") field per line, or plain text with one query per line
+    queries = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                queries.append(record.get('query') or record.get('body') or record.get('title'))
+            else:
+                queries.append(line)
+    return [q for q in queries if q]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark for ShelbyAgent.run_query against local stand-ins.")
+    parser.add_argument('--queries', help="JSONL or text file of queries (defaults to a built-in set)")
+    parser.add_argument('--repeat', type=int, default=1, help="times to run the query corpus")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--namespaces', default='tatum,deepgram,stackpath', help="comma separated namespaces to synthesize")
+    parser.add_argument('--docs-per-namespace', type=int, default=500)
+    parser.add_argument('--chat-latency', default='lognormal:1.5,0.4', help="e.g. constant:0.5, uniform:0.2,0.8, normal:1,0.2, lognormal:1.5,0.4")
+    parser.add_argument('--routing-latency', default='lognormal:0.4,0.3')
+    parser.add_argument('--embedding-latency', default='lognormal:0.08,0.3')
+    parser.add_argument('--vectorstore-latency', default='lognormal:0.06,0.3')
+    parser.add_argument('--prefill-latency', type=float, default=0.0, help="extra answer latency in seconds per 1000 prompt tokens")
+    parser.add_argument('--small-chat-latency', help="completion latency of the cascade's small model (DOCS_CASCADE), defaults to --chat-latency")
+    parser.add_argument('--uncited-rate', type=float, default=0.0, help="share of fake answers that cite no document")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="result JSON path (defaults to data/benchmarks/latency-<commit>-<time>.json)")
+    parser.add_argument('--baseline', help="previous result JSON to compare against")
+    return parser.parse_args()
+
+
+async def main(args):
+    queries = load_queries(args.queries) if args.queries else list(default_queries)
+    queries = queries * args.repeat
+    namespaces = [ns.strip() for ns in args.namespaces.split(',') if ns.strip()]
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    small_model = AppConfig().docs_cascade_model
+    with FakeOpenAIServer(
+        chat_latency=args.chat_latency,
+        routing_latency=args.routing_latency,
+        embedding_latency=args.embedding_latency,
+        prefill_seconds_per_1k_tokens=args.prefill_latency,
+        model_chat_latency={small_model: args.small_chat_latency} if args.small_chat_latency else None,
+        uncited_rate=args.uncited_rate,
+        seed=args.seed,
+    ) as server:
+        # Every OpenAI call goes through the openai module's global api_base
+        os.environ["OPENAI_API_BASE"] = server.api_base
+        openai.api_base = server.api_base
+
+        agent = ShelbyAgent()
+        agent.agent_config.vectorstore_backend = 'local'
+        agent.agent_config.vectorstore_namespaces = {ns: f"Documentation for {ns}" for ns in namespaces}
+        vocabulary = sorted({token for q in default_queries + queries for token in tokenize(q)})
+        index = build_synthetic_index(server.embedder, namespaces, vocabulary, args.docs_per_namespace, seed=args.seed)
+        agent.docs_agent.local_index = FakeVectorIndex(index, args.vectorstore_latency, seed=args.seed)
+
+        timer = StageTimer()
+        timer.instrument(agent)
+        run = await drive(agent, queries, args.concurrency)
+        prompt_tokens = list(server.chat_prompt_tokens)
+        chat_models = dict(server.chat_models)
+
+    result = report(run, timer, extra={
+        "git_commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "queries": len(queries),
+        "concurrency": args.concurrency,
+        "latency_config": {
+            "chat": args.chat_latency,
+            "routing": args.routing_latency,
+            "embedding": args.embedding_latency,
+            "vectorstore": args.vectorstore_latency,
+            "prefill_seconds_per_1k_tokens": args.prefill_latency,
+            "small_chat": args.small_chat_latency,
+            "uncited_rate": args.uncited_rate,
+        },
+        "chat_completions_by_model": chat_models,
+        "chat_prompt_tokens": {
+            "mean": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else 0,
+            "max": max(prompt_tokens, default=0),
+        },
+        "seed": args.seed,
+    })
+    if agent.docs_agent.cascade is not None:
+        result["cascade_escalation_rate"] = agent.docs_agent.cascade.escalation_rate()
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            result["comparison"] = compare(result, json.load(f))
+
+    output = args.output or os.path.join('data', 'benchmarks', f"latency-{result['git_commit'] or 'nogit'}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps({k: result[k] for k in ("completed", "errors", "throughput_qps", "latency")}, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
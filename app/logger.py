@@ -1,22 +1,169 @@
 import os
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
+from datetime import datetime, timezone
+from telemetry import current_query_id
 
-def setup_logger(logger_name, log_file, level=logging.INFO):
+# Defaults for every logger, overridable per call
+# LOG_QUEUED: hand records to a background writer thread instead of writing on the caller's thread
+# LOG_FORMAT: 'text' or 'json' (one JSON object per line)
+# LOG_MAX_BYTES / LOG_BACKUP_COUNT: size-based rotation, logs are appended across restarts; agent worker
+# processes (AGENT_PROCESSES) each write and rotate their own <name>.worker<n>.log
+# LOG_LEVEL: overrides the level passed by the caller
+log_queued = os.getenv('LOG_QUEUED', 'true').lower() in ('1', 'true', 'yes')
+log_format = os.getenv('LOG_FORMAT', 'text')
+log_max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+log_level = os.getenv('LOG_LEVEL')
+
+# Attributes every LogRecord has; anything else was passed through extra= and is kept in JSON output
+_record_attributes = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'query_id'}
+
+
+class JSONLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        query_id = getattr(record, 'query_id', None)
+        if query_id:
+            entry['query_id'] = query_id
+        for key, value in record.__dict__.items():
+            if key not in _record_attributes:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Rendered on the caller's thread by DeferredQueueHandler
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueryIdFilter(logging.Filter):
+    # Runs on the caller's thread, where the tracing context of the current query is visible
+    def filter(self, record):
+        record.query_id = current_query_id()
+        return True
+
+
+# Argument types that can't change between the log call and the writer thread formatting them
+_immutable_types = (str, bytes, int, float, bool, type(None))
+_traceback_formatter = logging.Formatter()
+
+
+def _immutable(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_immutable(item) for item in value)
+    return isinstance(value, _immutable_types)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats every message before enqueueing, which puts the formatting cost
+    # back on the caller. Records stay in-process, so messages whose arguments are all immutable are
+    # handed over as they are and formatted by the writer thread. Anything else (the response dict,
+    # document lists) may be changed by the request thread before then, so it is formatted here, as
+    # the stock handler does, and so are tracebacks.
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        # A lone dict argument becomes record.args itself
+        if not isinstance(record.msg, str) or not _immutable(record.args or ()):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+_listeners = []
+# Every file handler setup_logger made, so forked workers can move them to files of their own
+_file_handlers = []
+# Set in agent workers: inserted before the extension of every log file
+_file_suffix = ''
+
+
+def _stop_listeners():
+    for listener in _listeners:
+        if listener._thread is not None:
+            listener.stop()
+
+
+def _start_listeners():
+    for listener in _listeners:
+        if listener._thread is None:
+            listener.start()
+
+
+atexit.register(_stop_listeners)
+# A forked child only gets the thread that forked, so writer threads are stopped (flushing the
+# queue) before a fork and started again on both sides; otherwise child records would go nowhere.
+os.register_at_fork(before=_stop_listeners, after_in_parent=_start_listeners, after_in_child=_start_listeners)
+
+
+def use_worker_log_files(index):
+    """
+    Moves this process's log files, and those of loggers set up later, to <name>.worker<index>.log.
+    Call in a forked worker: the handlers it inherited still point at the parent's files, and
+    processes rotating the same file lose records.
+    """
+    global _file_suffix
+    _file_suffix = f".worker{index}"
+    for handler in _file_handlers:
+        handler.acquire()
+        try:
+            if handler.stream is not None:
+                handler.stream.close()
+                handler.stream = None
+            root, ext = os.path.splitext(handler.baseFilename)
+            handler.baseFilename = f"{root}.worker{index}{ext}"
+        finally:
+            handler.release()
+
+
+def setup_logger(logger_name, log_file, level=logging.INFO, queued=None, json_lines=None, max_bytes=None, backup_count=None):
     log_dir = os.path.dirname(os.path.abspath(__file__))
     log_dir = os.path.join(os.path.dirname(log_dir), 'logs')
     os.makedirs(log_dir, exist_ok=True)
 
     log_setup = logging.getLogger(logger_name)
-    formatter = logging.Formatter('%(levelname)s: %(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
-    # Overwrites logs
-    fileHandler = logging.FileHandler(os.path.join(log_dir, log_file), mode='w')
-    # Appends logs
-    # fileHandler = logging.FileHandler(os.path.join(log_dir, log_file), mode='a')
+    log_setup.setLevel(log_level or level)
+    # Calling again for the same logger (e.g. several agents in one process) must not duplicate output
+    if getattr(log_setup, '_shelby_configured', False):
+        return log_setup
+
+    queued = log_queued if queued is None else queued
+    json_lines = (log_format == 'json') if json_lines is None else json_lines
+    max_bytes = log_max_bytes if max_bytes is None else max_bytes
+    backup_count = log_backup_count if backup_count is None else backup_count
 
+    if json_lines:
+        formatter = JSONLinesFormatter()
+    else:
+        formatter = logging.Formatter('%(levelname)s: %(asctime)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+    # Appends and rotates by size instead of overwriting on every start
+    root, ext = os.path.splitext(log_file)
+    fileHandler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, root + _file_suffix + ext), mode='a', maxBytes=max_bytes, backupCount=backup_count
+    )
     fileHandler.setFormatter(formatter)
+    _file_handlers.append(fileHandler)
 
-    log_setup.setLevel(level)
-    log_setup.addHandler(fileHandler)
+    if queued:
+        log_queue = queue.SimpleQueue()
+        queueHandler = DeferredQueueHandler(log_queue)
+        queueHandler.addFilter(QueryIdFilter())
+        listener = logging.handlers.QueueListener(log_queue, fileHandler, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        log_setup.addHandler(queueHandler)
+    else:
+        fileHandler.addFilter(QueryIdFilter())
+        log_setup.addHandler(fileHandler)
 
+    log_setup._shelby_configured = True
     return log_setup
-
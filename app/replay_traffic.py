@@ -0,0 +1,96 @@
+#region
+# system imports
+import os, json, time, asyncio, argparse
+
+# imports from pip
+import openai
+
+# imports from bot app
+from agents.async_shelby_agent import ShelbyAgent
+from configuration.shelby_agent_config import AppConfig
+from bench.harness import StageTimer, report, compare
+from bench.replay import Recording, ReplayOpenAIServer, ReplayVectorIndex, replay
+from runtime import QueryQueue
+from telemetry import read_traffic
+from latency_benchmark import git_commit
+#endregion
+
+
+def parse_args():
+    agent_config = AppConfig()
+    parser = argparse.ArgumentParser(description="Replay traffic recorded with TRAFFIC_RECORD_PATH against ShelbyAgent, with OpenAI and the vectorstore answering as they did then.")
+    parser.add_argument('traffic', help="file written by the traffic recorder")
+    parser.add_argument('--speed', type=float, default=1.0, help="arrival rate multiplier, 2 replays twice as fast; 0 sends everything back to back with --concurrency in flight")
+    parser.add_argument('--concurrency', type=int, default=agent_config.query_workers, help="queries in flight with --speed 0")
+    parser.add_argument('--queue', action='store_true', help="send queries through a QueryQueue configured like the bots', under their recorded users")
+    parser.add_argument('--limit', type=int, help="replay only the first n arrivals")
+    parser.add_argument('--output', help="result JSON path (defaults to data/benchmarks/replay-<commit>-<time>.json)")
+    parser.add_argument('--baseline', help="previous result JSON to compare against")
+    return parser.parse_args()
+
+
+async def main(args):
+    recording = Recording(list(read_traffic(args.traffic)))
+    arrivals = recording.arrivals[:args.limit] if args.limit else recording.arrivals
+    if not arrivals:
+        print(f"no recorded queries in {args.traffic}")
+        return
+    span = arrivals[-1][0] - arrivals[0][0]
+    print(f"replaying {len(arrivals)} queries recorded over {span:.0f}s across {len(recording.namespaces)} namespaces")
+
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    with ReplayOpenAIServer(recording) as server:
+        openai.api_base = server.api_base
+
+        agent = ShelbyAgent()
+        agent.agent_config.vectorstore_backend = 'local'
+        agent.agent_config.content_store_path = ''
+        # The configured namespaces keep routing in play; recorded ones no longer configured are added after them
+        configured = agent.agent_config.vectorstore_namespaces
+        recording.namespaces = list(configured) + [ns for ns in recording.namespaces if ns not in configured]
+        agent.agent_config.vectorstore_namespaces = {ns: configured.get(ns, f"Documentation for {ns}") for ns in recording.namespaces}
+        agent.docs_agent.local_index = ReplayVectorIndex(recording)
+
+        queue = None
+        if args.queue:
+            agent_config = agent.agent_config
+            queue = QueryQueue(
+                workers=agent_config.query_workers,
+                capacity=agent_config.query_queue_size,
+                max_wait_seconds=agent_config.query_max_wait_seconds,
+                max_per_user=agent_config.query_max_per_user,
+                name="replay"
+            )
+        timer = StageTimer()
+        timer.instrument(agent)
+        run = await replay(agent, arrivals, args.speed, args.concurrency, queue)
+        if queue is not None:
+            await queue.stop()
+        requests = dict(server.requests)
+
+    result = report(run, timer, extra={
+        "git_commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "traffic": args.traffic,
+        "queries": len(arrivals),
+        "recorded_seconds": span,
+        "speed": args.speed,
+        "concurrency": args.concurrency if args.speed <= 0 else None,
+        "queued": args.queue,
+        "service_requests": requests,
+        "unrecorded_retrievals": agent.docs_agent.local_index.unknown,
+    })
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            result["comparison"] = compare(result, json.load(f))
+
+    output = args.output or os.path.join('data', 'benchmarks', f"replay-{result['git_commit'] or 'nogit'}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps({k: result[k] for k in ("completed", "errors", "throughput_qps", "latency", "service_requests")}, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,15 @@
+"""
+# Runtime
+
+Concurrency and flow-control building blocks shared by the agents and bots.
+"""
+
+from runtime.openai_scheduler import OpenAIScheduler, Priority, request_priority, split_rate_limits
+from runtime.single_flight import SingleFlight, normalize_query
+from runtime.work_queue import QueryQueue, QueueRejected, QueueFull, QueueTimeout
+from runtime.deadline import Deadline, DeadlineExceeded, deadline_scope, current_deadline, stage_timeout
+from runtime.hedging import Hedger
+from runtime.circuit_breaker import CircuitBreaker, CircuitOpen
+from runtime.process_pool import AgentProcessPool, WorkerExited, available_cores, resolve_worker_count
+from runtime.answer_cache import AnswerCache
+from runtime.warmup import WarmupBudget, frequent_questions, set_ready, is_ready
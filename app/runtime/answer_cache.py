@@ -0,0 +1,63 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from telemetry import REGISTRY
+
+
+class AnswerCache:
+
+    """LRU cache of finished answers keyed by normalized query and the topic the caller asked for"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0):
+        """
+        An entry remembers every namespace searched for it and their version stamps, and is dropped
+        once any stamp changes (that namespace was re-ingested), after ttl_seconds, or when
+        more than max_entries are cached (least recently used first). Callers get deep copies, so
+        the bots' formatting can't alter what the next caller sees.
+
+        Args:
+            max_entries: answers kept
+            ttl_seconds: age after which an answer is asked again
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (stored_at, [(namespace, version)], answer)
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Tuple[Any, Any]], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._requests = REGISTRY.counter("shelby_answer_cache_requests_total", "Answer cache lookups by result", ["result"])
+        REGISTRY.gauge("shelby_answer_cache_entries", "Cached answers").set_function(lambda: len(self._entries))
+
+    def get(self, key: Hashable, version_of: Callable[[Any], Any]) -> Optional[Dict[str, Any]]:
+        """The cached answer, or None; version_of gives a namespace's current version stamp."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            self._requests.labels(result="miss").inc()
+            return None
+        stored_at, sources, answer = entry
+        if time.monotonic() - stored_at > self.ttl_seconds or any(version_of(namespace) != version for namespace, version in sources):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            self._requests.labels(result="stale").inc()
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        self._requests.labels(result="hit").inc()
+        return copy.deepcopy(answer)
+
+    def put(self, key: Hashable, sources: List[Tuple[Any, Any]], answer: Dict[str, Any]) -> None:
+        """Caches answer under key; sources are the (namespace, version) pairs of every namespace searched for it."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic(), list(sources), copy.deepcopy(answer))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
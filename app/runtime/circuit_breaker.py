@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Tuple, Type
+
+from telemetry import REGISTRY, set_span_attributes
+from runtime.deadline import DeadlineExceeded
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+
+    """Stops calling a dependency whose recent error rate is too high, then probes it to see if it recovered"""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_seconds: float = 30.0,
+        failure_types: Tuple[Type[BaseException], ...] = (Exception,),
+    ):
+        """
+        Closed: calls go through and outcomes are kept for the last window calls; the breaker opens
+        once at least min_calls are recorded and the failure share reaches failure_threshold.
+        Open: calls are not made; they use the fallback if one is given, otherwise raise CircuitOpen.
+        After reset_seconds one trial call is let through (half open); success closes the breaker,
+        failure opens it again.
+
+        Args:
+            name: dependency label for the exported metrics
+            failure_threshold: failure share of the window that opens the breaker
+            window: recent calls the failure share is computed over
+            min_calls: calls needed before the breaker may open
+            reset_seconds: time open before a trial call
+            failure_types: exceptions counted as the dependency failing; others pass through uncounted
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_seconds = reset_seconds
+        self.failure_types = failure_types
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+        REGISTRY.gauge("shelby_circuit_state", "Breaker state: 0 closed, 1 half open, 2 open", ["dependency"]).labels(dependency=name).set_function(
+            lambda: self._STATE_VALUES[self.state]
+        )
+        self._calls = REGISTRY.counter("shelby_circuit_calls_total", "Calls through circuit breakers by outcome", ["dependency", "outcome"])
+        self._transitions = REGISTRY.counter("shelby_circuit_transitions_total", "Breaker state changes", ["dependency", "state"])
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        self._transitions.labels(dependency=self.name, state=state).inc()
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        elif state == self.CLOSED:
+            self._outcomes.clear()
+
+    def _permit(self) -> Tuple[bool, bool]:
+        """(allowed, is_trial) for the next call."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True, False
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True, True
+            return False, False
+
+    def _record(self, ok: bool, trial: bool) -> None:
+        with self._lock:
+            if trial:
+                self._trial_running = False
+                self._transition(self.CLOSED if ok else self.OPEN)
+                return
+            if self.state != self.CLOSED:
+                # A call admitted before the breaker opened
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_threshold:
+                self._transition(self.OPEN)
+
+    def _release(self, trial: bool) -> None:
+        if trial:
+            with self._lock:
+                self._trial_running = False
+
+    def call(self, fn: Callable[[], Any], fallback: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Run fn unless the breaker is open
+
+        Raises: CircuitOpen when the breaker is open and there is no fallback
+        """
+        allowed, trial = self._permit()
+        if not allowed:
+            set_span_attributes(circuit_open=self.name)
+            if fallback is not None:
+                self._calls.labels(dependency=self.name, outcome="fallback").inc()
+                return fallback()
+            self._calls.labels(dependency=self.name, outcome="rejected").inc()
+            raise CircuitOpen(f"{self.name} is failing, not calling it for now")
+        try:
+            result = fn()
+        except DeadlineExceeded:
+            # Our budget ran out before the call was made, which says nothing about the dependency
+            self._release(trial)
+            raise
+        except self.failure_types:
+            self._calls.labels(dependency=self.name, outcome="failure").inc()
+            self._record(False, trial)
+            raise
+        except BaseException:
+            # Not the dependency's fault (e.g. a bad request); let another call be the trial
+            self._release(trial)
+            raise
+        self._calls.labels(dependency=self.name, outcome="success").inc()
+        self._record(True, trial)
+        return result
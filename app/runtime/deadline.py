@@ -0,0 +1,63 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+
+    """Absolute point in (monotonic) time by which a query must be answered"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """
+        Budget for one stage: what's left minus reserve (time kept back for later stages), never more than cap
+
+        Raises: DeadlineExceeded when nothing is left for the stage
+        """
+        budget = self.remaining() - reserve
+        if budget <= 0:
+            raise DeadlineExceeded(f"query deadline of {self.seconds:g}s exceeded")
+        return min(budget, cap) if cap is not None else budget
+
+
+_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("query_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Give everything run in this context, and worker threads started with a copy of it, seconds to finish; an earlier enclosing deadline wins."""
+    deadline = Deadline(seconds)
+    outer = _deadline.get()
+    if outer is not None and outer.expires_at <= deadline.expires_at:
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def stage_timeout(cap: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+    """Timeout for the next blocking call: the current deadline's remaining budget, else cap (None means no limit)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap, reserve)
@@ -0,0 +1,122 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Optional
+
+import numpy as np
+
+from telemetry import REGISTRY, set_span_attributes
+from runtime.deadline import current_deadline
+
+
+class Hedger:
+
+    """Sends a backup request when the first one is slower than recent calls usually are"""
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 95.0,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay_seconds: float = 0.01,
+        max_hedge_ratio: float = 0.1,
+        workers: int = 32,
+    ):
+        """
+        The hedge delay is the given percentile of the last window successful first-request
+        latencies, so roughly (100 - percentile)% of calls are hedged. No hedges are sent until
+        min_samples latencies have been seen. Hedges are also rationed: every call earns
+        max_hedge_ratio of a hedge and each hedge spends one, so an upstream that is slow across the
+        board is not hit with double traffic. Whichever request answers first wins; the other is
+        left to finish in the background.
+
+        Args:
+            name: dependency label for the exported metrics
+            percentile: latency percentile after which a hedge is sent
+            window: recent latencies the percentile is computed over
+            min_samples: latencies needed before hedging starts
+            min_delay_seconds: floor for the hedge delay
+            max_hedge_ratio: long-run ceiling on hedges per call
+            workers: threads shared by first and hedge requests
+        """
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self.max_hedge_ratio = max_hedge_ratio
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._credit = 1.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hedge-{name}")
+
+        requests = REGISTRY.counter("shelby_hedge_requests_total", "Requests sent by hedgers, first attempts and hedges", ["dependency", "kind"])
+        self._primaries = requests.labels(dependency=name, kind="primary")
+        self._hedges = requests.labels(dependency=name, kind="hedge")
+        self._hedge_wins = REGISTRY.counter("shelby_hedge_wins_total", "Calls answered by the hedge rather than the first request", ["dependency"]).labels(dependency=name)
+        REGISTRY.gauge("shelby_hedge_rate", "Hedges sent per call", ["dependency"]).labels(dependency=name).set_function(self.hedge_rate)
+        REGISTRY.gauge("shelby_hedge_delay_seconds", "Current delay before a hedge is sent", ["dependency"]).labels(dependency=name).set_function(
+            lambda: self.delay() or 0.0
+        )
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait for the first request before hedging, None while still learning."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = list(self._latencies)
+        return max(self.min_delay_seconds, float(np.percentile(latencies, self.percentile)))
+
+    def hedge_rate(self) -> float:
+        calls = self._primaries.get()
+        return self._hedges.get() / calls if calls else 0.0
+
+    def _submit(self, fn: Callable[[], Any], record: bool):
+        # Each request gets its own copy of the caller's context (deadline, priority, tracing)
+        context = contextvars.copy_context()
+
+        def run():
+            start = time.monotonic()
+            result = context.run(fn)
+            if record:
+                with self._lock:
+                    self._latencies.append(time.monotonic() - start)
+            return result
+
+        return self._executor.submit(run)
+
+    def _take_credit(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            return True
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run fn, hedging it with a second call if it is slow; returns the first successful result."""
+        delay = self.delay()
+        with self._lock:
+            self._credit = min(10.0, self._credit + self.max_hedge_ratio)
+        self._primaries.inc()
+        primary = self._submit(fn, record=True)
+        if delay is not None:
+            deadline = current_deadline()
+            if deadline is not None:
+                delay = min(delay, deadline.remaining())
+            done, _ = wait([primary], timeout=delay)
+            if not done and (deadline is None or not deadline.expired()) and self._take_credit():
+                self._hedges.inc()
+                set_span_attributes(hedged=True)
+                hedge = self._submit(fn, record=False)
+                pending = {primary, hedge}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.exception() is None:
+                            if future is hedge:
+                                self._hedge_wins.inc()
+                            return future.result()
+                # Both failed; report the first request's error
+        return primary.result()
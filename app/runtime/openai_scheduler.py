@@ -0,0 +1,294 @@
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from enum import IntEnum
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import openai
+import tiktoken
+from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from telemetry import REGISTRY, set_span_attributes
+from runtime.deadline import DeadlineExceeded, current_deadline, stage_timeout
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("openai_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """Run OpenAI calls made in this context (and in agent work it starts) at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Failures worth retrying after a pause; anything else (bad request, auth) fails straight away
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        # Rough English average when no tokenizer is available
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_chat_tokens(model: str, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+    """Prompt tokens plus the completion budget, which is what OpenAI counts against TPM at admission."""
+    # ~4 tokens of chat markup per message plus 3 to prime the reply
+    prompt = sum(4 + count_tokens(str(m.get("content", "")), model) for m in messages) + 3
+    return prompt + (max_tokens or 256)
+
+
+def estimate_embedding_tokens(model: str, input: Any) -> int:
+    texts = [input] if isinstance(input, str) else list(input)
+    return sum(count_tokens(text, model) for text in texts)
+
+
+class TokenBucket:
+
+    """Continuously refilling bucket; callers hold the scheduler lock"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Requests bigger than the bucket are let through once it is full rather than blocking forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self) -> None:
+        # Upstream said we are over quota, whatever our estimate thinks
+        self.tokens = min(self.tokens, 0.0)
+
+
+def split_rate_limits(rate_limits: Dict[str, Dict[str, float]], processes: int) -> Dict[str, Dict[str, float]]:
+    """Each process's share of the quotas when several processes call OpenAI under the same key."""
+    if processes <= 1:
+        return dict(rate_limits)
+    return {model: {name: limit / processes for name, limit in limits.items()} for model, limits in rate_limits.items()}
+
+
+class OpenAIScheduler:
+
+    """Admits OpenAI requests through per-model RPM/TPM token buckets, interactive work first"""
+
+    def __init__(self, rate_limits: Optional[Dict[str, Dict[str, float]]] = None, max_retries: int = 5, max_backoff_seconds: float = 30.0):
+        """
+        Requests for a model queue in (priority, arrival) order and the head is admitted once both its
+        request and token buckets can cover it. Token cost is estimated with tiktoken and corrected
+        with the usage OpenAI reports back. Retryable failures back off with full jitter; a 429 also
+        drains the model's buckets so queued requests wait instead of piling on.
+
+        Args:
+            rate_limits: model -> {"rpm": requests per minute, "tpm": tokens per minute}; unlisted models are not throttled
+            max_retries: attempts per request, including the first
+            max_backoff_seconds: cap for the jittered exponential backoff
+        """
+        self.rate_limits = rate_limits or {}
+        self.max_retries = max_retries
+        self.max_backoff_seconds = max_backoff_seconds
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._waiters: Dict[str, List] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+        self._wait_seconds = REGISTRY.histogram("shelby_openai_wait_seconds", "Time requests spent queued for OpenAI quota", ["model", "priority"])
+        self._requests = REGISTRY.counter("shelby_openai_requests_total", "OpenAI requests by outcome", ["model", "outcome"])
+        self._retries = REGISTRY.counter("shelby_openai_retries_total", "OpenAI request retries", ["model", "error"])
+        self._queue_depth = REGISTRY.gauge("shelby_openai_queue_depth", "Requests waiting for OpenAI quota", ["model", "priority"])
+        self._tokens = REGISTRY.counter("shelby_openai_tokens_total", "Tokens OpenAI reported using", ["model"])
+        self._tokens_used = 0
+
+    def _model_state(self, model: str):
+        if model not in self._waiters:
+            self._waiters[model] = []
+            limits = self.rate_limits.get(model)
+            if limits:
+                self._buckets[model] = {
+                    "rpm": TokenBucket(limits["rpm"]),
+                    "tpm": TokenBucket(limits["tpm"]),
+                }
+            for priority in Priority:
+                self._queue_depth.labels(model=model, priority=priority.name.lower()).set_function(
+                    lambda model=model, priority=priority: self.queue_depth(model, priority)
+                )
+        return self._waiters[model], self._buckets.get(model)
+
+    def queue_depth(self, model: Optional[str] = None, priority: Optional[Priority] = None) -> int:
+        waiters = self._waiters.values() if model is None else [self._waiters.get(model, [])]
+        return sum(1 for queue in waiters for ticket in list(queue) if priority is None or ticket[0] == priority)
+
+    def _admit(self, model: str, tokens: int, priority: Priority) -> float:
+        """
+        Block until the request may be sent; returns the seconds spent waiting
+
+        Raises: DeadlineExceeded if the query's deadline passes while queued
+        """
+        start = time.monotonic()
+        deadline = current_deadline()
+        with self._condition:
+            waiters, buckets = self._model_state(model)
+            if buckets is None:
+                return 0.0
+            ticket = (int(priority), next(self._sequence))
+            heapq.heappush(waiters, ticket)
+            try:
+                while True:
+                    remaining = deadline.remaining() if deadline is not None else None
+                    if remaining == 0:
+                        raise DeadlineExceeded(f"query deadline passed waiting for {model} quota")
+                    if waiters[0] == ticket:
+                        now = time.monotonic()
+                        wait = max(buckets["rpm"].wait_time(1, now), buckets["tpm"].wait_time(tokens, now))
+                        if wait <= 0:
+                            buckets["rpm"].consume(1)
+                            buckets["tpm"].consume(tokens)
+                            heapq.heappop(waiters)
+                            self._condition.notify_all()
+                            break
+                        self._condition.wait(min(wait, remaining) if remaining is not None else wait)
+                    else:
+                        self._condition.wait(remaining)
+            except BaseException:
+                if ticket in waiters:
+                    waiters.remove(ticket)
+                    heapq.heapify(waiters)
+                    self._condition.notify_all()
+                raise
+        waited = time.monotonic() - start
+        self._wait_seconds.labels(model=model, priority=priority.name.lower()).observe(waited)
+        return waited
+
+    def _settle(self, model: str, estimated: int, actual: Optional[int]) -> None:
+        if actual is None:
+            return
+        with self._condition:
+            buckets = self._buckets.get(model)
+            if buckets is not None and estimated > actual:
+                buckets["tpm"].refund(estimated - actual)
+                self._condition.notify_all()
+
+    def _drain(self, model: str) -> None:
+        with self._condition:
+            buckets = self._buckets.get(model)
+            if buckets is not None:
+                buckets["rpm"].drain()
+                buckets["tpm"].drain()
+
+    def _call(self, create, model: str, tokens: int, priority: Optional[Priority], **kwargs):
+        priority = _priority.get() if priority is None else priority
+        deadline = current_deadline()
+        request_timeout = kwargs.pop("request_timeout", None)
+        waited_total = 0.0
+
+        def before_sleep(retry_state):
+            error = retry_state.outcome.exception()
+            self._retries.labels(model=model, error=type(error).__name__).inc()
+            if isinstance(error, openai.error.RateLimitError):
+                self._drain(model)
+
+        retrying = Retrying(
+            retry=retry_if_exception_type(RETRYABLE_ERRORS),
+            wait=wait_random_exponential(multiplier=1, max=self.max_backoff_seconds),
+            # Give up retrying once the query's deadline has passed
+            stop=stop_after_attempt(self.max_retries) | (lambda retry_state: deadline is not None and deadline.expired()),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+        try:
+            for attempt in retrying:
+                with attempt:
+                    waited_total += self._admit(model, tokens, priority)
+                    # Each attempt gets whatever is left of the query's budget
+                    response = create(model=model, request_timeout=stage_timeout(request_timeout), **kwargs)
+        except Exception:
+            self._requests.labels(model=model, outcome="error").inc()
+            raise
+        self._requests.labels(model=model, outcome="ok").inc()
+        usage = response.get("usage") or {}
+        self._settle(model, tokens, usage.get("total_tokens"))
+        if usage.get("total_tokens"):
+            self._tokens.labels(model=model).inc(usage["total_tokens"])
+            with self._condition:
+                self._tokens_used += usage["total_tokens"]
+        set_span_attributes(openai_wait_seconds=waited_total)
+        return response
+
+    def chat_completion(self, model: str, messages: List[Dict[str, str]], priority: Optional[Priority] = None, **kwargs):
+        """openai.ChatCompletion.create behind the model's quota; priority defaults to the calling context's."""
+        tokens = estimate_chat_tokens(model, messages, kwargs.get("max_tokens"))
+        return self._call(openai.ChatCompletion.create, model, tokens, priority, messages=messages, **kwargs)
+
+    def embedding(self, model: str, input: Any, priority: Optional[Priority] = None, **kwargs):
+        """openai.Embedding.create behind the model's quota; priority defaults to the calling context's."""
+        tokens = estimate_embedding_tokens(model, input)
+        return self._call(openai.Embedding.create, model, tokens, priority, input=input, **kwargs)
+
+    def tokens_used(self) -> int:
+        """Tokens OpenAI has reported for every request made through this scheduler, all models together."""
+        return self._tokens_used
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth per model and priority plus the current bucket levels."""
+        with self._condition:
+            now = time.monotonic()
+            result = {}
+            for model, waiters in self._waiters.items():
+                buckets = self._buckets.get(model)
+                if buckets is not None:
+                    for bucket in buckets.values():
+                        bucket._refill(now)
+                result[model] = {
+                    "queued": {p.name.lower(): sum(1 for t in waiters if t[0] == p) for p in Priority},
+                    "rpm_available": buckets["rpm"].tokens if buckets else None,
+                    "tpm_available": buckets["tpm"].tokens if buckets else None,
+                }
+            return result
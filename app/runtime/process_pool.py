@@ -0,0 +1,242 @@
+import os
+import gc
+import signal
+import asyncio
+import itertools
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from telemetry import REGISTRY
+from runtime.single_flight import SingleFlight, normalize_query
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def resolve_worker_count(setting: Union[str, int]) -> int:
+    """'auto' is one worker per core this process may run on; otherwise the number itself (0 means no pool)."""
+    if str(setting).strip().lower() == "auto":
+        return available_cores()
+    return max(0, int(setting))
+
+
+class WorkerExited(Exception):
+    pass
+
+
+def _worker_main(agent_factory: Callable[[], Any], conn, index: int, worker_init: Optional[Callable[[int], None]]) -> None:
+    # Ctrl+C goes to the whole process group; let the parent decide when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if worker_init is not None:
+        worker_init(index)
+    agent = agent_factory()
+    asyncio.run(_serve(agent, conn))
+
+
+async def _serve(agent, conn) -> None:
+    loop = asyncio.get_running_loop()
+    closed = asyncio.Event()
+    tasks = set()
+
+    async def handle(request_id, method, kwargs):
+        try:
+            reply = (request_id, True, await getattr(agent, method)(**kwargs))
+        except Exception as e:
+            reply = (request_id, False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Results and exceptions have to pickle; report the ones that don't instead of hanging the caller
+            conn.send((request_id, False, RuntimeError(f"agent worker could not return its result: {e}")))
+
+    def on_readable():
+        try:
+            while conn.poll():
+                request_id, method, kwargs = conn.recv()
+                task = loop.create_task(handle(request_id, method, kwargs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (EOFError, OSError):
+            loop.remove_reader(conn.fileno())
+            closed.set()
+
+    loop.add_reader(conn.fileno(), on_readable)
+    await closed.wait()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.alive = True
+
+
+class AgentProcessPool:
+
+    """Runs queries on forked worker processes, each with its own agent, behind the agent's run_query interface"""
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], Any],
+        workers: int,
+        preload: Optional[Callable[[], None]] = None,
+        worker_init: Optional[Callable[[int], None]] = None,
+        coalesce: bool = True,
+        name: str = "agents",
+    ):
+        """
+        preload runs in this process before the workers are forked, so read-only assets it loads
+        (indexes, tokenizer tables, spec files) are shared copy-on-write by every worker instead of
+        loaded once per worker. Objects alive at fork time are moved out of the garbage collector's
+        reach (gc.freeze) so collections in the workers don't touch, and thereby copy, those pages.
+        Each worker runs its own event loop and takes any number of queries at once; a query goes to
+        the worker with the fewest in flight. Start the pool before any threads are started.
+
+        Args:
+            agent_factory: builds the agent in each worker (called after the fork)
+            workers: worker processes to fork
+            preload: loads shared read-only assets in the parent before forking
+            worker_init: called in each worker with its index before the agent is built
+            coalesce: share one run between concurrent identical queries across all workers
+            name: label for the exported metrics
+        """
+        self.agent_factory = agent_factory
+        self.workers = workers
+        self.preload = preload
+        self.worker_init = worker_init
+        self.name = name
+        self._workers: List[_Worker] = []
+        self._ids = itertools.count()
+        self._attached = False
+        self._flight = SingleFlight(f"{name}_pool") if coalesce else None
+
+        REGISTRY.gauge("shelby_agent_workers", "Agent worker processes still running", ["pool"]).labels(pool=name).set_function(
+            lambda: sum(1 for worker in self._workers if worker.alive)
+        )
+        REGISTRY.gauge("shelby_agent_worker_inflight", "Queries in flight on agent workers", ["pool"]).labels(pool=name).set_function(
+            lambda: sum(len(worker.pending) for worker in self._workers)
+        )
+
+    def start(self) -> "AgentProcessPool":
+        if self._workers:
+            return self
+        if self.preload is not None:
+            self.preload()
+        gc.collect()
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+        for index in range(self.workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(self.agent_factory, child_conn, index, self.worker_init),
+                name=f"{self.name}-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_Worker(process, parent_conn))
+        return self
+
+    def _attach(self) -> None:
+        # Replies are read on the event loop that sends the queries, which only exists after start()
+        if self._attached:
+            return
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            loop.add_reader(worker.conn.fileno(), self._on_readable, worker)
+        self._attached = True
+
+    def _on_readable(self, worker: _Worker) -> None:
+        try:
+            while worker.conn.poll():
+                request_id, ok, value = worker.conn.recv()
+                future = worker.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        except (EOFError, OSError):
+            self._lost(worker)
+
+    def _lost(self, worker: _Worker) -> None:
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.alive = False
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(WorkerExited(f"agent worker {worker.process.name} exited (code {worker.process.exitcode})"))
+        worker.pending.clear()
+
+    def _alive(self) -> List[_Worker]:
+        alive = [worker for worker in self._workers if worker.alive]
+        if not alive:
+            raise WorkerExited("no agent workers are running")
+        return alive
+
+    async def _dispatch(self, query: str, topic: Optional[str]) -> Any:
+        self._attach()
+        worker = min(self._alive(), key=lambda w: len(w.pending))
+        return await self._call(worker, "run_query", {"query": query, "topic": topic})
+
+    async def _call(self, worker: _Worker, method: str, kwargs: Dict[str, Any]) -> Any:
+        # Runs an async method of the worker's agent
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        try:
+            worker.conn.send((request_id, method, kwargs))
+        except OSError:
+            worker.pending.pop(request_id, None)
+            self._lost(worker)
+            raise
+        try:
+            return await future
+        finally:
+            worker.pending.pop(request_id, None)
+
+    async def run_query(self, query: str, topic: Optional[str] = None) -> Any:
+        if self._flight is None:
+            return await self._dispatch(query, topic)
+        return await self._flight.do((normalize_query(query), topic), lambda: self._dispatch(query, topic))
+
+    async def warm_up(self, questions: Optional[List[str]] = None, max_seconds: Optional[float] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Warm every worker's agent at once (see ShelbyAgent.warm_up)
+
+        Each worker has its own caches, so each answers the same questions; the token budget is
+        split evenly between them. Returns the workers' summaries added together.
+        """
+        self._attach()
+        alive = self._alive()
+        kwargs = {"questions": questions, "max_seconds": max_seconds, "max_tokens": max_tokens, "token_share": 1.0 / len(alive)}
+        results = await asyncio.gather(*(self._call(worker, "warm_up", kwargs) for worker in alive), return_exceptions=True)
+        summary: Dict[str, Any] = {"workers": len(alive), "failed_workers": 0}
+        for result in results:
+            if isinstance(result, BaseException):
+                summary["failed_workers"] += 1
+                continue
+            for key, value in result.items():
+                if key == "seconds":
+                    summary[key] = max(summary.get(key, 0.0), value)
+                elif isinstance(value, (int, float)):
+                    summary[key] = summary.get(key, 0) + value
+                elif value is not None:
+                    # Why a worker stopped early
+                    summary[key] = value
+        return summary
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        for worker in self._workers:
+            worker.conn.close()
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers = []
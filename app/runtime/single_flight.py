@@ -0,0 +1,69 @@
+import re
+import copy
+import asyncio
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from telemetry import REGISTRY
+
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, width, whitespace and trailing punctuation differences don't change the answer."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = _whitespace.sub(" ", query).strip()
+    return query.rstrip("?!. ")
+
+
+class SingleFlight:
+
+    """Collapses concurrent calls with the same key onto one in-flight execution"""
+
+    def __init__(self, name: str):
+        """
+        The first caller for a key runs the work; callers arriving while it is in flight await the
+        same result, or the same exception. Waiters get a deep copy so they can't see each other's
+        mutations. Cancelling a waiter never cancels the shared work.
+
+        Args:
+            name: label for the exported counters
+        """
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._calls = REGISTRY.counter("shelby_singleflight_calls_total", "Calls through single-flight groups by role", ["group", "role"])
+        self._leaders = self._calls.labels(group=name, role="leader")
+        self._coalesced = self._calls.labels(group=name, role="coalesced")
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, float]:
+        return {"leaders": self._leaders.get(), "coalesced": self._coalesced.get(), "inflight": self.inflight()}
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self._coalesced.inc()
+            result = await asyncio.shield(future)
+            return copy.deepcopy(result)
+
+        self._leaders.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await work()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so a flight without waiters doesn't log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,82 @@
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from telemetry import REGISTRY, read_traffic
+from runtime.single_flight import normalize_query
+
+
+_ready = REGISTRY.gauge("shelby_ready", "1 once the process has warmed up and is taking queries")
+
+
+def set_ready(ready: bool = True) -> None:
+    """Mark the process ready (or not) for the metrics server's /ready endpoint and the shelby_ready gauge."""
+    _ready.set(1 if ready else 0)
+
+
+def is_ready() -> bool:
+    return _ready.get() == 1
+
+
+def frequent_questions(path: str, limit: int) -> List[str]:
+    """
+    The limit most asked questions in a history file, most frequent first
+
+    Reads a traffic recording (see TrafficRecorder), JSONL with a query, body or title field per
+    line, or plain text with one question per line. Rewordings that normalize_query considers the
+    same count together; the most recent wording is returned.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    counts: Counter = Counter()
+    wording: Dict[str, str] = {}
+    with open(path, "r") as f:
+        is_json = f.readline().lstrip().startswith("{")
+    if is_json:
+        records = list(read_traffic(path))
+        # A recording has a request line per bot message and a query line per agent run; count one kind
+        if any(record.get("kind") == "request" for record in records):
+            records = [record for record in records if record.get("kind") == "request"]
+        questions = [record.get("query") or record.get("body") or record.get("title") for record in records]
+    else:
+        with open(path, "r") as f:
+            questions = [line.strip() for line in f]
+    for question in questions:
+        if not question:
+            continue
+        key = normalize_query(question)
+        counts[key] += 1
+        wording[key] = question
+    return [wording[key] for key, _ in counts.most_common(limit)]
+
+
+class WarmupBudget:
+
+    """Wall time and OpenAI tokens a warm-up may still spend"""
+
+    def __init__(self, max_seconds: float, max_tokens: Optional[int], tokens_used):
+        """
+        Args:
+            max_seconds: wall time from now
+            max_tokens: OpenAI tokens, None for no limit
+            tokens_used: returns the running total of tokens spent (see OpenAIScheduler.tokens_used)
+        """
+        self.expires_at = time.monotonic() + max_seconds
+        self.max_tokens = max_tokens
+        self.tokens_used = tokens_used
+        self._tokens_at_start = tokens_used()
+
+    def remaining_seconds(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def tokens_spent(self) -> int:
+        return self.tokens_used() - self._tokens_at_start
+
+    def exhausted(self) -> Optional[str]:
+        """Why nothing more should be started, or None."""
+        if self.remaining_seconds() <= 0:
+            return "time"
+        if self.max_tokens is not None and self.tokens_spent() >= self.max_tokens:
+            return "tokens"
+        return None
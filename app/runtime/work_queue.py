@@ -0,0 +1,197 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterator, List, Optional
+
+from telemetry import REGISTRY
+
+
+class QueueRejected(Exception):
+    """Base for requests the queue refused to run; str() is safe to show to the user."""
+
+
+class QueueFull(QueueRejected):
+    pass
+
+
+class QueueTimeout(QueueRejected):
+    pass
+
+
+class Job:
+    def __init__(self, queue: "QueryQueue", user_id: Hashable, priority: int, work: Callable[[], Awaitable[Any]]):
+        self.queue = queue
+        self.user_id = user_id
+        self.priority = priority
+        self.work = work
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def position(self) -> int:
+        """1-based place among jobs still waiting, 0 once a worker has picked it up."""
+        return self.queue.position(self)
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class QueryQueue:
+
+    """Bounded queue with a fixed worker pool, per-user round robin and queue-time deadlines"""
+
+    def __init__(self, workers: int = 4, capacity: int = 50, max_wait_seconds: float = 120.0, max_per_user: int = 3, name: str = "queries"):
+        """
+        Lower priority numbers are served first. Within a priority, users take turns: each worker
+        takes the oldest job of the next user in rotation, so one user flooding the channel only
+        delays their own requests. Jobs are shed with QueueFull at submit time when the queue or the
+        user's share is full, and with QueueTimeout if no worker picked them up within max_wait_seconds.
+
+        Args:
+            workers: jobs running at once
+            capacity: jobs allowed to wait
+            max_wait_seconds: longest a job may wait before it is dropped
+            max_per_user: jobs one user may have waiting
+            name: label for the exported metrics
+        """
+        self.workers = workers
+        self.capacity = capacity
+        self.max_wait_seconds = max_wait_seconds
+        self.max_per_user = max_per_user
+        self.name = name
+        # priority -> ring of users (OrderedDict as round-robin order) -> their waiting jobs
+        self._tiers: Dict[int, "OrderedDict[Hashable, Deque[Job]]"] = {}
+        self._waiting = 0
+        self._running = 0
+        self._available: Optional[asyncio.Event] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+        REGISTRY.gauge("shelby_queue_waiting", "Jobs waiting for a worker", ["queue"]).labels(queue=name).set_function(lambda: self._waiting)
+        REGISTRY.gauge("shelby_queue_running", "Jobs being worked on", ["queue"]).labels(queue=name).set_function(lambda: self._running)
+        self._wait_seconds = REGISTRY.histogram("shelby_queue_wait_seconds", "Time jobs waited before a worker picked them up", ["queue"]).labels(queue=name)
+        self._outcomes = REGISTRY.counter("shelby_queue_jobs_total", "Jobs by outcome", ["queue", "outcome"])
+
+    def __len__(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def _start(self) -> None:
+        if self._worker_tasks:
+            return
+        self._available = asyncio.Event()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, user_id: Hashable, work: Callable[[], Awaitable[Any]], priority: int = 0) -> Job:
+        """
+        Queue work for a user; await the returned Job for its result
+
+        Raises: QueueFull when the queue or the user's share of it is full
+        """
+        self._start()
+        if self._waiting >= self.capacity:
+            self._outcomes.labels(queue=self.name, outcome="rejected_full").inc()
+            raise QueueFull("We're handling a lot of questions right now and the queue is full. Please try again in a few minutes.")
+        ring = self._tiers.setdefault(priority, OrderedDict())
+        jobs = ring.get(user_id)
+        if jobs is not None and len(jobs) >= self.max_per_user:
+            self._outcomes.labels(queue=self.name, outcome="rejected_user").inc()
+            raise QueueFull(f"You already have {len(jobs)} questions waiting. Please wait for those to finish before asking more.")
+
+        job = Job(self, user_id, priority, work)
+        if jobs is None:
+            jobs = ring[user_id] = deque()
+        jobs.append(job)
+        self._waiting += 1
+        job.expiry = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._expire, job)
+        self._available.set()
+        return job
+
+    def _remove(self, job: Job) -> None:
+        ring = self._tiers[job.priority]
+        jobs = ring[job.user_id]
+        jobs.remove(job)
+        if not jobs:
+            del ring[job.user_id]
+        self._waiting -= 1
+
+    def _expire(self, job: Job) -> None:
+        if job.started is not None or job.future.done():
+            return
+        self._remove(job)
+        self._outcomes.labels(queue=self.name, outcome="expired").inc()
+        job.future.set_exception(QueueTimeout(
+            f"Sorry, your question waited more than {self.max_wait_seconds:g} seconds in the queue and was dropped. Please ask again in a bit."
+        ))
+
+    def _service_order(self) -> Iterator[Job]:
+        """Waiting jobs in the order workers will take them if nothing else arrives."""
+        for priority in sorted(self._tiers):
+            queues = [list(jobs) for jobs in self._tiers[priority].values()]
+            depth = 0
+            while True:
+                layer = [jobs[depth] for jobs in queues if depth < len(jobs)]
+                if not layer:
+                    break
+                yield from layer
+                depth += 1
+
+    def position(self, job: Job) -> int:
+        if job.started is not None or job.future.done():
+            return 0
+        for place, queued in enumerate(self._service_order(), start=1):
+            if queued is job:
+                return place
+        return 0
+
+    def _next_job(self) -> Optional[Job]:
+        for priority in sorted(self._tiers):
+            ring = self._tiers[priority]
+            if ring:
+                user_id, jobs = next(iter(ring.items()))
+                job = jobs[0]
+                self._remove(job)
+                # The user goes to the back of the rotation
+                if user_id in ring:
+                    ring.move_to_end(user_id)
+                return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._available.clear()
+                await self._available.wait()
+                continue
+            if job.future.done():
+                # The submitter gave up (cancelled) before a worker got to it
+                continue
+            job.started = time.monotonic()
+            job.expiry.cancel()
+            self._wait_seconds.observe(job.started - job.enqueued)
+            self._running += 1
+            try:
+                result = await job.work()
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                self._outcomes.labels(queue=self.name, outcome="error").inc()
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self._outcomes.labels(queue=self.name, outcome="completed").inc()
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._running -= 1
@@ -63,6 +63,10 @@ config['payload']['workload']['spec']['containers']['webserver']['env'] = {
     },
     'SLACK_APP_TOKEN': {
         'value': os.getenv('SLACK_APP_TOKEN')
+    },
+    # The readiness probe reaches /ready from outside the container
+    'METRICS_HOST': {
+        'value': '0.0.0.0'
     }
 }
 
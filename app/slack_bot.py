@@ -9,13 +9,25 @@ from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 
 # imports from bot app
 from logger import setup_logger
-from agents.async_shelby_agent import ShelbyAgent
+from agents.async_shelby_agent import create_query_runner
+from configuration.shelby_agent_config import AppConfig
+from telemetry import start_metrics_server, TrafficRecorder
+from runtime import QueryQueue, QueueRejected, set_ready, is_ready
 #endregion
 
 load_dotenv() 
 
 
 logger = setup_logger('slack_bot', 'slack_bot.log', level=logging.DEBUG)
+# Prometheus metrics endpoint, set METRICS_PORT=0 to disable
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(os.getenv('METRICS_PORT', '9464'))
+
+def serve_worker_metrics(index):
+    # Agent worker processes serve their own metrics on the ports after the bot's
+    if metrics_port:
+        start_metrics_server(metrics_port + 1 + index, metrics_host)
+
 # set from main and call within a function by instantiating with global bot_user_id and then using variable
 bot_user_id = None
 
@@ -25,6 +37,10 @@ message_start = "Relax and vibe while your query is embedded, documents are fetc
 # Initializes your app with your bot token and signing secret
 app = AsyncApp(token=os.environ.get('SLACK_BOT_TOKEN'))
 
+def queue_note(job):
+    position = job.position()
+    return f" You're number {position} in the queue." if position else ""
+
 async def get_random_animal():
     animals_txt_path = os.path.join('data', 'animals.txt')
     with open(animals_txt_path, 'r') as file:
@@ -48,10 +64,24 @@ async def query_command(ack, body):
         await ack()
         random_animal = await get_random_animal()
 
+        if traffic_recorder is not None:
+            traffic_recorder.request('slack', user_id, query)
+        # queue before replying so a full queue is reported instead of a promise to answer
+        try:
+            job = query_queue.submit(user_id, lambda: agent.run_query(query))
+        except QueueRejected as e:
+            await app.client.chat_postMessage(
+                channel=channel, 
+                text=f"<@{user_id}> {e}", 
+                unfurl_links=False,
+                unfurl_media=False
+            )
+            return
+
         # intial reply in channel
         response = await app.client.chat_postMessage(
             channel=channel, 
-            text=(f"{random_animal} <@{user_id}> relax a moment while we fetch your query: `{query}`"), 
+            text=(f"{random_animal} <@{user_id}> relax a moment while we fetch your query: `{query}`" + queue_note(job)), 
             unfurl_links=False,
             unfurl_media=False
         )
@@ -59,7 +89,17 @@ async def query_command(ack, body):
         thread_ts = response['ts']
 
         # run query
-        query_response = await agent.run_query(query)
+        try:
+            query_response = await job
+        except QueueRejected as e:
+            await app.client.chat_postMessage(
+                channel=channel, 
+                text=f"<@{user_id}> {e}", 
+                thread_ts=thread_ts, 
+                unfurl_links=False,
+                unfurl_media=False
+            )
+            return
 
         parsed_output = parse_slack_markdown(query_response)
 
@@ -123,17 +163,41 @@ async def bot_mention(ack, event):
 
         random_animal = await get_random_animal()
 
+        if traffic_recorder is not None:
+            traffic_recorder.request('slack', user_id, query)
+        try:
+            job = query_queue.submit(user_id, lambda: agent.run_query(query))
+        except QueueRejected as e:
+            await app.client.chat_postMessage(
+                channel=channel, 
+                text=f"<@{user_id}> {e}", 
+                thread_ts=thread_ts, 
+                unfurl_links=False,
+                unfurl_media=False
+            )
+            return
+
         # intial reply in thread
         await app.client.chat_postMessage(
             channel=channel, 
-            text=(f"{random_animal} <@{user_id}> relax a moment while we fetch your query: `{query}`"), 
+            text=(f"{random_animal} <@{user_id}> relax a moment while we fetch your query: `{query}`" + queue_note(job)), 
             thread_ts=thread_ts, 
             unfurl_links=False,
             unfurl_media=False
         )
      
         # run query
-        query_response = await agent.run_query(query)
+        try:
+            query_response = await job
+        except QueueRejected as e:
+            await app.client.chat_postMessage(
+                channel=channel, 
+                text=f"<@{user_id}> {e}", 
+                thread_ts=thread_ts, 
+                unfurl_links=False,
+                unfurl_media=False
+            )
+            return
 
         parsed_output = parse_slack_markdown(query_response)
 
@@ -178,6 +242,13 @@ def parse_slack_markdown(answer_obj):
 
 async def main():
     global bot_user_id
+    if metrics_port:
+        start_metrics_server(metrics_port, metrics_host, ready=is_ready)
+        logger.info(f"metrics served on http://{metrics_host}:{metrics_port}/metrics")
+    # Connect to Slack only once the caches are warm, so the first users after a deploy don't pay for cold ones
+    summary = await agent.warm_up()
+    logger.info(f"warmed up: {summary}")
+    set_ready()
     handler = AsyncSocketModeHandler(app, os.environ.get('SLACK_APP_TOKEN'))
     # Use the client attribute to call auth.test
     response = await app.client.auth_test()
@@ -186,6 +257,17 @@ async def main():
     await handler.start_async()
 
 if __name__ == "__main__":
-    agent = ShelbyAgent()
+    agent_config = AppConfig()
+    # Forks agent workers when AGENT_PROCESSES is set, so it runs before any other thread is started
+    agent = create_query_runner(agent_config, worker_init=serve_worker_metrics)
+    # Sits between the handlers and the agent so a flood of mentions can't start unbounded pipelines
+    query_queue = QueryQueue(
+        workers=agent_config.query_workers,
+        capacity=agent_config.query_queue_size,
+        max_wait_seconds=agent_config.query_max_wait_seconds,
+        max_per_user=agent_config.query_max_per_user
+    )
+    # Arrivals for replay_traffic.py, when TRAFFIC_RECORD_PATH is set
+    traffic_recorder = TrafficRecorder(agent_config.traffic_record_path) if agent_config.traffic_record_path else None
     asyncio.run(main())
     
\ No newline at end of file
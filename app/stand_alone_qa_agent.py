@@ -1,18 +1,147 @@
-import asyncio
-import logging
+#region
+# system imports
+import os, json, time, asyncio, logging, argparse
+
+# imports from bot app
 from logger import setup_logger
 from agents.async_shelby_agent import ShelbyAgent
+from configuration.shelby_agent_config import AppConfig
+from telemetry import tracer
+#endregion
 
 logger = setup_logger('qa_agent', 'qa_agent.log', level=logging.DEBUG)
 
-async def run(query):
+# Root span of each batch query; every agent stage span below it carries its query_id
+batch_span = 'batch_query'
+
+
+def parse_args():
+    agent_config = AppConfig()
+    parser = argparse.ArgumentParser(description="Run queries through ShelbyAgent, one or a JSONL batch of them.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('input', nargs='?', help="JSONL file with a query (or body, or title) field per line, and optionally id (or request_id) and topic")
+    source.add_argument('--query', help="answer a single query and print the response")
+    parser.add_argument('--output', help="JSONL file answers are appended to as they finish (defaults to <input>.answers.jsonl)")
+    parser.add_argument('--concurrency', type=int, default=agent_config.query_workers, help="queries in flight at once")
+    parser.add_argument('--topic', help="namespace for queries that don't set one, skipping routing")
+    parser.add_argument('--restart', action='store_true', help="overwrite the output instead of skipping queries already answered in it")
+    return parser.parse_args()
+
+
+def load_batch(path, default_topic=None):
+    # Lines without an id are keyed by line number, so a resumed run matches them up again
+    batch = []
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get('query') or record.get('body') or record.get('title')
+            if not query:
+                continue
+            batch.append({
+                "id": str(record.get('id') or record.get('request_id') or number),
+                "query": query,
+                "topic": record.get('topic') or default_topic,
+            })
+    return batch
+
+
+def answered_ids(path):
+    # Queries that failed are run again; a line cut short by an interrupted run is ignored
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get('error') is None:
+                done.add(result['id'])
+    return done
+
+
+class StageTimings:
+
+    """Tracer listener summing the duration of each agent stage span per batch query"""
+
+    def __init__(self):
+        self._stages = {}
+
+    def start(self, query_id):
+        self._stages[query_id] = {}
+
+    def pop(self, query_id):
+        return self._stages.pop(query_id, {})
+
+    def __call__(self, span):
+        stages = self._stages.get(span.query_id)
+        if stages is not None and span.name != batch_span:
+            stages[span.name] = stages.get(span.name, 0.0) + span.duration
+
+
+async def run_batch(agent, batch, output, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = StageTimings()
+    tracer.add_listener(timings)
+    completed = 0
+
+    async def one(item):
+        nonlocal completed
+        async with semaphore:
+            query_id = f"batch-{item['id']}"
+            timings.start(query_id)
+            result = {**item, "answer": None, "llm": None, "documents": [], "error": None}
+            start = time.perf_counter()
+            try:
+                with tracer.span(batch_span, query_id=query_id):
+                    response = await agent.run_query(item['query'], item['topic'])
+                result.update(answer=response['answer_text'], llm=response['llm'], documents=response['documents'])
+                if response.get('degraded'):
+                    result['degraded'] = True
+            except Exception as e:
+                logger.error("query %s failed: %s", item['id'], e)
+                result['error'] = f"{type(e).__name__}: {e}"
+            result['seconds'] = time.perf_counter() - start
+            # Identical queries coalesced onto one in flight have no stages of their own
+            result['stages'] = timings.pop(query_id)
+        # Written from the event loop thread only, so lines never interleave
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        completed += 1
+        status = result['error'] or f"{result['seconds']:.2f}s"
+        print(f"[{completed}/{len(batch)}] {item['id']}: {status}", flush=True)
+
+    try:
+        await asyncio.gather(*(one(item) for item in batch))
+    finally:
+        tracer.remove_listener(timings)
+
+
+async def main(args):
+    # One agent, and so one set of clients, caches and OpenAI quota, for the whole batch
     agent = ShelbyAgent()
-    response = await agent.run_query(query)
-    print(response)
+    if args.query:
+        response = await agent.run_query(args.query, args.topic)
+        print(response)
+        return
+
+    output_path = args.output or os.path.splitext(args.input)[0] + '.answers.jsonl'
+    batch = load_batch(args.input, args.topic)
+    if not args.restart:
+        done = answered_ids(output_path)
+        if done:
+            print(f"skipping {len(done)} queries already answered in {output_path}")
+        batch = [item for item in batch if item['id'] not in done]
+
+    start = time.perf_counter()
+    with open(output_path, 'w' if args.restart else 'a') as output:
+        await run_batch(agent, batch, output, args.concurrency)
+    print(f"{len(batch)} queries in {time.perf_counter() - start:.1f}s, answers in {output_path}")
 
-# for testing
-# query = "Can you get me information about block 202373690 on solana?"
-query = "Can you tell me about what deepgram does and how speach to text can be used?"
-# query = "can you tell me how to create a curl and javascript fetch request using the tatum api to fetch the latest block on solana using native rpc client on an rpc node?"
 
-asyncio.run(run(query))
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
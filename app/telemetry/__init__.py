@@ -0,0 +1,12 @@
+"""
+# Telemetry
+
+Timing spans for the agent stages, aggregated into histograms and served in the Prometheus text
+format by a small HTTP endpoint that the Slack and Discord bots start next to their event loops.
+TrafficRecorder keeps real requests and what the agent did with them, for replaying later.
+"""
+
+from telemetry.metrics import REGISTRY, MetricsRegistry, Counter, Gauge, Histogram
+from telemetry.tracing import tracer, traced, Span, current_span, current_query_id, set_span_attributes
+from telemetry.metrics_server import start_metrics_server
+from telemetry.traffic import TrafficRecorder, read_traffic, hash_user
@@ -0,0 +1,55 @@
+import threading
+from typing import Callable, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry.metrics import REGISTRY, MetricsRegistry
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY, ready: Optional[Callable[[], bool]] = None) -> ThreadingHTTPServer:
+    """
+    Serve GET /metrics in the Prometheus text format, and GET /ready for readiness probes, from a daemon thread
+
+    Runs outside the bots' event loops so a scrape never competes with message handling.
+
+    Args:
+        port: port to listen on, 0 picks a free one (see server.server_address)
+        host: interface to bind
+        registry: metrics to expose
+        ready: /ready answers 200 while this returns True and 503 otherwise; always 200 if omitted
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/ready":
+                self._ready()
+                return
+            if path not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _ready(self):
+            is_ready = ready is None or ready()
+            body = b"ready\n" if is_ready else b"warming up\n"
+            self.send_response(200 if is_ready else 503)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would otherwise flood stderr
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,134 @@
+import time
+import uuid
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from telemetry.metrics import REGISTRY, MetricsRegistry, TOKEN_BUCKETS, COUNT_BUCKETS
+
+
+# Span attributes aggregated into histograms; everything else only reaches listeners
+TOKEN_ATTRIBUTES = ("tokens", "prompt_tokens", "completion_tokens")
+DOCUMENT_ATTRIBUTE = "documents"
+
+
+class Span:
+    __slots__ = ("name", "query_id", "parent", "attributes", "start", "duration", "status")
+
+    def __init__(self, name: str, query_id: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.query_id = query_id
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "query_id": self.query_id,
+            "parent": self.parent.name if self.parent else None,
+            "duration": self.duration,
+            "status": self.status,
+            **self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def new_query_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_query_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.query_id if span else None
+
+
+def set_span_attributes(**attributes) -> None:
+    """Attach attributes to the innermost open span; a no-op outside of any span."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+class Tracer:
+
+    """Timing spans aggregated into histograms as they close"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        """
+        Closing a span costs two clock reads and a few bucket increments; nothing is formatted until
+        the registry is scraped.
+
+        Args:
+            registry: where stage duration, token and document histograms are kept
+        """
+        self.registry = registry
+        self.listeners: List[Callable[[Span], None]] = []
+        self._durations = registry.histogram("shelby_stage_duration_seconds", "Wall time per agent stage", ["stage"])
+        self._errors = registry.counter("shelby_stage_errors_total", "Agent stages that raised", ["stage"])
+        self._tokens = registry.histogram("shelby_stage_tokens", "Token counts recorded by agent stages", ["stage", "kind"], buckets=TOKEN_BUCKETS)
+        self._documents = registry.histogram("shelby_stage_documents", "Document counts recorded by agent stages", ["stage"], buckets=COUNT_BUCKETS)
+
+    def add_listener(self, listener: Callable[[Span], None]) -> None:
+        """Call listener with every finished span, e.g. to log or record it."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Span], None]) -> None:
+        self.listeners.remove(listener)
+
+    @contextmanager
+    def span(self, name: str, query_id: Optional[str] = None, **attributes):
+        parent = _current_span.get()
+        if query_id is None:
+            query_id = parent.query_id if parent is not None else new_query_id()
+        span = Span(name, query_id, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        self._durations.labels(stage=span.name).observe(span.duration)
+        if span.status == "error":
+            self._errors.labels(stage=span.name).inc()
+        for kind in TOKEN_ATTRIBUTES:
+            value = span.attributes.get(kind)
+            if value is not None:
+                self._tokens.labels(stage=span.name, kind=kind).observe(value)
+        documents = span.attributes.get(DOCUMENT_ATTRIBUTE)
+        if documents is not None:
+            self._documents.labels(stage=span.name).observe(documents)
+        for listener in self.listeners:
+            listener(span)
+
+
+tracer = Tracer()
+
+
+def traced(name: str):
+    """Decorator running the wrapped function inside a span of the module tracer."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
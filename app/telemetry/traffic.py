@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from telemetry.tracing import Span
+
+
+# Root span of one ShelbyAgent.run_query call; everything it runs is recorded with it
+QUERY_SPAN = "run_query"
+# Warm-up replays the history it was given; recording it would make those questions their own history
+WARMUP_SPAN = "warm_up"
+
+
+def _query_root(span: Span) -> Optional[Span]:
+    # The outermost run_query span above span, so a query run inside a caller's span is still recorded
+    root = None
+    while span is not None:
+        if span.name == WARMUP_SPAN:
+            return None
+        if span.name == QUERY_SPAN:
+            root = span
+        span = span.parent
+    return root
+
+
+def hash_user(user_id) -> str:
+    """Stable short stand-in for a user ID, enough to replay per-user queueing without storing who asked."""
+    return hashlib.blake2b(str(user_id).encode(), digest_size=6).hexdigest()
+
+
+class TrafficRecorder:
+
+    """Appends a compact JSON line per request and per agent query to a file, for replaying real traffic"""
+
+    def __init__(self, path: str):
+        """
+        Two kinds of line are written. The bot handlers call request() when a message arrives, which
+        keeps the arrival time, source and a hashed user ID. on_span, added as a tracer listener,
+        gathers the spans under each run_query span and writes one "query" line when it closes: the
+        query, the topic it was routed to, the IDs, scores and sizes of the retrieved documents, the
+        stage timings and every completion's model, latency and token counts. Nothing is kept for
+        spans outside a run_query.
+
+        The file is opened for appending and each line goes out in one write, so bot and agent
+        worker processes can record to the same file.
+
+        Args:
+            path: file to append to, created with its directory if missing
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+        self._spans: Dict[int, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def request(self, source: str, user_id, query: str) -> None:
+        self._write({"kind": "request", "ts": round(time.time(), 3), "source": source, "user": hash_user(user_id), "query": query})
+
+    def on_span(self, span: Span) -> None:
+        root = _query_root(span)
+        if root is None:
+            return
+        if root is span:
+            with self._lock:
+                spans = self._spans.pop(id(span), [])
+            self._write(self._query_record(span, spans))
+        else:
+            with self._lock:
+                self._spans.setdefault(id(root), []).append(span)
+
+    @staticmethod
+    def _query_record(root: Span, spans: List[Span]) -> Dict[str, Any]:
+        stages: Dict[str, float] = {}
+        retrieved: Dict[str, list] = {}
+        completions = []
+        record = {
+            "kind": "query",
+            "ts": round(time.time() - root.duration, 3),
+            "query": root.attributes.get("query"),
+            "topic": None,
+            "topic_given": root.attributes.get("topic_given", False),
+            "status": root.status,
+            "seconds": round(root.duration, 4),
+        }
+        for span in spans:
+            stages[span.name] = round(stages.get(span.name, 0.0) + span.duration, 4)
+            attributes = span.attributes
+            if span.name == "query_thread":
+                record["topic"] = attributes.get("topic")
+            if "matches" in attributes:
+                retrieved.setdefault(str(attributes.get("namespace") or ""), []).extend(attributes["matches"])
+            if attributes.get("prompt_tokens") is not None:
+                # Time spent queued for OpenAI quota isn't the service's latency
+                seconds = span.duration - (attributes.get("openai_wait_seconds") or 0.0)
+                completions.append([span.name, attributes.get("model"), round(seconds, 4), attributes["prompt_tokens"], attributes.get("completion_tokens")])
+            if span.name == "append_meta":
+                record["cited"] = attributes.get("documents", 0)
+        # Coalesced onto an identical query in flight, so nothing of its own ran
+        record["coalesced"] = "query_thread" not in stages
+        record.update(stages=stages, retrieved=retrieved, completions=completions)
+        return record
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_traffic(path: str) -> Iterator[Dict[str, Any]]:
+    """Recorded lines in file order; a line cut short by a crash is skipped."""
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
@@ -0,0 +1,17 @@
+"""
+# Local vectorstore
+
+Stand-ins for pinecone.Index that serve locally mirrored docs. `LocalIndex` is an exact hybrid
+dense+sparse index with Pinecone's dotproduct scoring and metadata filters; `IVFIndex` layers an
+approximate inverted-file search with int8 residual compression on top of it. `RetrievalCache`
+reuses match lists for repeated or reworded queries until the namespace is re-ingested, and
+`ContentStore` keeps document text locally so queries only fetch IDs and scores.
+`NearDuplicateIndex` finds near-identical chunks with MinHash LSH, at ingestion and in results.
+"""
+
+from vectorstore.local_index import LocalIndex, QueryResponse, ScoredVector
+from vectorstore.ivf_index import IVFIndex
+from vectorstore.retrieval_cache import RetrievalCache, VersionStamps
+from vectorstore.content_store import ContentStore
+from vectorstore.near_duplicates import NearDuplicateIndex, dedupe_documents
+from vectorstore.token_counts import TokenCountCache, count_document_tokens, token_metadata, counts_from_metadata, encoding_name
@@ -0,0 +1,141 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from vectorstore.local_index import normalize_namespace
+from vectorstore.token_counts import counts_from_metadata
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS documents (
+    namespace TEXT NOT NULL,
+    id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    title TEXT,
+    url TEXT,
+    doc_type TEXT,
+    token_counts TEXT,
+    PRIMARY KEY (namespace, id)
+) WITHOUT ROWID
+"""
+
+_columns = ("id", "content", "title", "url", "doc_type", "token_counts")
+
+# SQLite caps bound parameters per statement
+_max_ids_per_query = 500
+
+
+class ContentStore:
+
+    """Vector ID -> content, title, url, doc_type and token counts per tokenizer, kept in a local SQLite file"""
+
+    def __init__(self, path: str, readonly: bool = False, mmap_bytes: int = 256 * 1024 * 1024):
+        """
+        Lets retrieval ask the vectorstore for IDs and scores only and read document text locally.
+        Each thread (and each process after a fork) opens its own connection. The file is opened in
+        WAL mode so readers aren't blocked while ingestion writes, and read through SQLite's mmap so
+        worker processes share its pages.
+
+        Args:
+            path: SQLite file, created if missing unless readonly
+            readonly: open without write access
+            mmap_bytes: how much of the file SQLite may memory-map
+        """
+        self.path = path
+        self.readonly = readonly
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        if not readonly:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connection() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(_schema)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            if self.readonly:
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                connection = sqlite3.connect(self.path)
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def put_many(self, namespace, documents: Iterable[Dict[str, Any]]) -> int:
+        """Insert or replace documents; each needs id and content, the other columns are optional."""
+        namespace = normalize_namespace(namespace)
+        rows = [
+            (
+                namespace, doc["id"], doc["content"], doc.get("title"), doc.get("url"), doc.get("doc_type"),
+                json.dumps(doc["token_counts"]) if doc.get("token_counts") else None,
+            )
+            for doc in documents
+        ]
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO documents (namespace, id, content, title, url, doc_type, token_counts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def get_many(self, namespace, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Documents by ID; IDs the store doesn't have are left out."""
+        namespace = normalize_namespace(namespace)
+        connection = self._connection()
+        found: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(ids), _max_ids_per_query):
+            batch = ids[start:start + _max_ids_per_query]
+            placeholders = ",".join("?" * len(batch))
+            cursor = connection.execute(
+                f"SELECT {', '.join(_columns)} FROM documents WHERE namespace = ? AND id IN ({placeholders})",
+                [namespace, *batch],
+            )
+            for row in cursor:
+                document = dict(zip(_columns, row))
+                document["token_counts"] = json.loads(document["token_counts"]) if document["token_counts"] else {}
+                found[row[0]] = document
+        return found
+
+    def delete(self, namespace, ids: List[str]) -> None:
+        namespace = normalize_namespace(namespace)
+        with self._connection() as connection:
+            connection.executemany("DELETE FROM documents WHERE namespace = ? AND id = ?", [(namespace, i) for i in ids])
+
+    def count(self, namespace=None) -> int:
+        if namespace is None:
+            return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return self._connection().execute("SELECT COUNT(*) FROM documents WHERE namespace = ?", (normalize_namespace(namespace),)).fetchone()[0]
+
+    def import_index(self, index, namespaces: Optional[List[str]] = None, count_tokens: Optional[Callable[[str], Dict[str, int]]] = None) -> Dict[str, int]:
+        """
+        Copy document metadata out of a LocalIndex
+
+        Args:
+            index: LocalIndex whose vectors carry content/title/url/doc_type metadata
+            namespaces: namespaces to copy, all by default
+            count_tokens: content -> token counts per tokenizer to store, for documents whose metadata has none
+        """
+        copied = {}
+        for name in namespaces if namespaces is not None else index.namespaces():
+            ns = index.snapshot(name)
+            documents = []
+            for row, vector_id in enumerate(ns.ids[:len(ns.alive)]):
+                if not ns.alive[row]:
+                    continue
+                metadata = ns.metadata[row] or {}
+                if "content" not in metadata:
+                    continue
+                documents.append({
+                    "id": vector_id,
+                    "content": metadata["content"],
+                    "title": metadata.get("title"),
+                    "url": metadata.get("url"),
+                    "doc_type": metadata.get("doc_type"),
+                    "token_counts": counts_from_metadata(metadata) or (count_tokens(metadata["content"]) if count_tokens else None),
+                })
+            copied[name] = self.put_many(name, documents)
+        return copied
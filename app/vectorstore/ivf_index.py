@@ -0,0 +1,312 @@
+import os
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from pinecone_text.sparse import SparseVector
+from vectorstore.local_index import LocalIndex, QueryResponse, normalize_namespace, top_k_rows
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0, max_train: int = 256) -> np.ndarray:
+    """
+    Lloyd's k-means on a sample of at most max_train points per cluster
+
+    Args:
+        vectors: (n, d) float32 matrix
+        n_clusters: number of centroids
+        n_iter: number of assignment/update rounds
+        seed: random seed for sampling and initialization
+        max_train: training points sampled per centroid
+
+    Returns: (n_clusters, d) float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = min(n_clusters, n)
+    train = vectors
+    if n > n_clusters * max_train:
+        train = vectors[np.sort(rng.choice(n, n_clusters * max_train, replace=False))]
+    train = np.asarray(train, dtype=np.float32)
+    centroids = train[rng.choice(train.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_to_centroids(train, centroids)
+        counts = np.bincount(assign, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        # Re-seed empty clusters from random training points
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = train[rng.choice(train.shape[0], len(empty), replace=False)]
+    return centroids
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+    """Nearest centroid (L2) for each row, computed in batches to bound the distance matrix size."""
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    assign = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], batch_size):
+        batch = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        # argmin ||x - c||^2 == argmax 2x.c - ||c||^2
+        assign[start:start + batch_size] = np.argmax(2 * batch @ centroids.T - centroid_norms, axis=1)
+    return assign
+
+
+class _IVFNamespace:
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray, codes: np.ndarray, scales: np.ndarray, version: int):
+        self.centroids = centroids
+        self.assign = assign
+        self.codes = codes
+        self.scales = scales
+        self.version = version
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes + self.assign.nbytes + sum(rows.nbytes for rows in self.lists) + self.centroids.nbytes
+
+
+class IVFIndex:
+
+    """Inverted-file ANN layer over a LocalIndex with int8-quantized residuals and exact re-ranking"""
+
+    def __init__(
+        self,
+        source: LocalIndex,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        rerank_factor: int = 4,
+        kmeans_iters: int = 20,
+        seed: int = 0,
+    ):
+        """
+        Dense vectors are partitioned with k-means; each vector is stored as its centroid id plus an
+        int8 residual with a per-vector scale. A query probes the n_probe closest partitions, scores
+        candidates from the compressed codes plus exact sparse scores, then re-ranks the best
+        top_k * rerank_factor candidates exactly against the full-precision vectors held by source
+        (which can be memory-mapped so they stay on disk until touched).
+
+        Args:
+            source: the exact index holding ids, metadata, sparse values and float32 vectors
+            n_lists: partitions per namespace, defaults to sqrt(vector count)
+            n_probe: partitions scanned per query
+            rerank_factor: candidates re-ranked exactly per requested result
+            kmeans_iters: k-means iterations at build time
+            seed: random seed for k-means
+        """
+        self.source = source
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank_factor = rerank_factor
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self._namespaces: Dict[str, _IVFNamespace] = {}
+        # One retraining per namespace at a time; queries arriving meanwhile wait for it instead of training again
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _build_lock(self, name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._build_locks.setdefault(name, threading.Lock())
+
+    def build(self, namespaces: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Train partitions and quantize residuals for the given namespaces (all by default)
+
+        Returns: build report per namespace with vector count, partitions, build seconds and memory per vector
+        """
+        report = {}
+        for name in namespaces if namespaces is not None else self.source.namespaces():
+            start = time.perf_counter()
+            with self._build_lock(normalize_namespace(name)):
+                self._build_namespace(name)
+            ivf = self._namespaces.get(normalize_namespace(name))
+            report[name] = {
+                "vectors": 0 if ivf is None else len(ivf.assign),
+                "n_lists": 0 if ivf is None else len(ivf.centroids),
+                "build_seconds": time.perf_counter() - start,
+                **self.memory_per_vector(name),
+            }
+        return report
+
+    def _build_namespace(self, namespace) -> None:
+        name = normalize_namespace(namespace)
+        ns = self.source.snapshot(name)
+        if ns is None or not len(ns.alive):
+            self._namespaces.pop(name, None)
+            return
+        n = len(ns.alive)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        centroids = kmeans(ns.dense, n_lists, n_iter=self.kmeans_iters, seed=self.seed)
+        assign = assign_to_centroids(ns.dense, centroids)
+        residuals = np.asarray(ns.dense, dtype=np.float32) - centroids[assign]
+        scales = np.abs(residuals).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(residuals / scales[:, None]), -127, 127).astype(np.int8)
+        self._namespaces[name] = _IVFNamespace(centroids, assign, codes, scales.astype(np.float32), ns.version)
+
+    def _ready(self, namespace) -> Optional[_IVFNamespace]:
+        name = normalize_namespace(namespace)
+        ivf = self._namespaces.get(name)
+        # Writes to the source invalidate row numbers, so retrain rather than serve stale candidates
+        if ivf is None or ivf.version != self.source.version(name):
+            with self._build_lock(name):
+                ivf = self._namespaces.get(name)
+                if ivf is None or ivf.version != self.source.version(name):
+                    self._build_namespace(name)
+                    ivf = self._namespaces.get(name)
+        return ivf
+
+    def memory_per_vector(self, namespace) -> Dict[str, float]:
+        """Bytes per vector held in memory by the ANN structures versus a float32 copy."""
+        ivf = self._namespaces.get(normalize_namespace(namespace))
+        if ivf is None or not len(ivf.assign):
+            return {"float32_bytes_per_vector": 0.0, "ivf_bytes_per_vector": 0.0, "compression_ratio": 0.0}
+        float_bytes = ivf.codes.shape[1] * 4
+        ivf_bytes = ivf.nbytes() / len(ivf.assign)
+        return {
+            "float32_bytes_per_vector": float(float_bytes),
+            "ivf_bytes_per_vector": float(ivf_bytes),
+            "compression_ratio": float(float_bytes / ivf_bytes),
+        }
+
+    def version(self, namespace) -> int:
+        return self.source.version(namespace)
+
+    def query(
+        self,
+        top_k: int = 10,
+        vector: Optional[List[float]] = None,
+        sparse_vector: Optional[SparseVector] = None,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        n_probe: Optional[int] = None,
+        **kwargs,
+    ) -> QueryResponse:
+        """Approximate top_k search with the same keyword arguments and scoring as LocalIndex.query."""
+        if vector is None:
+            # Nothing to approximate for sparse-only queries
+            return self.source.query(top_k, vector, sparse_vector, namespace, filter, include_metadata, include_values)
+        ivf = self._ready(namespace)
+        ns = self.source.snapshot(namespace)
+        if ns is None or ivf is None:
+            return QueryResponse([], normalize_namespace(namespace))
+        if ivf.version != ns.version:
+            # Written to since retraining began; the partitions don't cover these rows, so search them exactly
+            return self.source.query(top_k, vector, sparse_vector, namespace, filter, include_metadata, include_values)
+
+        q = np.asarray(vector, dtype=np.float32)
+        mask = ns.filter_mask(filter)
+        sparse = ns.sparse_scores(sparse_vector)
+
+        centroid_scores = ivf.centroids @ q
+        n_probe = min(n_probe or self.n_probe, len(ivf.centroids))
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        candidates = np.concatenate([ivf.lists[c] for c in probed])
+        # Strong keyword matches can live in unprobed partitions, keep them to preserve hybrid recall
+        n_rerank = max(top_k * self.rerank_factor, top_k)
+        sparse_hits = top_k_rows(sparse, mask & (sparse > 0), n_rerank)
+        candidates = np.union1d(candidates, sparse_hits)
+        candidates = candidates[mask[candidates]]
+        if len(candidates) == 0:
+            return QueryResponse([], normalize_namespace(namespace))
+
+        approx = (
+            centroid_scores[ivf.assign[candidates]]
+            + ivf.scales[candidates] * (ivf.codes[candidates].astype(np.float32) @ q)
+            + sparse[candidates]
+        )
+        if len(candidates) > n_rerank:
+            keep = np.argpartition(-approx, n_rerank - 1)[:n_rerank]
+            candidates = candidates[keep]
+
+        exact = ns.dense_scores(q, candidates) + sparse[candidates]
+        order = np.argsort(-exact, kind="stable")[:top_k]
+        return LocalIndex._response(ns, candidates[order], exact[order], namespace, include_metadata, include_values)
+
+    def save(self, path: str) -> None:
+        """Store trained partitions and codes next to a saved LocalIndex, one .npz per namespace."""
+        os.makedirs(path, exist_ok=True)
+        for i, (name, ivf) in enumerate(self._namespaces.items()):
+            np.savez(
+                os.path.join(path, f"ivf_{i}.npz"),
+                namespace=np.array(name),
+                centroids=ivf.centroids,
+                assign=ivf.assign,
+                codes=ivf.codes,
+                scales=ivf.scales,
+            )
+
+    def load(self, path: str) -> "IVFIndex":
+        """Load partitions written by save. Namespaces whose source changed since are retrained on first query."""
+        for entry in sorted(os.listdir(path)):
+            if entry.startswith("ivf_") and entry.endswith(".npz"):
+                data = np.load(os.path.join(path, entry))
+                name = str(data["namespace"])
+                ns = self.source.namespace(name)
+                if ns is None or len(ns.ids) != len(data["assign"]):
+                    continue
+                self._namespaces[name] = _IVFNamespace(
+                    data["centroids"], data["assign"], data["codes"], data["scales"], self.source.version(name)
+                )
+        return self
+
+    def evaluate(
+        self,
+        queries: List[Dict[str, Any]],
+        top_k: int = 10,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Compare against exact search on a query set
+
+        Args:
+            queries: dicts with "vector" and optional "sparse_vector"
+            top_k: results per query
+            namespace: namespace to query
+            filter: metadata filter applied to both searches
+            workers: thread count for the multi-core QPS run, defaults to os.cpu_count()
+
+        Returns: recall@k against exact search, memory per vector, and single versus multi-threaded QPS for both searches
+        """
+        workers = workers or os.cpu_count() or 1
+        self._ready(namespace)
+
+        def run(index, q):
+            return index.query(top_k=top_k, namespace=namespace, filter=filter, **q)
+
+        recalls = []
+        for q in queries:
+            exact_ids = {m.id for m in run(self.source, q).matches}
+            if exact_ids:
+                ann_ids = {m.id for m in run(self, q).matches}
+                recalls.append(len(exact_ids & ann_ids) / len(exact_ids))
+
+        def qps(index, n_workers):
+            start = time.perf_counter()
+            if n_workers == 1:
+                for q in queries:
+                    run(index, q)
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    list(executor.map(lambda q: run(index, q), queries))
+            return len(queries) / (time.perf_counter() - start)
+
+        return {
+            f"recall@{top_k}": float(np.mean(recalls)) if recalls else 0.0,
+            "queries": len(queries),
+            "workers": workers,
+            **self.memory_per_vector(namespace),
+            "exact_qps_single": qps(self.source, 1),
+            "exact_qps_multi": qps(self.source, workers),
+            "ivf_qps_single": qps(self, 1),
+            "ivf_qps_multi": qps(self, workers),
+        }
@@ -0,0 +1,375 @@
+import os
+import copy
+import json
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pinecone_text.sparse import SparseVector
+
+
+@dataclass
+class ScoredVector:
+    id: str
+    score: float
+    metadata: Optional[Dict[str, Any]] = None
+    values: Optional[List[float]] = None
+
+
+@dataclass
+class QueryResponse:
+    matches: List[ScoredVector] = field(default_factory=list)
+    namespace: str = ""
+
+
+def normalize_namespace(namespace) -> str:
+    """Pinecone treats a falsy namespace (the router returns 0 when unsure) as the default namespace."""
+    return str(namespace) if namespace else ""
+
+
+class _Namespace:
+    """Column-oriented storage for one namespace plus the lazily built structures used for scoring."""
+
+    def __init__(self, dimension: Optional[int] = None):
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.dense = np.zeros((0, dimension or 0), dtype=np.float32)
+        self.sparse: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.version = 0
+        self._pending: List[np.ndarray] = []
+        self._postings: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        # Queries build the lazy structures on first use, so concurrent queries and writes take turns doing it
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return int(self.alive.sum()) + len(self._pending)
+
+    def upsert(self, vector_id: str, values: List[float], sparse_values: Optional[SparseVector], metadata: Optional[Dict[str, Any]]) -> None:
+        values = np.asarray(values, dtype=np.float32)
+        with self.lock:
+            self._upsert(vector_id, values, sparse_values, metadata)
+
+    def _upsert(self, vector_id: str, values: np.ndarray, sparse_values: Optional[SparseVector], metadata: Optional[Dict[str, Any]]) -> None:
+        if self.dimension is None:
+            self.dimension = values.shape[0]
+            self.dense = np.zeros((0, self.dimension), dtype=np.float32)
+        if values.shape[0] != self.dimension:
+            raise ValueError(f"vector {vector_id} has dimension {values.shape[0]}, index expects {self.dimension}")
+        # Updates append a fresh row and retire the old one so existing rows never move
+        if vector_id in self.row_of:
+            self._flush()
+            self.alive[self.row_of[vector_id]] = False
+        self.row_of[vector_id] = len(self.ids)
+        self.ids.append(vector_id)
+        self._pending.append(values)
+        if sparse_values:
+            self.sparse.append((
+                np.asarray(sparse_values["indices"], dtype=np.int64),
+                np.asarray(sparse_values["values"], dtype=np.float32),
+            ))
+        else:
+            self.sparse.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)))
+        self.metadata.append(dict(metadata or {}))
+        self._invalidate()
+
+    def delete(self, vector_id: str) -> bool:
+        with self.lock:
+            row = self.row_of.pop(vector_id, None)
+            if row is None:
+                return False
+            self._flush()
+            self.alive[row] = False
+            self._invalidate()
+            return True
+
+    def _invalidate(self) -> None:
+        self.version += 1
+        self._postings = None
+        self._columns = {}
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        # Concatenation also copies memory-mapped arrays into writable memory
+        self.dense = np.vstack([self.dense, np.stack(self._pending)])
+        self.alive = np.concatenate([self.alive, np.ones(len(self._pending), dtype=bool)])
+        self._pending = []
+
+    def compact(self) -> None:
+        """Drops retired rows. Row numbers change, so anything keyed on rows must be rebuilt."""
+        with self.lock:
+            self._flush()
+            if self.alive.all():
+                return
+            keep = np.flatnonzero(self.alive)
+            self.ids = [self.ids[i] for i in keep]
+            self.dense = self.dense[keep]
+            self.sparse = [self.sparse[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self.alive = np.ones(len(keep), dtype=bool)
+            self.row_of = {vector_id: row for row, vector_id in enumerate(self.ids)}
+            self._invalidate()
+
+    def ready(self) -> None:
+        with self.lock:
+            self._flush()
+            # Compact once retired rows start to dominate scans
+            if len(self.alive) and self.alive.sum() < len(self.alive) / 2:
+                self.compact()
+
+    def postings(self) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """Inverted index of sparse term -> (rows, weights) so sparse scoring only touches matching rows."""
+        postings = self._postings
+        if postings is not None:
+            return postings
+        with self.lock:
+            if self._postings is None:
+                rows_by_term: Dict[int, List[int]] = {}
+                vals_by_term: Dict[int, List[float]] = {}
+                for row, (indices, values) in enumerate(self.sparse):
+                    for term, value in zip(indices.tolist(), values.tolist()):
+                        rows_by_term.setdefault(term, []).append(row)
+                        vals_by_term.setdefault(term, []).append(value)
+                self._postings = {
+                    term: (np.asarray(rows, dtype=np.int64), np.asarray(vals_by_term[term], dtype=np.float32))
+                    for term, rows in rows_by_term.items()
+                }
+            return self._postings
+
+    def column(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is not None:
+            return column
+        with self.lock:
+            if name not in self._columns:
+                self._columns[name] = np.array([md.get(name) for md in self.metadata[:len(self.alive)]], dtype=object)
+            return self._columns[name]
+
+    def snapshot(self) -> "_Namespace":
+        """
+        The namespace as it is now, for scoring without holding the lock. Rows never move except on
+        compaction, which builds new lists and arrays, so the copy shares them and only takes its own
+        live-row mask; rows upserted later are past the end of that mask and are never looked at.
+        """
+        with self.lock:
+            self.ready()
+            self.postings()
+            view = copy.copy(self)
+            view.alive = self.alive.copy()
+            view._columns = dict(self._columns)
+            view.lock = threading.RLock()
+            return view
+
+    def filter_mask(self, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Evaluates the subset of the Pinecone metadata filter language the agents use."""
+        mask = self.alive.copy()
+        for name, condition in (filter or {}).items():
+            column = self.column(name)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                match op:
+                    case "$eq":
+                        mask &= column == operand
+                    case "$ne":
+                        mask &= column != operand
+                    case "$in":
+                        mask &= np.isin(column, list(operand))
+                    case "$nin":
+                        mask &= ~np.isin(column, list(operand))
+                    case _:
+                        raise ValueError(f"Unsupported filter operator: {op}")
+        return mask
+
+    def sparse_scores(self, sparse_vector: Optional[SparseVector]) -> np.ndarray:
+        scores = np.zeros(len(self.alive), dtype=np.float32)
+        if not sparse_vector:
+            return scores
+        postings = self.postings()
+        for term, weight in zip(sparse_vector["indices"], sparse_vector["values"]):
+            hit = postings.get(int(term))
+            if hit is not None:
+                rows, values = hit
+                scores[rows] += weight * values
+        return scores
+
+    def dense_scores(self, vector: Optional[List[float]], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        matrix = self.dense if rows is None else self.dense[rows]
+        if vector is None:
+            return np.zeros(matrix.shape[0], dtype=np.float32)
+        return matrix @ np.asarray(vector, dtype=np.float32)
+
+
+def top_k_rows(scores: np.ndarray, mask: np.ndarray, top_k: int) -> np.ndarray:
+    """Row numbers of the top_k highest scores among rows allowed by mask, best first."""
+    candidates = np.flatnonzero(mask)
+    if len(candidates) == 0 or top_k <= 0:
+        return candidates[:0]
+    candidate_scores = scores[candidates]
+    if len(candidates) > top_k:
+        part = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+        candidates, candidate_scores = candidates[part], candidate_scores[part]
+    return candidates[np.argsort(-candidate_scores, kind="stable")]
+
+
+class LocalIndex:
+
+    """Exact hybrid dense+sparse index that stands in for pinecone.Index on locally mirrored docs"""
+
+    def __init__(self, dimension: Optional[int] = None):
+        """
+        Scores are dotproduct(dense) + dotproduct(sparse), matching a Pinecone dotproduct index
+        queried with both vector and sparse_vector.
+
+        Args:
+            dimension: dense vector dimension, inferred from the first upsert if omitted
+
+        Example:
+
+            ```python
+            index = LocalIndex()
+            index.upsert([{"id": "a", "values": [0.1, 0.9], "metadata": {"doc_type": "soft"}}], namespace="tatum")
+            index.query(vector=[0.2, 0.8], top_k=3, namespace="tatum", filter={"doc_type": {"$eq": "soft"}})
+            ```
+        """
+        self.dimension = dimension
+        self._namespaces: Dict[str, _Namespace] = {}
+
+    def namespace(self, namespace) -> Optional[_Namespace]:
+        ns = self._namespaces.get(normalize_namespace(namespace))
+        if ns is not None:
+            ns.ready()
+        return ns
+
+    def snapshot(self, namespace) -> Optional[_Namespace]:
+        """A namespace's rows as of now, safe to score while other threads write to it."""
+        ns = self._namespaces.get(normalize_namespace(namespace))
+        return ns.snapshot() if ns is not None else None
+
+    def namespaces(self) -> List[str]:
+        return list(self._namespaces.keys())
+
+    def version(self, namespace) -> int:
+        """Monotonic write counter for a namespace, bumped on every upsert or delete."""
+        ns = self._namespaces.get(normalize_namespace(namespace))
+        return ns.version if ns is not None else 0
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> Dict[str, int]:
+        """
+        Insert or replace vectors
+
+        Args:
+            vectors: dicts with "id", "values" and optional "sparse_values" and "metadata" (Pinecone upsert format)
+            namespace: namespace to write to
+        """
+        name = normalize_namespace(namespace)
+        ns = self._namespaces.get(name)
+        if ns is None:
+            ns = self._namespaces[name] = _Namespace(self.dimension)
+        for vector in vectors:
+            ns.upsert(str(vector["id"]), vector["values"], vector.get("sparse_values"), vector.get("metadata"))
+        if self.dimension is None:
+            self.dimension = ns.dimension
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: List[str], namespace: str = "") -> Dict[str, int]:
+        ns = self._namespaces.get(normalize_namespace(namespace))
+        deleted = sum(1 for vector_id in ids if ns is not None and ns.delete(str(vector_id)))
+        return {"deleted_count": deleted}
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        return {
+            "dimension": self.dimension,
+            "namespaces": {name: {"vector_count": len(ns)} for name, ns in self._namespaces.items()},
+            "total_vector_count": sum(len(ns) for ns in self._namespaces.values()),
+        }
+
+    def query(
+        self,
+        top_k: int = 10,
+        vector: Optional[List[float]] = None,
+        sparse_vector: Optional[SparseVector] = None,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        **kwargs,
+    ) -> QueryResponse:
+        """Exact top_k search over every live vector in the namespace (same keyword arguments as pinecone.Index.query)."""
+        ns = self.snapshot(namespace)
+        if ns is None or not len(ns.alive):
+            return QueryResponse([], normalize_namespace(namespace))
+        mask = ns.filter_mask(filter)
+        scores = ns.dense_scores(vector) + ns.sparse_scores(sparse_vector)
+        rows = top_k_rows(scores, mask, top_k)
+        return self._response(ns, rows, scores[rows], namespace, include_metadata, include_values)
+
+    @staticmethod
+    def _response(ns: _Namespace, rows: np.ndarray, scores: np.ndarray, namespace, include_metadata: bool, include_values: bool) -> QueryResponse:
+        matches = [
+            ScoredVector(
+                id=ns.ids[row],
+                score=float(score),
+                metadata=dict(ns.metadata[row]) if include_metadata else None,
+                values=ns.dense[row].tolist() if include_values else None,
+            )
+            for row, score in zip(rows.tolist(), scores.tolist())
+        ]
+        return QueryResponse(matches, normalize_namespace(namespace))
+
+    def save(self, path: str) -> None:
+        """
+        Store the index in a directory: one float32 .npy matrix per namespace plus a JSON sidecar
+        with ids, sparse values and metadata.
+
+        Args:
+            path: directory to write to
+        """
+        os.makedirs(path, exist_ok=True)
+        manifest = {"dimension": self.dimension, "namespaces": {}}
+        for i, (name, ns) in enumerate(self._namespaces.items()):
+            ns.compact()
+            stem = f"ns_{i}"
+            manifest["namespaces"][name] = stem
+            np.save(os.path.join(path, f"{stem}.dense.npy"), np.ascontiguousarray(ns.dense, dtype=np.float32))
+            with open(os.path.join(path, f"{stem}.json"), "w") as f:
+                json.dump({
+                    "ids": ns.ids,
+                    "sparse": [{"indices": idx.tolist(), "values": val.tolist()} for idx, val in ns.sparse],
+                    "metadata": ns.metadata,
+                }, f)
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump(manifest, f)
+
+    @staticmethod
+    def load(path: str, mmap: bool = False) -> "LocalIndex":
+        """
+        Load an index written by save
+
+        Args:
+            path: directory to read from
+            mmap: memory-map the dense matrices read-only instead of reading them into memory
+        """
+        with open(os.path.join(path, "index.json"), "r") as f:
+            manifest = json.load(f)
+        index = LocalIndex(manifest["dimension"])
+        for name, stem in manifest["namespaces"].items():
+            ns = _Namespace(manifest["dimension"])
+            ns.dense = np.load(os.path.join(path, f"{stem}.dense.npy"), mmap_mode="r" if mmap else None)
+            with open(os.path.join(path, f"{stem}.json"), "r") as f:
+                sidecar = json.load(f)
+            ns.ids = sidecar["ids"]
+            ns.row_of = {vector_id: row for row, vector_id in enumerate(ns.ids)}
+            ns.sparse = [
+                (np.asarray(s["indices"], dtype=np.int64), np.asarray(s["values"], dtype=np.float32))
+                for s in sidecar["sparse"]
+            ]
+            ns.metadata = sidecar["metadata"]
+            ns.alive = np.ones(len(ns.ids), dtype=bool)
+            index._namespaces[name] = ns
+        return index
@@ -0,0 +1,115 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import mmh3
+import numpy as np
+
+
+_word = re.compile(r"\w+")
+
+# Hash permutations are (a * x + b) mod a Mersenne prime over 32-bit shingle hashes, so nothing overflows 64 bits
+_prime = np.uint64((1 << 61) - 1)
+_max_hash = np.uint64((1 << 32) - 1)
+
+
+@lru_cache(maxsize=None)
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Bands and rows per band for MinHash LSH
+
+    Picks the split of num_perm hash values that minimises the chance of missing a pair at or above
+    threshold plus the chance of proposing a pair below it, each integrated over similarity.
+    """
+    similarity = np.linspace(0.0, 1.0, 201)
+    below = similarity < threshold
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            candidate = 1.0 - (1.0 - similarity ** rows) ** bands
+            error = np.trapz(np.where(below, candidate, 0.0), similarity) + np.trapz(np.where(below, 0.0, 1.0 - candidate), similarity)
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateIndex:
+
+    """MinHash LSH over word shingles: finds an earlier text whose estimated Jaccard similarity reaches a threshold"""
+
+    def __init__(self, threshold: float = 0.9, shingle_size: int = 5, num_perm: int = 128, seed: int = 1):
+        """
+        Texts are lower-cased, split into words and shingled into overlapping runs of shingle_size
+        words, each hashed with mmh3. A text's signature keeps the minimum of num_perm hash
+        permutations over its shingles; the share of equal positions in two signatures estimates the
+        Jaccard similarity of their shingle sets. Signatures are split into bands and only texts
+        sharing a band are compared, so a lookup doesn't scan everything added before.
+
+        Args:
+            threshold: estimated Jaccard similarity at which two texts are near-duplicates
+            shingle_size: words per shingle; smaller catches looser paraphrases
+            num_perm: hash permutations per signature; more gives a tighter estimate
+            seed: seed for the permutations
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of text, or None for text without words."""
+        words = _word.findall(text.lower())
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((mmh3.hash(shingle, signed=False) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _prime & _max_hash
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def similarity(self, first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.count_nonzero(first == second)) / self.num_perm
+
+    def add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """
+        Add text under key unless it near-duplicates text added before
+
+        Returns: the key of the earlier text it duplicates (and is not added), or None once added
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+        with self._lock:
+            seen = set()
+            for band, band_key in enumerate(band_keys):
+                for candidate in self._buckets[band].get(band_key, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    if self.similarity(signature, self._signatures[candidate]) >= self.threshold:
+                        return candidate
+            self._signatures[key] = signature
+            for band, band_key in enumerate(band_keys):
+                self._buckets[band].setdefault(band_key, []).append(key)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+def dedupe_documents(documents: List[Dict[str, Any]], threshold: float = 0.9, shingle_size: int = 5) -> List[Dict[str, Any]]:
+    """Drop documents whose content near-duplicates a higher-scoring one; the rest keep their score order."""
+    index = NearDuplicateIndex(threshold, shingle_size)
+    kept = []
+    for doc in sorted(documents, key=lambda d: d['score'], reverse=True):
+        if index.add(len(kept), doc['content']) is None:
+            kept.append(doc)
+    return kept
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from pinecone_text.sparse import SparseVector
+from telemetry import REGISTRY
+from vectorstore.local_index import normalize_namespace
+
+
+class VersionStamps:
+
+    """Per-namespace version stamps kept in a JSON file that ingestion bumps after writing to a namespace"""
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        """
+        The file is re-read when its modification time changes, checked at most every check_interval
+        seconds, so a re-ingestion in another process is picked up without a restart.
+
+        Args:
+            path: JSON file mapping namespace to stamp
+            check_interval: seconds between modification time checks
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._stamps: Dict[str, Any] = {}
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._stamps, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r") as f:
+                    self._stamps = json.load(f)
+                self._mtime = mtime
+            except (OSError, ValueError):
+                # Caught mid-write; keep the old stamps and look again next time
+                pass
+
+    def version(self, namespace) -> Any:
+        with self._lock:
+            self._reload()
+            return self._stamps.get(normalize_namespace(namespace))
+
+    @staticmethod
+    def bump(path: str, namespace) -> str:
+        """Give a namespace a new stamp, dropping every cached retrieval for it. Called by ingestion."""
+        try:
+            with open(path, "r") as f:
+                stamps = json.load(f)
+        except (OSError, ValueError):
+            stamps = {}
+        stamp = f"{time.time():.6f}"
+        stamps[normalize_namespace(namespace)] = stamp
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stamps, f)
+        os.replace(tmp_path, path)
+        return stamp
+
+
+def _entry_size(matches: List[Dict[str, Any]]) -> int:
+    # Strings dominate; the constant covers the dict and float overhead of a match
+    return sum(200 + sum(len(v) for v in match.values() if isinstance(v, str)) for match in matches)
+
+
+class RetrievalCache:
+
+    """LRU cache of vectorstore match lists keyed by namespace, filter, top_k and a locality-sensitive hash of the query"""
+
+    def __init__(
+        self,
+        lsh_bits: int = 16,
+        min_similarity: float = 0.95,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 600.0,
+        seed: int = 0,
+    ):
+        """
+        Dense embeddings are bucketed with random-hyperplane LSH (one sign bit per hyperplane), so
+        rewordings of a question that embed close together share a bucket. The sparse signature is
+        the set of BM25 token indices, which already ignores case, punctuation and stopwords. A hit
+        also requires cosine similarity of at least min_similarity with the embedding the entry was
+        stored for, so a hash collision between unrelated questions is treated as a miss.
+
+        Entries carry the namespace's version stamp at the time of the query and are dropped once it
+        changes, when they are older than ttl_seconds, or when the cache is over max_bytes (least
+        recently used first).
+
+        Args:
+            lsh_bits: hyperplanes; fewer bits means wider buckets and more hits
+            min_similarity: cosine similarity a cached query must have to be reused
+            max_bytes: approximate memory budget for cached matches
+            ttl_seconds: age after which entries are not used
+            seed: seed for the hyperplanes, fixed so keys are stable across restarts and workers
+        """
+        self.min_similarity = min_similarity
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lsh_bits = lsh_bits
+        self.seed = seed
+        self._planes: Optional[np.ndarray] = None
+        # key -> (stored_at, version, unit embedding, matches, size)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, np.ndarray, List[Dict[str, Any]], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._requests = REGISTRY.counter("shelby_retrieval_cache_requests_total", "Retrieval cache lookups by result", ["result"])
+        REGISTRY.gauge("shelby_retrieval_cache_entries", "Cached retrieval results").set_function(lambda: len(self._entries))
+        REGISTRY.gauge("shelby_retrieval_cache_bytes", "Approximate memory held by cached retrieval results").set_function(lambda: self._bytes)
+
+    def _unit(self, dense: List[float]) -> np.ndarray:
+        vector = np.asarray(dense, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def key(self, namespace, doc_type: Optional[str], top_k: int, dense: np.ndarray, sparse: Optional[SparseVector]) -> Hashable:
+        if self._planes is None or self._planes.shape[1] != len(dense):
+            # Sized from the first embedding seen; the seed keeps them identical everywhere
+            self._planes = np.random.default_rng(self.seed).standard_normal((self.lsh_bits, len(dense))).astype(np.float32)
+        bits = np.packbits(self._planes @ dense > 0).tobytes()
+        indices = sorted(sparse["indices"]) if sparse else []
+        signature = hashlib.blake2b(np.asarray(indices, dtype=np.int64).tobytes(), digest_size=8).digest()
+        return normalize_namespace(namespace), doc_type, top_k, bits, signature
+
+    def _evict(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def get(self, namespace, doc_type, top_k, dense, sparse, version) -> Optional[List[Dict[str, Any]]]:
+        """Copies of the cached matches, or None on a miss."""
+        unit = self._unit(dense)
+        key = self.key(namespace, doc_type, top_k, unit, sparse)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._requests.labels(result="miss").inc()
+                return None
+            stored_at, stored_version, stored_unit, matches, _ = entry
+            if stored_version != version or time.monotonic() - stored_at > self.ttl_seconds:
+                self._evict(key)
+                self._requests.labels(result="stale").inc()
+                return None
+            if float(stored_unit @ unit) < self.min_similarity:
+                self._requests.labels(result="collision").inc()
+                return None
+            self._entries.move_to_end(key)
+            self._requests.labels(result="hit").inc()
+            return [dict(match) for match in matches]
+
+    def put(self, namespace, doc_type, top_k, dense, sparse, version, matches: List[Dict[str, Any]]) -> None:
+        unit = self._unit(dense)
+        key = self.key(namespace, doc_type, top_k, unit, sparse)
+        size = _entry_size(matches)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (time.monotonic(), version, unit, [dict(match) for match in matches], size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate(self, namespace=None) -> None:
+        """Drop every entry, or only a namespace's."""
+        with self._lock:
+            for key in list(self._entries):
+                if namespace is None or key[0] == normalize_namespace(namespace):
+                    self._evict(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+import tiktoken
+
+from telemetry import REGISTRY
+from runtime.openai_scheduler import count_tokens
+
+
+# Documents carry one count per tokenizer, e.g. {"cl100k_base": 412}. Pinecone metadata can't hold
+# nested objects, so there each count is a flat field: tokens_cl100k_base.
+TOKEN_FIELD_PREFIX = "tokens_"
+
+
+@lru_cache(maxsize=None)
+def encoding_name(model: str) -> str:
+    """Tokenizer a model uses; counts are keyed by it so models sharing a tokenizer share counts."""
+    try:
+        return tiktoken.encoding_for_model(model).name
+    except Exception:
+        return model
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def count_document_tokens(text: str, models: Iterable[str]) -> Dict[str, int]:
+    """Token counts of text for each model's tokenizer, computed once at ingestion."""
+    counts = {}
+    for model in models:
+        name = encoding_name(model)
+        if name not in counts:
+            counts[name] = count_tokens(text, model)
+    return counts
+
+
+def token_metadata(counts: Dict[str, int]) -> Dict[str, int]:
+    return {f"{TOKEN_FIELD_PREFIX}{name}": count for name, count in counts.items()}
+
+
+def counts_from_metadata(metadata: Dict[str, Any]) -> Dict[str, int]:
+    return {key[len(TOKEN_FIELD_PREFIX):]: int(value) for key, value in metadata.items() if key.startswith(TOKEN_FIELD_PREFIX)}
+
+
+class TokenCountCache:
+
+    """Token counts by content hash and tokenizer for documents stored without precomputed counts"""
+
+    def __init__(self, max_entries: int = 100_000):
+        """
+        Args:
+            max_entries: counts kept, least recently used dropped first
+        """
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._requests = REGISTRY.counter("shelby_token_count_requests_total", "Document token count lookups by source", ["source"])
+
+    def document_tokens(self, document: Dict[str, Any], model: str) -> int:
+        """Tokens in document['content'] for model: the stored count if there is one, else cached or counted."""
+        name = encoding_name(model)
+        stored: Optional[Dict[str, int]] = document.get("token_counts")
+        if stored and name in stored:
+            self._requests.labels(source="stored").inc()
+            return stored[name]
+        key = (content_hash(document["content"]), name)
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+        if tokens is not None:
+            self._requests.labels(source="cache").inc()
+            return tokens
+        self._requests.labels(source="counted").inc()
+        tokens = count_tokens(document["content"], model)
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
@@ -0,0 +1,48 @@
+import time
+
+from runtime import AnswerCache
+
+
+def versions(**current):
+    return lambda namespace: current.get(namespace, 0)
+
+
+def test_hit_returns_a_copy():
+    cache = AnswerCache()
+    cache.put(("how do i mint", None), [("tatum", 1)], {"answer_text": "Use the mint endpoint", "documents": []})
+    answer = cache.get(("how do i mint", None), versions(tatum=1))
+    assert answer == {"answer_text": "Use the mint endpoint", "documents": []}
+    answer["documents"].append({"doc_num": 1})
+    assert cache.get(("how do i mint", None), versions(tatum=1))["documents"] == []
+
+
+def test_miss():
+    assert AnswerCache().get(("never asked", None), versions()) is None
+
+
+def test_stale_when_any_searched_namespace_changes():
+    cache = AnswerCache()
+    cache.put(("q", None), [("tatum", 1), ("deepgram", 4)], {"answer_text": "a"})
+    assert cache.get(("q", None), versions(tatum=1, deepgram=4)) is not None
+    assert cache.get(("q", None), versions(tatum=1, deepgram=5)) is None
+    # Stale entries are dropped
+    assert len(cache) == 0
+
+
+def test_stale_after_ttl(monkeypatch):
+    cache = AnswerCache(ttl_seconds=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put(("q", None), [("tatum", 1)], {"answer_text": "a"})
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get(("q", None), versions(tatum=1)) is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put((key, None), [("tatum", 1)], {"answer_text": key})
+    cache.get(("a", None), versions(tatum=1))
+    cache.put(("c", None), [("tatum", 1)], {"answer_text": "c"})
+    assert cache.get(("b", None), versions(tatum=1)) is None
+    assert cache.get(("a", None), versions(tatum=1))["answer_text"] == "a"
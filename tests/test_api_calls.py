@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from agents.api_calls import InvalidAPICall, OperationValidator
+
+OPERATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data', 'minified_openAPI_specs', 'api.weather.gov', 'operationIDs'
+)
+
+
+def load_validator(name):
+    with open(os.path.join(OPERATIONS, name), 'r') as f:
+        operation = json.load(f)
+    return OperationValidator(operation['metadata']['server_url'], operation['context'])
+
+
+@pytest.fixture(scope="module")
+def station():
+    # /stations/{stationId}
+    return load_validator('default-26.json')
+
+
+@pytest.fixture(scope="module")
+def zones():
+    # /zones/{type}, with an area enum, a boolean include_geometry and limit of at least 1
+    return load_validator('default-47.json')
+
+
+@pytest.mark.parametrize("reply", [
+    "https://api.weather.gov/stations/KNYC",
+    "https://api.weather.gov/zones/forecast?area=CA",
+    "https://api.weather.gov/zones/forecast?area=CA&limit=10",
+])
+def test_accepts_valid_calls(station, zones, reply):
+    validator = station if "/stations/" in reply else zones
+    assert validator.validate(reply) == (reply, [])
+
+
+@pytest.mark.parametrize("reply, url, fixes", [
+    ("Here is the call:\n```\nhttps://api.weather.gov/stations/KNYC\n```", "https://api.weather.gov/stations/KNYC", ["extracted"]),
+    ("`https://api.weather.gov/stations/KNYC`", "https://api.weather.gov/stations/KNYC", ["extracted"]),
+    ("https://API.Weather.gov/stations/KNYC", "https://api.weather.gov/stations/KNYC", ["host_case"]),
+    ("https://api.weather.gov//stations/KNYC/", "https://api.weather.gov/stations/KNYC", ["slashes"]),
+    ("https://api.weather.gov/Stations/KNYC", "https://api.weather.gov/stations/KNYC", ["path_case"]),
+    ("https://api.weather.gov/stations/K NYC", "https://api.weather.gov/stations/K%20NYC", ["encoding"]),
+])
+def test_fixes_station_calls(station, reply, url, fixes):
+    assert station.validate(reply) == (url, fixes)
+
+
+def test_fixes_query_value_case(zones):
+    url, fixes = zones.validate("https://api.weather.gov/zones/forecast?area=CA&include_geometry=True")
+    assert url == "https://api.weather.gov/zones/forecast?area=CA&include_geometry=true"
+    assert fixes == ["value_case"]
+
+
+@pytest.mark.parametrize("reply, error", [
+    ("I could not find a suitable endpoint.", "no URL"),
+    ("https://example.com/stations/KNYC", "must start with https://api.weather.gov"),
+    ("http://api.weather.gov/stations/KNYC", "must start with https://api.weather.gov"),
+    ("https://api.weather.gov/points/KNYC", "path must be /stations/{stationId}"),
+    ("https://api.weather.gov/stations/{stationId}", "stationId was not filled in"),
+    ("Call https://api.weather.gov/stations/K NYC\nto get it", "only the URL"),
+])
+def test_rejects_station_calls(station, reply, error):
+    with pytest.raises(InvalidAPICall, match=error.replace("{", r"\{").replace("}", r"\}")):
+        station.validate(reply)
+
+
+@pytest.mark.parametrize("reply, error", [
+    ("https://api.weather.gov/zones/forecast?area=QQ", "area"),
+    ("https://api.weather.gov/zones/forecast?limit=0", "limit"),
+    ("https://api.weather.gov/zones/forecast?limit=many", "limit"),
+])
+def test_rejects_query_values(zones, reply, error):
+    with pytest.raises(InvalidAPICall, match=error):
+        zones.validate(reply)
+
+
+def test_rejection_lists_every_problem(zones):
+    with pytest.raises(InvalidAPICall) as raised:
+        zones.validate("https://api.weather.gov/zones/{type}?area=QQ&limit=0")
+    message = str(raised.value)
+    assert "type was not filled in" in message
+    assert "area" in message and "limit" in message
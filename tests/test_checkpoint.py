@@ -0,0 +1,70 @@
+import json
+
+from ingestion.checkpoint import Checkpoint
+
+
+def test_advances_past_documents_written_out_of_order(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), "fp", "tatum")
+    checkpoint.add(0, 2)
+    checkpoint.add(1, 1)
+    checkpoint.add(2, 1)
+    checkpoint.written(2)
+    checkpoint.written(1)
+    checkpoint.written(0)
+    # Document 0 still has a chunk in flight, so nothing after it counts as done
+    assert checkpoint.documents_done == 0
+    checkpoint.written(0)
+    assert checkpoint.documents_done == 3
+
+
+def test_stops_at_the_first_unfinished_document(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), "fp", "tatum")
+    for position in range(4):
+        checkpoint.add(position, 1)
+    checkpoint.written(0)
+    checkpoint.written(3)
+    checkpoint.written(1)
+    assert checkpoint.documents_done == 2
+    checkpoint.written(2)
+    assert checkpoint.documents_done == 4
+
+
+def test_chunks_written_before_a_later_document_is_added(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), "fp", "tatum")
+    checkpoint.add(0, 1)
+    checkpoint.written(0)
+    assert checkpoint.documents_done == 1
+    # Documents without chunks are done as soon as they are added
+    checkpoint.add(1, 0)
+    checkpoint.add(2, 1)
+    assert checkpoint.documents_done == 2
+    checkpoint.written(2)
+    assert checkpoint.documents_done == 3
+
+
+def test_resumes_from_saved_progress(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, "fp", "tatum")
+    checkpoint.add(0, 1)
+    checkpoint.add(1, 1)
+    checkpoint.written(1)
+    checkpoint.written(0)
+    checkpoint.save()
+    with open(path, "r") as f:
+        assert json.load(f)["documents_done"] == 2
+
+    resumed = Checkpoint(path, "fp", "tatum")
+    assert resumed.start == 2
+    assert resumed.run_id == checkpoint.run_id
+    resumed.add(2, 1)
+    resumed.written(2)
+    assert resumed.documents_done == 3
+
+
+def test_ignores_progress_for_other_sources_or_namespaces(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, "fp", "tatum")
+    checkpoint.add(0, 0)
+    checkpoint.save()
+    assert Checkpoint(path, "other", "tatum").start == 0
+    assert Checkpoint(path, "fp", "deepgram").start == 0
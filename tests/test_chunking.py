@@ -0,0 +1,40 @@
+from ingestion import chunk_document
+from runtime.openai_scheduler import count_tokens
+
+SENTENCES = [f"Sentence {i} explains how the tatum api mints token {i}." for i in range(40)]
+DOCUMENT = {"id": "guide", "content": " ".join(SENTENCES), "title": "Minting", "url": "https://docs.tatum.io/mint", "doc_type": "soft"}
+
+
+def test_chunks_are_whole_sentences_within_the_size():
+    chunks = chunk_document(DOCUMENT, chunk_tokens=60, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert " ".join(chunk["content"] for chunk in chunks) == DOCUMENT["content"]
+    for chunk in chunks:
+        assert count_tokens(chunk["content"], "gpt-4") <= 60
+        assert chunk["title"] == "Minting" and chunk["url"] == DOCUMENT["url"]
+        assert list(chunk["token_counts"].values())[0] > 0
+
+
+def test_consecutive_chunks_overlap():
+    chunks = chunk_document(DOCUMENT, chunk_tokens=60, overlap_tokens=20)
+    for first, second in zip(chunks, chunks[1:]):
+        last_sentence = first["content"].split(". ")[-1]
+        assert second["content"].startswith(last_sentence.rstrip("."))
+
+
+def test_ids_change_only_with_the_chunk():
+    before = chunk_document(DOCUMENT, chunk_tokens=60, overlap_tokens=0)
+    edited = dict(DOCUMENT, content=DOCUMENT["content"].replace("token 39.", "token thirty-nine."))
+    after = chunk_document(edited, chunk_tokens=60, overlap_tokens=0)
+    assert [chunk["id"] for chunk in before[:-1]] == [chunk["id"] for chunk in after[:-1]]
+    assert before[-1]["id"] != after[-1]["id"]
+    # A new title is new metadata for every chunk, but the text hash embeddings are cached by stays
+    retitled = chunk_document(dict(DOCUMENT, title="Mint NFTs"), chunk_tokens=60, overlap_tokens=0)
+    assert retitled[0]["id"] != before[0]["id"] and retitled[0]["hash"] == before[0]["hash"]
+
+
+def test_long_sentences_are_cut_on_words():
+    document = {"id": "table", "content": " ".join(f"cell{i}" for i in range(300))}
+    chunks = chunk_document(document, chunk_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert " ".join(chunk["content"] for chunk in chunks) == document["content"]
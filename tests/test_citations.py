@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from agents.citations import CitationResolver, cited_numbers
+
+
+def make_documents(count):
+    return [{"doc_num": n, "url": f"https://docs.example.com/{n}", "title": f"Doc {n}"} for n in range(1, count + 1)]
+
+
+def streamed(documents, answer, chunks):
+    resolver = CitationResolver(documents)
+    order = []
+    for chunk in chunks:
+        order += [doc['doc_num'] for doc in resolver.feed(chunk)]
+    order += [doc['doc_num'] for doc in resolver.finish()]
+    return resolver, order
+
+
+def split(answer, cuts):
+    bounds = [0] + sorted(cuts) + [len(answer)]
+    return [answer[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+ANSWERS = [
+    "Mint the token first [10], then list it.",
+    "Streaming works over websockets [1-3] and the REST API.",
+    "Both endpoints need a key [1, 2].",
+    "See Document 4 and (Document 5); ranges like [2 - 3] and lists like [6,8-9] too.",
+    "Nothing is cited here.",
+]
+
+
+@pytest.mark.parametrize("citation, expected", [
+    ("10", [10]),
+    ("1-3", [1, 2, 3]),
+    ("1, 2", [1, 2]),
+    ("3-1", [1, 2, 3]),
+    ("1,3-5", [1, 3, 4, 5]),
+])
+def test_cited_numbers(citation, expected):
+    assert list(cited_numbers(citation)) == expected
+
+
+def test_cited_numbers_limits_ranges():
+    assert list(cited_numbers("1-100000", limit=3)) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("answer, expected", [
+    (ANSWERS[0], [10]),
+    (ANSWERS[1], [1, 2, 3]),
+    (ANSWERS[2], [1, 2]),
+    (ANSWERS[3], [2, 3, 4, 5, 6, 8, 9]),
+    (ANSWERS[4], []),
+])
+def test_resolve(answer, expected):
+    documents = CitationResolver(make_documents(10)).resolve(answer)
+    assert [doc['doc_num'] for doc in documents] == expected
+    assert all(set(doc) == {"doc_num", "url", "title"} for doc in documents)
+
+
+def test_mentions_are_rewritten():
+    resolver = CitationResolver(make_documents(5))
+    resolver.resolve("As Document 4 says, and [Document [5]] agrees.")
+    assert resolver.text == "As [4] says, and [5] agrees."
+
+
+def test_unknown_numbers():
+    resolver = CitationResolver(make_documents(3))
+    documents = resolver.resolve("Only [2] and [7] are cited.")
+    assert [doc['doc_num'] for doc in documents] == [2]
+    assert resolver.unknown == {7}
+
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_feed_matches_resolve_at_every_split(answer):
+    whole = CitationResolver(make_documents(10))
+    expected = whole.resolve(answer)
+    for cut in range(len(answer) + 1):
+        resolver, order = streamed(make_documents(10), answer, split(answer, [cut]))
+        assert resolver.documents() == expected
+        assert resolver.text == whole.text
+        assert order == [doc['doc_num'] for doc in whole.documents(citation_order=True)]
+
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_feed_matches_resolve_in_random_chunks(answer):
+    whole = CitationResolver(make_documents(10))
+    expected = whole.resolve(answer)
+    rng = random.Random(answer)
+    for _ in range(50):
+        cuts = rng.sample(range(len(answer) + 1), rng.randint(1, min(8, len(answer))))
+        resolver, _ = streamed(make_documents(10), answer, split(answer, cuts))
+        assert resolver.documents() == expected
+        assert resolver.text == whole.text
+
+
+def test_feed_returns_documents_as_soon_as_cited():
+    resolver = CitationResolver(make_documents(10))
+    assert resolver.feed("First [") == []
+    assert [doc['doc_num'] for doc in resolver.feed("10] then ")] == [10]
+    assert [doc['doc_num'] for doc in resolver.feed("[1-3] and [10].")] == [1, 2, 3]
+    assert resolver.finish() == []
@@ -0,0 +1,38 @@
+from vectorstore import ContentStore, LocalIndex
+
+
+def test_put_get_and_delete(tmp_path):
+    store = ContentStore(str(tmp_path / "content.sqlite"))
+    store.put_many("tatum", [
+        {"id": "a", "content": "mint an nft", "title": "Mint", "url": "https://docs.tatum.io/mint", "token_counts": {"cl100k_base": 4}},
+        {"id": "b", "content": "get a balance"},
+    ])
+    found = store.get_many("tatum", ["a", "b", "missing"])
+    assert set(found) == {"a", "b"}
+    assert found["a"]["token_counts"] == {"cl100k_base": 4}
+    assert found["b"]["token_counts"] == {} and found["b"]["title"] is None
+    assert store.get_many("deepgram", ["a"]) == {}
+    store.delete("tatum", ["a"])
+    assert store.count("tatum") == 1 and store.count() == 1
+
+
+def test_readonly_store_reads_what_the_writer_stored(tmp_path):
+    path = str(tmp_path / "content.sqlite")
+    ContentStore(path).put_many("tatum", [{"id": "a", "content": "mint an nft"}])
+    assert ContentStore(path, readonly=True).get_many("tatum", ["a"])["a"]["content"] == "mint an nft"
+
+
+def test_import_index_copies_live_documents_with_token_counts(tmp_path):
+    index = LocalIndex()
+    index.upsert([
+        {"id": "a", "values": [1.0, 0.0], "metadata": {"content": "mint an nft", "tokens_cl100k_base": 4}},
+        {"id": "b", "values": [0.0, 1.0], "metadata": {"content": "get a balance"}},
+        {"id": "c", "values": [1.0, 1.0], "metadata": {"content": "deleted"}},
+        {"id": "d", "values": [1.0, 1.0], "metadata": {"title": "no content"}},
+    ], namespace="tatum")
+    index.delete(ids=["c"], namespace="tatum")
+    store = ContentStore(str(tmp_path / "content.sqlite"))
+    assert store.import_index(index, count_tokens=lambda text: {"fallback": len(text.split())}) == {"tatum": 2}
+    found = store.get_many("tatum", ["a", "b", "c", "d"])
+    assert found["a"]["token_counts"] == {"cl100k_base": 4}
+    assert found["b"]["token_counts"] == {"fallback": 3}
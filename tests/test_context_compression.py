@@ -0,0 +1,51 @@
+import nltk
+import pytest
+
+from agents.context_compression import compress_documents, split_sentences
+
+
+def _has_nltk_data():
+    try:
+        nltk.data.find("tokenizers/punkt")
+        nltk.data.find("corpora/stopwords")
+    except LookupError:
+        return False
+    return True
+
+
+# BM25Encoder tokenizes with NLTK's punkt and stopwords data
+needs_nltk_data = pytest.mark.skipif(not _has_nltk_data(), reason="NLTK punkt/stopwords data not installed")
+
+DOCUMENTS = [
+    {"content": "Tatum supports many chains. To mint an NFT call the mint endpoint. The weather was nice.", "tokens": 60, "score": 0.9},
+    {"content": "Billing is monthly. Invoices arrive by email. Minting fees depend on the chain.", "tokens": 60, "score": 0.8},
+]
+
+
+def test_split_sentences_keeps_lists_and_code_together():
+    text = "Install it. Then run `pip install x`.\n\n- first item\n- second item\nv1.2 is current."
+    assert split_sentences(text) == ["Install it.", "Then run `pip install x`.", "- first item", "- second item\nv1.2 is current."]
+
+
+def test_documents_within_budget_are_untouched():
+    documents, stats = compress_documents("mint an nft", DOCUMENTS, 500)
+    assert documents is DOCUMENTS
+    assert stats == {"original_tokens": 120, "compressed_tokens": 120}
+
+
+@needs_nltk_data
+def test_relevant_sentences_are_kept_within_budget():
+    documents, stats = compress_documents("how do I mint an NFT", DOCUMENTS, 60)
+    assert stats["compressed_tokens"] <= 60
+    assert "mint endpoint" in documents[0]["content"]
+    assert "weather" not in documents[0]["content"]
+    assert documents[0]["original_tokens"] == 60
+    # Every document keeps its best sentence so it can still be cited
+    assert documents[1]["content"]
+    assert DOCUMENTS[0]["content"].endswith("The weather was nice.")
+
+
+@needs_nltk_data
+def test_gaps_are_marked():
+    documents, _ = compress_documents("chains", [{"content": "Chains matter. Cats nap. Dogs bark. More chains here.", "tokens": 40}], 26)
+    assert documents[0]["content"] == "Chains matter. ... More chains here."
@@ -0,0 +1,57 @@
+import contextvars
+import threading
+
+import pytest
+
+from runtime.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope, stage_timeout
+from runtime.openai_scheduler import OpenAIScheduler, Priority
+
+
+def test_timeout_is_capped_and_keeps_the_reserve():
+    deadline = Deadline(10)
+    assert deadline.timeout(cap=2) == 2
+    assert 7 < deadline.timeout(reserve=2) <= 8
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(reserve=11)
+
+
+def test_expired_deadline():
+    deadline = Deadline(0)
+    assert deadline.expired()
+    assert deadline.remaining() == 0.0
+
+
+def test_stage_timeout_without_a_deadline_is_the_cap():
+    assert current_deadline() is None
+    assert stage_timeout(5) == 5
+    assert stage_timeout() is None
+
+
+def test_earlier_enclosing_deadline_wins():
+    with deadline_scope(1) as outer:
+        with deadline_scope(60) as inner:
+            assert inner is outer
+            assert stage_timeout(30) <= 1
+        with deadline_scope(0.5) as inner:
+            assert inner is not outer
+    assert current_deadline() is None
+
+
+def test_worker_threads_see_the_deadline_through_a_copied_context():
+    seen = []
+    with deadline_scope(5) as deadline:
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(lambda: seen.append(current_deadline()),))
+        thread.start()
+        thread.join()
+    assert seen == [deadline]
+
+
+def test_queued_openai_request_gives_up_at_the_deadline():
+    scheduler = OpenAIScheduler({'m': {'rpm': 1, 'tpm': 1000000}})
+    # Uses up the bucket; the next request would wait a minute
+    scheduler._admit('m', 1, Priority.INTERACTIVE)
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded):
+            scheduler._admit('m', 1, Priority.INTERACTIVE)
+    assert scheduler.queue_depth('m') == 0
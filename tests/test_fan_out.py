@@ -0,0 +1,37 @@
+import pytest
+
+from agents.async_shelby_agent import weigh_namespace_matches
+
+
+def matches(*scores):
+    return [{"id": f"d{i}", "score": score, "token_counts": {"cl100k_base": 10}} for i, score in enumerate(scores)]
+
+
+def test_scores_are_min_max_normalized_and_weighted():
+    weighed = weigh_namespace_matches(matches(12.0, 8.0, 4.0), "tatum", 0.5)
+    assert [doc["score"] for doc in weighed] == [0.5, 0.25, 0.0]
+    assert [doc["raw_score"] for doc in weighed] == [12.0, 8.0, 4.0]
+    assert {doc["topic"] for doc in weighed} == {"tatum"}
+
+
+def test_namespaces_on_different_scales_become_comparable():
+    # Sparse scores from separately fitted BM25 parameters can differ by an order of magnitude
+    strong = weigh_namespace_matches(matches(40.0, 10.0), "deepgram", 1.0)
+    weak = weigh_namespace_matches(matches(0.9, 0.3), "tatum", 1.0)
+    assert strong[0]["score"] == weak[0]["score"] == 1.0
+
+
+@pytest.mark.parametrize("scores", [(0.7,), (0.7, 0.7)])
+def test_equal_scores_rank_by_weight(scores):
+    assert [doc["score"] for doc in weigh_namespace_matches(matches(*scores), "tatum", 0.8)] == [0.8] * len(scores)
+
+
+def test_cached_matches_are_not_modified():
+    cached = matches(3.0, 1.0)
+    weighed = weigh_namespace_matches(cached, "tatum", 0.5)
+    weighed[0]["token_counts"]["p50k_base"] = 12
+    assert cached == matches(3.0, 1.0)
+
+
+def test_no_matches():
+    assert weigh_namespace_matches([], "tatum", 1.0) == []
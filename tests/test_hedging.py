@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+from runtime import CircuitBreaker, CircuitOpen, Hedger
+
+
+def unique(name):
+    return f"{name}-{uuid.uuid4().hex[:8]}"
+
+
+def learned_hedger(latency=0.01, **kwargs):
+    hedger = Hedger(unique("test"), min_samples=5, **kwargs)
+    for _ in range(5):
+        hedger.call(lambda: time.sleep(latency))
+    return hedger
+
+
+def test_no_hedging_until_enough_samples():
+    hedger = Hedger(unique("test"), min_samples=5)
+    assert hedger.delay() is None
+    assert hedger.call(lambda: "first") == "first"
+    assert hedger.hedge_rate() == 0.0
+
+
+def test_slow_call_is_answered_by_the_hedge():
+    hedger = learned_hedger(max_hedge_ratio=1.0)
+    calls = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        if first:
+            time.sleep(1.0)
+            return "slow"
+        return "hedge"
+
+    start = time.monotonic()
+    assert hedger.call(request) == "hedge"
+    assert time.monotonic() - start < 0.5
+    assert hedger._hedge_wins.get() == 1
+
+
+def test_hedges_are_rationed():
+    hedger = learned_hedger(max_hedge_ratio=0.0)
+    # The starting credit pays for one hedge; after that none are sent
+    hedger.call(lambda: time.sleep(0.1))
+    hedger.call(lambda: time.sleep(0.1))
+    assert hedger._hedges.get() == 1
+
+
+def test_failed_hedge_falls_back_to_the_first_request():
+    hedger = learned_hedger(max_hedge_ratio=1.0)
+    calls = []
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            return "first"
+        raise RuntimeError("hedge failed")
+
+    assert hedger.call(request) == "first"
+
+
+def breaker(**kwargs):
+    return CircuitBreaker(unique("test"), failure_threshold=0.5, window=4, min_calls=4, **kwargs)
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def test_breaker_opens_on_failure_share_and_uses_the_fallback():
+    cb = breaker(reset_seconds=60)
+    for _ in range(2):
+        cb.call(lambda: "ok")
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+    assert cb.state == CircuitBreaker.OPEN
+    assert cb.call(lambda: "ok", fallback=lambda: "fallback") == "fallback"
+    with pytest.raises(CircuitOpen):
+        cb.call(lambda: "ok")
+
+
+def test_breaker_half_opens_after_reset():
+    cb = breaker(reset_seconds=0.05)
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            cb.call(fail)
+    time.sleep(0.06)
+    with pytest.raises(ConnectionError):
+        cb.call(fail)
+    assert cb.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert cb.call(lambda: "ok") == "ok"
+    assert cb.state == CircuitBreaker.CLOSED
+
+
+def test_errors_outside_failure_types_do_not_count():
+    cb = breaker(failure_types=(ConnectionError,))
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            cb.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    assert cb.state == CircuitBreaker.CLOSED
+
@@ -0,0 +1,28 @@
+import json
+
+import ingest
+
+
+class FakeEncoder:
+    fits = 0
+
+    def fit(self, corpus):
+        FakeEncoder.fits += 1
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({}, f)
+
+    def load(self, path):
+        return self
+
+
+def test_on_fit_runs_only_when_parameters_are_fitted(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "BM25Encoder", FakeEncoder)
+    path = str(tmp_path / "bm25_params.json")
+    expired = []
+    ingest.sparse_encoder(path, [{"content": "mint an nft"}], on_fit=lambda: expired.append(path))
+    # A resumed run loads the saved parameters and keeps the manifest
+    ingest.sparse_encoder(path, [{"content": "mint an nft"}], on_fit=lambda: expired.append(path))
+    assert FakeEncoder.fits == 1
+    assert expired == [path]
@@ -0,0 +1,137 @@
+import threading
+
+import numpy as np
+import pytest
+
+from vectorstore import IVFIndex, LocalIndex
+
+
+def make_vectors(count, dimension=16, seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"v{i}",
+            "values": rng.standard_normal(dimension).tolist(),
+            "sparse_values": {"indices": [i % 7, 100 + i % 3], "values": [1.0, 0.5]},
+            "metadata": {"doc_type": "soft" if i % 2 else "hard", "title": f"Doc {i}"},
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def brute_force(vectors, query, sparse, top_k, doc_type=None):
+    scores = {}
+    for vector in vectors:
+        if doc_type and vector["metadata"]["doc_type"] != doc_type:
+            continue
+        score = float(np.dot(vector["values"], query))
+        weights = dict(zip(vector["sparse_values"]["indices"], vector["sparse_values"]["values"]))
+        score += sum(w * weights.get(term, 0.0) for term, w in zip(sparse["indices"], sparse["values"]))
+        scores[vector["id"]] = score
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+
+@pytest.fixture
+def vectors():
+    return make_vectors(300)
+
+
+@pytest.fixture
+def index(vectors):
+    index = LocalIndex()
+    index.upsert(vectors, namespace="tatum")
+    return index
+
+
+def test_exact_hybrid_search(index, vectors):
+    rng = np.random.default_rng(1)
+    sparse = {"indices": [3, 101], "values": [2.0, 1.0]}
+    for _ in range(10):
+        query = rng.standard_normal(16)
+        response = index.query(top_k=5, vector=query.tolist(), sparse_vector=sparse, namespace="tatum", include_metadata=True)
+        assert [m.id for m in response.matches] == brute_force(vectors, query, sparse, 5)
+        assert response.matches[0].metadata["title"] == f"Doc {response.matches[0].id[1:]}"
+
+
+def test_metadata_filter(index, vectors):
+    query = np.ones(16)
+    sparse = {"indices": [1], "values": [1.0]}
+    response = index.query(top_k=10, vector=query.tolist(), sparse_vector=sparse, namespace="tatum",
+                           filter={"doc_type": {"$eq": "hard"}}, include_metadata=True)
+    assert [m.id for m in response.matches] == brute_force(vectors, query, sparse, 10, doc_type="hard")
+
+
+def test_upsert_replaces_and_delete_retires(index):
+    query = np.ones(16)
+    index.upsert([{"id": "v5", "values": (query * 100).tolist(), "metadata": {"doc_type": "soft"}}], namespace="tatum")
+    assert index.query(top_k=1, vector=query.tolist(), namespace="tatum").matches[0].id == "v5"
+    index.delete(["v5"], namespace="tatum")
+    assert "v5" not in {m.id for m in index.query(top_k=300, vector=query.tolist(), namespace="tatum").matches}
+    assert index.describe_index_stats()["total_vector_count"] == 299
+
+
+def test_writes_bump_the_version(index):
+    version = index.version("tatum")
+    index.upsert(make_vectors(1, start=1000), namespace="tatum")
+    assert index.version("tatum") > version
+    assert index.version("other") == 0
+
+
+def test_save_and_load(index, vectors, tmp_path):
+    index.save(str(tmp_path))
+    loaded = LocalIndex.load(str(tmp_path), mmap=True)
+    query = np.ones(16).tolist()
+    assert [m.id for m in loaded.query(top_k=5, vector=query, namespace="tatum").matches] == \
+        [m.id for m in index.query(top_k=5, vector=query, namespace="tatum").matches]
+
+
+def test_ivf_recall(index):
+    ivf = IVFIndex(index, n_lists=16, n_probe=8)
+    rng = np.random.default_rng(2)
+    queries = [{"vector": rng.standard_normal(16).tolist()} for _ in range(20)]
+    report = ivf.evaluate(queries, top_k=5, namespace="tatum", workers=2)
+    assert report["recall@5"] >= 0.9
+
+
+def test_ivf_retrains_after_writes(index):
+    ivf = IVFIndex(index, n_lists=8, n_probe=8)
+    query = np.ones(16)
+    ivf.query(top_k=1, vector=query.tolist(), namespace="tatum")
+    index.upsert([{"id": "new", "values": (query * 100).tolist(), "metadata": {}}], namespace="tatum")
+    assert ivf.query(top_k=1, vector=query.tolist(), namespace="tatum").matches[0].id == "new"
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_queries_while_another_thread_writes(index, approximate):
+    searcher = IVFIndex(index, n_lists=8) if approximate else index
+    errors = []
+    stop = threading.Event()
+
+    def write():
+        for i, vector in enumerate(make_vectors(200, seed=3, start=1000)):
+            if stop.is_set():
+                break
+            index.upsert([vector], namespace="tatum")
+            if i % 5 == 0:
+                index.delete([f"v{i}"], namespace="tatum")
+            stop.wait(0.001)
+
+    def read():
+        rng = np.random.default_rng()
+        for _ in range(30):
+            try:
+                searcher.query(top_k=5, vector=rng.standard_normal(16).tolist(), sparse_vector={"indices": [3], "values": [1.0]},
+                               namespace="tatum", filter={"doc_type": {"$eq": "soft"}}, include_metadata=True)
+            except Exception as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=write)
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    writer.start()
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    stop.set()
+    writer.join()
+    assert errors == []
@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import queue
+import sys
+import uuid
+
+import pytest
+
+import logger as shelby_logger
+from logger import DeferredQueueHandler, JSONLinesFormatter, setup_logger
+
+
+def record(msg, args=(), exc_info=None):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+def test_immutable_arguments_are_formatted_later():
+    prepared = DeferredQueueHandler(queue.SimpleQueue()).prepare(record("%s took %.1fs (%d)", ("routing", 1.25, 3)))
+    assert prepared.args == ("routing", 1.25, 3)
+    assert prepared.getMessage() == "routing took 1.2s (3)"
+
+
+def test_mutable_arguments_are_formatted_on_the_calling_thread():
+    response = {"answer_text": "first"}
+    prepared = DeferredQueueHandler(queue.SimpleQueue()).prepare(record("full response: %s", (response,)))
+    response["answer_text"] = "changed"
+    assert prepared.args is None
+    assert prepared.getMessage() == "full response: {'answer_text': 'first'}"
+
+
+def test_tracebacks_are_rendered_on_the_calling_thread():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        prepared = DeferredQueueHandler(queue.SimpleQueue()).prepare(record("failed", exc_info=sys.exc_info()))
+    assert prepared.exc_info is None
+    assert "ValueError: boom" in prepared.exc_text
+    assert "ValueError: boom" in logging.Formatter().format(prepared)
+    assert "ValueError: boom" in json.loads(JSONLinesFormatter().format(prepared))["exc_info"]
+
+
+def test_json_lines_keep_extra_fields():
+    entry = record("retrieved %d", (4,))
+    entry.namespace = "tatum"
+    line = json.loads(JSONLinesFormatter().format(entry))
+    assert line["message"] == "retrieved 4"
+    assert line["namespace"] == "tatum"
+    assert line["level"] == "INFO"
+
+
+@pytest.mark.parametrize("json_lines", [False, True])
+def test_queued_logger_writes_what_was_logged(json_lines):
+    name = f"test_{uuid.uuid4().hex}"
+    log = setup_logger(name, f"{name}.log", queued=True, json_lines=json_lines)
+    assert setup_logger(name, f"{name}.log") is log
+    documents = [{"title": "a"}]
+    log.info("documents: %s", documents)
+    documents.append({"title": "b"})
+    # Stopping the writer threads flushes the queue
+    shelby_logger._stop_listeners()
+    shelby_logger._start_listeners()
+    path = next(h.baseFilename for h in shelby_logger._file_handlers if h.baseFilename.endswith(f"{name}.log"))
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 1
+        assert "documents: [{'title': 'a'}]" in lines[0]
+    finally:
+        os.remove(path)
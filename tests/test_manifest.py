@@ -0,0 +1,39 @@
+import pytest
+
+from ingestion import Manifest
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return Manifest(str(tmp_path / "manifest.sqlite"))
+
+
+def test_known_chunks_are_skipped_and_stamped(manifest):
+    manifest.record("tatum", ["a", "b"], "run1")
+    assert manifest.mark_known("tatum", ["a", "c"], "run2") == {"a"}
+    # b wasn't produced by run2, so it is stale
+    assert manifest.stale("tatum", "run2") == ["b"]
+    manifest.remove("tatum", ["b"])
+    assert manifest.count("tatum") == 1
+
+
+def test_namespaces_are_separate(manifest):
+    manifest.record("tatum", ["a"], "run1")
+    assert manifest.mark_known("deepgram", ["a"], "run1") == set()
+
+
+def test_expired_chunks_are_written_again_or_deleted(manifest):
+    manifest.record("tatum", ["a", "b"], "run1")
+    manifest.expire("tatum")
+    assert manifest.mark_known("tatum", ["a", "b"], "run2") == set()
+    manifest.record("tatum", ["a"], "run2")
+    assert manifest.mark_known("tatum", ["a"], "run3") == {"a"}
+    assert manifest.stale("tatum", "run3") == ["b"]
+
+
+def test_embeddings_are_cached_by_model_and_hash(manifest):
+    manifest.put_embeddings("ada", {"h1": [0.5, 0.25]})
+    assert manifest.embeddings("ada", ["h1", "h2"]) == {"h1": [0.5, 0.25]}
+    assert manifest.embeddings("other", ["h1"]) == {}
+    manifest.expire("tatum")
+    assert manifest.embeddings("ada", ["h1"]) == {"h1": [0.5, 0.25]}
@@ -0,0 +1,36 @@
+from agents.model_cascade import ModelCascade
+
+
+def cascade():
+    return ModelCascade("small", "large", min_top_score=0.8, max_strong_documents=2, max_query_words=5)
+
+
+def test_one_clear_match_for_a_short_question_is_easy():
+    assert cascade().is_easy("how do I mint", [{"score": 0.9}, {"score": 0.4}])
+
+
+def test_weak_retrieval_long_queries_and_many_strong_matches_are_hard():
+    assert not cascade().is_easy("how do I mint", [{"score": 0.6}])
+    assert not cascade().is_easy("how do I mint an nft on polygon", [{"score": 0.9}])
+    assert not cascade().is_easy("how do I mint", [{"score": 0.9}, {"score": 0.85}, {"score": 0.8}])
+    assert not cascade().is_easy("how do I mint", [])
+
+
+def test_fanned_out_documents_are_judged_on_their_raw_score():
+    assert cascade().is_easy("how do I mint", [{"score": 0.3, "raw_score": 0.9}])
+    assert not cascade().is_easy("how do I mint", [{"score": 1.0, "raw_score": 0.5}])
+
+
+def test_escalation_reasons():
+    assert cascade().escalation_reason({"answer_text": "Call the mint endpoint [1].", "documents": [{}]}) is None
+    assert cascade().escalation_reason({"answer_text": "Call the mint endpoint.", "documents": []}) == "no_citations"
+    answer = {"answer_text": "The documents do not mention polygon [1].", "documents": [{}]}
+    assert cascade().escalation_reason(answer) == "low_confidence"
+
+
+def test_escalation_rate_counts_small_model_answers_only():
+    tiers = cascade()
+    tiers.record("small", 0.1)
+    tiers.record("small", 0.1, escalation="no_citations")
+    tiers.record("large", 0.5)
+    assert tiers.escalation_rate() == 0.5
@@ -0,0 +1,37 @@
+from vectorstore import NearDuplicateIndex, dedupe_documents
+from vectorstore.near_duplicates import lsh_bands
+
+TEXT = " ".join(f"step {i} of the tatum api guide explains how to mint token number {i} on the chain" for i in range(20))
+
+
+def test_lsh_bands_use_at_most_num_perm_hashes():
+    bands, rows = lsh_bands(0.9, 128)
+    assert bands * rows <= 128
+    # A high threshold needs long bands
+    assert rows > lsh_bands(0.5, 128)[1]
+
+
+def test_signature_similarity_estimates_jaccard():
+    index = NearDuplicateIndex()
+    first = index.signature(TEXT)
+    assert index.similarity(first, index.signature(TEXT.upper())) == 1.0
+    assert index.similarity(first, index.signature("an entirely different note about deepgram streaming audio")) < 0.1
+    assert index.signature("  ... ") is None
+
+
+def test_near_duplicate_is_reported_against_the_first_text():
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add("original", TEXT) is None
+    assert index.add("copy", TEXT.replace("step 3 ", "stage 3 ")) == "original"
+    assert index.add("other", "an entirely different note about deepgram streaming audio") is None
+    assert len(index) == 2
+
+
+def test_dedupe_documents_keeps_the_higher_scoring_copy():
+    documents = [
+        {"content": TEXT, "score": 0.5},
+        {"content": TEXT + " thanks", "score": 0.7},
+        {"content": "an entirely different note about deepgram streaming audio", "score": 0.6},
+    ]
+    kept = dedupe_documents(documents, threshold=0.8)
+    assert [doc["score"] for doc in kept] == [0.7, 0.6]
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import openai
+
+from runtime.openai_scheduler import OpenAIScheduler, Priority, TokenBucket, split_rate_limits
+
+LIMITS = {
+    'gpt-4': {'rpm': 200, 'tpm': 40000},
+    'text-embedding-ada-002': {'rpm': 3000, 'tpm': 1000000},
+}
+
+
+def test_split_rate_limits_shares_quota_between_processes():
+    shares = split_rate_limits(LIMITS, 4)
+    assert shares == {
+        'gpt-4': {'rpm': 50, 'tpm': 10000},
+        'text-embedding-ada-002': {'rpm': 750, 'tpm': 250000},
+    }
+    assert LIMITS['gpt-4'] == {'rpm': 200, 'tpm': 40000}
+
+
+def test_split_rate_limits_single_process_keeps_quota():
+    assert split_rate_limits(LIMITS, 1) == LIMITS
+
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    bucket.consume(60)
+    assert bucket.wait_time(1, now) == 1.0
+    assert bucket.wait_time(1, now + 1) == 0.0
+    # Never refills past capacity
+    assert bucket.wait_time(60, now + 600) == 0.0
+    assert bucket.tokens == 60
+
+
+def test_token_bucket_oversized_request_waits_for_a_full_bucket():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(1000, bucket.updated) == 0.0
+    bucket.drain()
+    assert bucket.wait_time(1000, bucket.updated) == 60.0
+
+
+def test_interactive_requests_are_admitted_before_queued_background_ones():
+    scheduler = OpenAIScheduler({'m': {'rpm': 600, 'tpm': 1000000}})
+    scheduler._admit('m', 1, Priority.BACKGROUND)
+    scheduler._drain('m')
+    admitted = []
+
+    def admit(priority):
+        scheduler._admit('m', 1, priority)
+        admitted.append(priority)
+
+    background = threading.Thread(target=admit, args=(Priority.BACKGROUND,))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=admit, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    background.join(2)
+    interactive.join(2)
+    assert admitted == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+def test_reported_usage_refunds_the_token_estimate(monkeypatch):
+    monkeypatch.setattr(openai.ChatCompletion, 'create', lambda **kwargs: {'usage': {'total_tokens': 10}})
+    scheduler = OpenAIScheduler({'m': {'rpm': 60, 'tpm': 10000}})
+    scheduler.chat_completion('m', [{'role': 'user', 'content': 'hello'}], max_tokens=500)
+    stats = scheduler.stats()['m']
+    assert stats['rpm_available'] < 60
+    assert 9990 <= stats['tpm_available'] <= 10000
+    assert scheduler.tokens_used() == 10
+
+
+def test_rate_limit_error_drains_buckets_and_retries(monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise openai.error.RateLimitError('slow down')
+        return {'usage': {'total_tokens': 1}}
+
+    monkeypatch.setattr(openai.ChatCompletion, 'create', create)
+    scheduler = OpenAIScheduler({'m': {'rpm': 6000, 'tpm': 1000000}}, max_backoff_seconds=0.01)
+    scheduler.chat_completion('m', [{'role': 'user', 'content': 'hello'}])
+    assert len(calls) == 2
+    # The retry waited for the drained bucket to refill before going out again
+    assert scheduler.stats()['m']['rpm_available'] < 1
+
+
+def test_unlisted_models_are_not_throttled():
+    scheduler = OpenAIScheduler({})
+    assert scheduler._admit('m', 10 ** 9, Priority.BACKGROUND) == 0.0
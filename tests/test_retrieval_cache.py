@@ -0,0 +1,87 @@
+import os
+import time
+
+import numpy as np
+
+from vectorstore import RetrievalCache, VersionStamps
+
+MATCHES = [{"id": "a", "score": 0.9, "text": "mint an nft"}]
+SPARSE = {"indices": [3, 7], "values": [1.0, 1.0]}
+
+
+def embedding(seed, noise=0.0):
+    rng = np.random.default_rng(seed)
+    vector = rng.standard_normal(64)
+    if noise:
+        vector += noise * np.random.default_rng(seed + 1).standard_normal(64)
+    return vector.tolist()
+
+
+def test_hit_returns_copies():
+    cache = RetrievalCache()
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    hit = cache.get("tatum", None, 5, embedding(0), SPARSE, "v1")
+    assert hit == MATCHES
+    hit[0]["score"] = 0.0
+    assert cache.get("tatum", None, 5, embedding(0), SPARSE, "v1") == MATCHES
+
+
+def test_close_rewording_hits_and_unrelated_query_misses():
+    cache = RetrievalCache(lsh_bits=4, min_similarity=0.95)
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    assert cache.get("tatum", None, 5, embedding(0, noise=0.01), SPARSE, "v1") == MATCHES
+    assert cache.get("tatum", None, 5, embedding(9), SPARSE, "v1") is None
+
+
+def test_key_includes_filter_top_k_and_sparse_terms():
+    cache = RetrievalCache()
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    assert cache.get("tatum", "api", 5, embedding(0), SPARSE, "v1") is None
+    assert cache.get("tatum", None, 10, embedding(0), SPARSE, "v1") is None
+    assert cache.get("tatum", None, 5, embedding(0), {"indices": [3], "values": [1.0]}, "v1") is None
+
+
+def test_new_version_drops_the_entry():
+    cache = RetrievalCache()
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    assert cache.get("tatum", None, 5, embedding(0), SPARSE, "v2") is None
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_not_used():
+    cache = RetrievalCache(ttl_seconds=0.01)
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    time.sleep(0.02)
+    assert cache.get("tatum", None, 5, embedding(0), SPARSE, "v1") is None
+
+
+def test_invalidate_one_namespace():
+    cache = RetrievalCache()
+    cache.put("tatum", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    cache.put("deepgram", None, 5, embedding(0), SPARSE, "v1", MATCHES)
+    cache.invalidate("tatum")
+    assert cache.get("tatum", None, 5, embedding(0), SPARSE, "v1") is None
+    assert cache.get("deepgram", None, 5, embedding(0), SPARSE, "v1") == MATCHES
+
+
+def test_least_recently_used_entries_go_first_when_over_budget():
+    cache = RetrievalCache(max_bytes=500)
+    for seed in range(3):
+        cache.get("tatum", None, 5, embedding(0), SPARSE, "v1")
+        cache.put("tatum", None, 5, embedding(seed), SPARSE, "v1", MATCHES)
+    # Entry 0 was used before each insert, so entry 1 was the least recently used
+    assert len(cache) == 2
+    assert cache.get("tatum", None, 5, embedding(0), SPARSE, "v1") == MATCHES
+    assert cache.get("tatum", None, 5, embedding(1), SPARSE, "v1") is None
+
+
+def test_version_stamps_pick_up_a_bump_from_another_writer(tmp_path):
+    path = str(tmp_path / "versions.json")
+    stamps = VersionStamps(path, check_interval=0)
+    assert stamps.version("tatum") is None
+    stamp = VersionStamps.bump(path, "tatum")
+    assert stamps.version("tatum") == stamp
+    # A new stamp within the file system's mtime resolution still needs a changed mtime
+    os.utime(path, (0, 0))
+    second = VersionStamps.bump(path, "tatum")
+    assert second != stamp and stamps.version("tatum") == second
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from runtime.single_flight import SingleFlight, normalize_query
+
+
+def test_normalize_query_ignores_case_spacing_and_punctuation():
+    assert normalize_query("  How do I  MINT an NFT?? ") == normalize_query("how do i mint an nft")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test-share")
+    calls = []
+
+    async def work():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return {"answer": "42"}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", work) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {"answer": "42"} for result in results)
+    # Waiters get their own copies
+    assert len({id(result) for result in results}) == 5
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "inflight": 0}
+
+
+def test_failures_reach_every_waiter_and_the_next_call_runs_again():
+    flight = SingleFlight("test-fail")
+    calls = []
+
+    async def work():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("q", work), flight.do("q", work), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        with pytest.raises(ValueError):
+            await flight.do("q", work)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_cancelling_a_waiter_leaves_the_shared_work_running():
+    flight = SingleFlight("test-cancel")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flight.do("q", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("q", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        assert await leader == "done"
+        assert waiter.cancelled()
+
+    asyncio.run(main())
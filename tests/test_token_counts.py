@@ -0,0 +1,17 @@
+from vectorstore import TokenCountCache, counts_from_metadata, token_metadata
+from vectorstore.token_counts import encoding_name
+
+
+def test_token_counts_round_trip_through_flat_metadata():
+    counts = {"cl100k_base": 12, "p50k_base": 13}
+    assert token_metadata(counts) == {"tokens_cl100k_base": 12, "tokens_p50k_base": 13}
+    assert counts_from_metadata({"content": "x", **token_metadata(counts)}) == counts
+
+
+def test_token_count_cache_prefers_stored_counts():
+    cache = TokenCountCache(max_entries=1)
+    name = encoding_name("gpt-4")
+    assert cache.document_tokens({"content": "mint an nft", "token_counts": {name: 99}}, "gpt-4") == 99
+    counted = cache.document_tokens({"content": "mint an nft"}, "gpt-4")
+    assert 0 < counted < 10
+    assert cache.document_tokens({"content": "mint an nft"}, "gpt-4") == counted
@@ -0,0 +1,42 @@
+import json
+
+from runtime import WarmupBudget, frequent_questions
+
+
+def test_frequent_questions_from_plain_text(tmp_path):
+    path = tmp_path / "questions.txt"
+    path.write_text("How do I mint?\nwhat is an API key\nhow do i mint\n\nWhat is an API key?\nhow do I mint\nstream audio\n")
+    assert frequent_questions(str(path), 2) == ["how do I mint", "What is an API key?"]
+
+
+def test_frequent_questions_count_requests_in_a_recording(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    lines = [
+        {"kind": "request", "query": "stream audio"},
+        {"kind": "query", "query": "stream audio"},
+        {"kind": "request", "query": "mint an nft"},
+        {"kind": "request", "query": "mint an nft"},
+        {"kind": "query", "query": "mint an nft"},
+    ]
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    assert frequent_questions(str(path), 5) == ["mint an nft", "stream audio"]
+
+
+def test_frequent_questions_missing_file(tmp_path):
+    assert frequent_questions(str(tmp_path / "missing.txt"), 5) == []
+    assert frequent_questions("", 5) == []
+
+
+def test_budget_runs_out_of_tokens():
+    used = [100]
+    budget = WarmupBudget(60, 50, lambda: used[0])
+    assert budget.exhausted() is None
+    used[0] = 149
+    assert budget.tokens_spent() == 49 and budget.exhausted() is None
+    used[0] = 150
+    assert budget.exhausted() == "tokens"
+
+
+def test_budget_runs_out_of_time():
+    budget = WarmupBudget(0, None, lambda: 0)
+    assert budget.exhausted() == "time"
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from runtime.work_queue import QueryQueue, QueueFull, QueueTimeout
+
+
+def test_users_take_turns():
+    served = []
+
+    async def main():
+        queue = QueryQueue(workers=1, capacity=10, max_per_user=5, name="test-turns")
+        gate = asyncio.Event()
+
+        def work(label):
+            async def run():
+                await gate.wait()
+                served.append(label)
+            return run
+
+        jobs = [queue.submit("busy", work(f"busy{i}")) for i in range(3)]
+        jobs.append(queue.submit("quiet", work("quiet")))
+        await asyncio.sleep(0)
+        # The worker holds busy0; quiet is next in the rotation
+        assert [job.position() for job in jobs] == [0, 2, 3, 1]
+        gate.set()
+        await asyncio.gather(*jobs)
+        await queue.stop()
+
+    asyncio.run(main())
+    assert served == ["busy0", "quiet", "busy1", "busy2"]
+
+
+def test_lower_priority_numbers_go_first():
+    served = []
+
+    async def main():
+        queue = QueryQueue(workers=1, name="test-priority")
+        gate = asyncio.Event()
+
+        def work(label):
+            async def run():
+                await gate.wait()
+                served.append(label)
+            return run
+
+        jobs = [queue.submit("a", work("first"))]
+        await asyncio.sleep(0)
+        jobs.append(queue.submit("b", work("background"), priority=1))
+        jobs.append(queue.submit("c", work("interactive")))
+        gate.set()
+        await asyncio.gather(*jobs)
+        await queue.stop()
+
+    asyncio.run(main())
+    assert served == ["first", "interactive", "background"]
+
+
+def test_full_queue_and_user_share_are_rejected():
+    async def main():
+        queue = QueryQueue(workers=1, capacity=3, max_per_user=2, name="test-full")
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+
+        jobs = [queue.submit("a", work)]
+        await asyncio.sleep(0)
+        # One running, two waiting
+        jobs += [queue.submit("a", work), queue.submit("a", work)]
+        with pytest.raises(QueueFull):
+            queue.submit("a", work)
+        jobs.append(queue.submit("b", work))
+        with pytest.raises(QueueFull):
+            queue.submit("c", work)
+        gate.set()
+        await asyncio.gather(*jobs)
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_jobs_waiting_too_long_are_dropped():
+    async def main():
+        queue = QueryQueue(workers=1, max_wait_seconds=0.01, name="test-expire")
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "ok"
+
+        running = queue.submit("a", work)
+        waiting = queue.submit("b", work)
+        with pytest.raises(QueueTimeout):
+            await waiting
+        assert len(queue) == 0
+        gate.set()
+        assert await running == "ok"
+        await queue.stop()
+
+    asyncio.run(main())